@@ -1,51 +1,20 @@
 import os
-import re
-from flask import Flask, request, Response, render_template_string, flash, redirect, url_for
+from flask import Flask, request, Response, flash, redirect, url_for
 import secrets
+from chat_cleaner.metrics import install_metrics, record_messages, record_parse_error, record_unexpected_error # /metrics 服务指标
+from chat_cleaner.static_page import prerender, render_flash_aware # 首页预渲染；有 flash 消息时才动态渲染
+from chat_cleaner.core import clean_text_content # txt 清理逻辑，与监视进程、基准测试共用
+from chat_cleaner.results import install_results # 磁盘上的结果文件零拷贝下载，支持 Range 续传
+from chat_cleaner.timing import install_timing, current_timer # 分阶段计时与性能剖析
 
 app = Flask(__name__)
 
 # --- 配置 (保持不变) ---
 app.secret_key = secrets.token_hex(16)
 app.config['MAX_CONTENT_LENGTH'] = 16 * 1024 * 1024 # 16 Megabytes
-
-# --- 核心清理函数 (保持不变) ---
-def clean_text_content(text_content, remove_timestamp=True):
-    # ... (function logic remains the same) ...
-    image_marker = "[图片] 路径: "
-    video_marker = "[视频] 路径: "
-    timestamp_pattern = r"^\d+\s+"
-    processed_lines = []
-    lines = text_content.splitlines()
-
-    for line in lines:
-        if remove_timestamp:
-            current_line_after_ts = re.sub(timestamp_pattern, '', line)
-        else:
-            current_line_after_ts = line
-
-        img_index = current_line_after_ts.find(image_marker)
-        vid_index = current_line_after_ts.find(video_marker)
-
-        trunc_index = -1
-        if img_index != -1 and vid_index != -1:
-            trunc_index = min(img_index, vid_index)
-        elif img_index != -1:
-            trunc_index = img_index
-        elif vid_index != -1:
-            trunc_index = vid_index
-
-        final_line_content = ""
-        if trunc_index != -1:
-            final_line_content = current_line_after_ts[:trunc_index].rstrip()
-        else:
-            final_line_content = current_line_after_ts.rstrip()
-
-        if final_line_content or line.strip() == '':
-             processed_lines.append(final_line_content)
-
-    return '\n'.join(processed_lines)
-
+install_metrics(app)
+install_timing(app) # 各阶段耗时写入 Server-Timing 响应头和 [timing] 日志行；设置 CHAT_CLEANER_PROFILE_DIR 可开启 cProfile
+install_results(app) # 设置 CHAT_CLEANER_RESULTS_DIR 后，/results/<文件名> 直接从磁盘发送结果
 
 # --- HTML & CSS & JavaScript 模板 (CSS & HTML for Toggle Switch) ---
 HTML_TEMPLATE = """
@@ -291,9 +260,11 @@ HTML_TEMPLATE = """
 """
 
 # --- Flask 路由 (保持不变) ---
+INDEX_PAGE = prerender(app, HTML_TEMPLATE)
+
 @app.route('/', methods=['GET'])
 def index():
-    return render_template_string(HTML_TEMPLATE)
+    return render_flash_aware(INDEX_PAGE, HTML_TEMPLATE)
 
 @app.route('/process', methods=['POST'])
 def process_text():
@@ -307,21 +278,28 @@ def process_text():
         return redirect(url_for('index'))
 
     should_remove_timestamp = 'remove_timestamp' in request.form
+    timer = current_timer()
 
     if file and file.filename.lower().endswith('.txt'):
         try:
-            try:
-                input_text = file.read().decode('utf-8')
-            except UnicodeDecodeError:
-                 file.seek(0)
-                 try:
-                     input_text = file.read().decode('gbk')
-                     flash('文件以 GBK 编码读取。', 'success')
-                 except UnicodeDecodeError:
-                     flash('无法解码文件内容，请确保文件是 UTF-8 或 GBK 编码。', 'error')
-                     return redirect(url_for('index'))
-
-            cleaned_text = clean_text_content(input_text, remove_timestamp=should_remove_timestamp)
+            with timer.stage('read'):
+                raw_content = file.read()
+            with timer.stage('decode'):
+                try:
+                    input_text = raw_content.decode('utf-8')
+                except UnicodeDecodeError:
+                     try:
+                         input_text = raw_content.decode('gbk')
+                         flash('文件以 GBK 编码读取。', 'success')
+                     except UnicodeDecodeError as decode_err:
+                         record_parse_error(decode_err)
+                         flash('无法解码文件内容，请确保文件是 UTF-8 或 GBK 编码。', 'error')
+                         return redirect(url_for('index'))
+                del raw_content
+
+            with timer.stage('format'):
+                cleaned_text = clean_text_content(input_text, remove_timestamp=should_remove_timestamp)
+            record_messages(cleaned_text.count('\n') + 1 if cleaned_text else 0)
 
             output_filename = f"cleaned_{os.path.splitext(file.filename)[0]}.txt"
             return Response(
@@ -330,6 +308,7 @@ def process_text():
                 headers={"Content-Disposition": f"attachment;filename={output_filename}"}
             )
         except Exception as e:
+            record_unexpected_error(e) # 解码失败已在上面计入解析错误，这里是意料之外的错误
             app.logger.error(f"处理文件时出错: {e}") # Log the error
             flash(f'处理文件时发生错误: {e}', 'error')
             return redirect(url_for('index'))
@@ -340,4 +319,5 @@ def process_text():
 # --- 启动 Flask 应用 (保持不变) ---
 if __name__ == '__main__':
     print("服务已启动，请在浏览器访问 http://127.0.0.1:5000/")
-    app.run(host='0.0.0.0', port=5000, debug=True)
+    # 调试模式默认关闭，设置环境变量 FLASK_DEBUG=1 开启；共享部署请使用 python -m chat_cleaner.serve
+    app.run(host='0.0.0.0', port=5000, debug=os.environ.get('FLASK_DEBUG') == '1')
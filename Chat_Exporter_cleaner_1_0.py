@@ -1,50 +1,27 @@
 # -*- coding: utf-8 -*-
 import json
-import re
+import os
 import io
-from datetime import datetime
 from flask import Flask, request, send_file, jsonify
 from werkzeug.utils import secure_filename
 import traceback # 用于更详细的错误追踪
+from chat_cleaner.static_page import StaticPage # 首页启动时预渲染、预压缩，支持 ETag / 304
+from chat_cleaner.timing import install_timing, current_timer # 分阶段计时与性能剖析
+from chat_cleaner import core # 共用的格式化引擎
 
 # --- Flask App Initialization ---
 app = Flask(__name__)
 app.config['MAX_CONTENT_LENGTH'] = 16 * 1024 * 1024 # 限制上传大小为 16MB (可选)
+install_timing(app) # 各阶段耗时写入 Server-Timing 响应头和 [timing] 日志行；设置 CHAT_CLEANER_PROFILE_DIR 可开启 cProfile
 
 # --- Core Formatting Logic (与之前版本相同) ---
 def format_chat_log(json_data):
-    if not isinstance(json_data, list):
-        print("错误：输入数据不是列表。")
-        return None
-
-    formatted_lines = []
-    for message in json_data:
-        try:
-            timestamp_str = message.get("timestamp")
-            sender = message.get("sender", "未知发送者")
-            content = message.get("content", "")
-
-            if not timestamp_str:
-                print(f"警告：因缺少时间戳而跳过消息：{message.get('id', '未知ID')}")
-                continue
-
-            try:
-                dt_object = datetime.fromisoformat(timestamp_str.replace('Z', '+00:00'))
-                formatted_time = dt_object.strftime('%Y-%m-%dT%H:%M:%S')
-            except ValueError:
-                print(f"警告：无法解析时间戳 '{timestamp_str}'。将使用原始值。")
-                formatted_time = timestamp_str
-
-            cleaned_content = re.sub(r'\[图片\]\s*路径:.*', '[图片]', str(content), flags=re.IGNORECASE)
-            cleaned_content = re.sub(r'\[视频\]\s*路径:.*', '[视频]', cleaned_content, flags=re.IGNORECASE)
-
-            formatted_lines.append(f"{formatted_time}\n{sender}：{cleaned_content}")
-
-        except Exception as e:
-            print(f"处理消息时出错: {message.get('id', '未知ID')}. 错误: {e}")
-            formatted_lines.append(f"[错误：无法处理消息 {message.get('id', '')}]")
-
-    return "\n\n".join(formatted_lines)
+    """
+    1.0 的规则：缺少时间戳的消息整条跳过，无法解析的时间戳原样输出，出错的消息输出 "[错误：无法处理消息 id]"。
+    格式化逻辑在 chat_cleaner.core 中与 1.1 / Turbo 共用。
+    """
+    return core.format_chat_log(json_data, missing_timestamp='skip', unparsable_timestamp='raw',
+                                message_error='unprocessable')
 
 # --- Frontend HTML, CSS, JS ---
 HTML_TEMPLATE = """
@@ -442,13 +419,16 @@ HTML_TEMPLATE = """
 """
 
 # --- Flask Routes (与 V3 版本相同) ---
+INDEX_PAGE = StaticPage(HTML_TEMPLATE)
+
 @app.route('/')
 def index():
-    return HTML_TEMPLATE
+    return INDEX_PAGE.response()
 
 @app.route('/format', methods=['POST'])
 def format_file():
     print("\n收到 /format 请求")
+    timer = current_timer()
     if 'jsonFile' not in request.files:
         print("错误：请求中缺少 'jsonFile' 部分")
         return jsonify({"error": "请求中缺少文件部分"}), 400
@@ -469,7 +449,11 @@ def format_file():
 
     try:
         print("开始读取文件内容...")
-        file_content = file.stream.read().decode('utf-8')
+        with timer.stage('read'):
+            raw_content = file.stream.read()
+        with timer.stage('decode'):
+            file_content = raw_content.decode('utf-8')
+            del raw_content
         print(f"文件内容读取完毕，长度: {len(file_content)} 字节")
 
         if not file_content.strip():
@@ -477,32 +461,36 @@ def format_file():
              return jsonify({"error": "JSON 文件内容不能为空"}), 400
 
         print("开始解析 JSON...")
-        data = json.loads(file_content)
+        with timer.stage('parse'):
+            data = json.loads(file_content)
         print("JSON 解析成功。")
 
         print("开始格式化聊天记录...")
-        formatted_text = format_chat_log(data)
+        with timer.stage('format'):
+            formatted_text = format_chat_log(data)
 
         if formatted_text is None:
              print("错误：format_chat_log 返回 None")
              return jsonify({"error": "输入数据格式无效 (应为 JSON 对象列表)"}), 400
         print(f"聊天记录格式化完成，输出长度: {len(formatted_text)}")
 
-        mem_file = io.BytesIO()
-        mem_file.write(formatted_text.encode('utf-8'))
-        mem_file.seek(0)
+        with timer.stage('encode'):
+            mem_file = io.BytesIO()
+            mem_file.write(formatted_text.encode('utf-8'))
+            mem_file.seek(0)
         print("内存文件已准备好。")
 
         base_name = original_filename.rsplit('.', 1)[0] if '.' in original_filename else original_filename
         download_name = f"{base_name}_formatted.txt"
         print(f"准备发送文件，下载名: '{download_name}'")
 
-        response = send_file(
-            mem_file,
-            mimetype='text/plain; charset=utf-8',
-            as_attachment=True,
-            download_name=download_name # Flask 内部会处理 Content-Disposition
-        )
+        with timer.stage('send_file'):
+            response = send_file(
+                mem_file,
+                mimetype='text/plain; charset=utf-8',
+                as_attachment=True,
+                download_name=download_name # Flask 内部会处理 Content-Disposition
+            )
         # 尝试改进 Content-Disposition 处理非ASCII文件名
         try:
             from urllib.parse import quote
@@ -536,4 +524,5 @@ if __name__ == '__main__':
     print("访问 http://127.0.0.1:5000 或 http://[你的局域网IP]:5000")
     print("按 Ctrl+C 停止服务器")
     print("---------------------------------------------")
-    app.run(debug=True, host='0.0.0.0', port=5000)
\ No newline at end of file
+    # 调试模式默认关闭，设置环境变量 FLASK_DEBUG=1 开启；共享部署请使用 python -m chat_cleaner.serve
+    app.run(debug=os.environ.get('FLASK_DEBUG') == '1', host='0.0.0.0', port=5000)
\ No newline at end of file
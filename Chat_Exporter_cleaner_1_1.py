@@ -1,88 +1,18 @@
 # -*- coding: utf-8 -*-
 import json
-import re
+import os
 import io
-from datetime import datetime, timezone
 from flask import Flask, request, send_file, jsonify
 from werkzeug.utils import secure_filename
 import traceback # 用于更详细的错误追踪
+from chat_cleaner.static_page import StaticPage # 首页启动时预渲染、预压缩，支持 ETag / 304
+from chat_cleaner.timing import install_timing, current_timer # 分阶段计时与性能剖析
+from chat_cleaner.core import format_chat_log # 格式化逻辑与 Turbo 共用，问题按类别汇总为一行输出
 
 # --- Flask App Initialization ---
 app = Flask(__name__)
 app.config['MAX_CONTENT_LENGTH'] = 16 * 1024 * 1024 # 限制上传大小为 16MB (可选)
-
-# --- Core Formatting Logic (修改版 - 控制显示/隐藏时间) ---
-def format_chat_log(json_data, show_timestamp=True): # 新参数控制是否显示时间，默认显示
-    """
-    将聊天消息字典列表格式化为所需的文本格式。
-
-    Args:
-        json_data: 字典列表，每个字典代表一条聊天消息。
-        show_timestamp (bool): 是否在输出中包含时间戳行。默认为 True。
-
-    Returns:
-        包含格式化聊天记录的字符串，如果输入无效则返回 None。
-    """
-    if not isinstance(json_data, list):
-        print("错误：输入数据不是列表。")
-        return None
-
-    formatted_lines = []
-    for message in json_data:
-        try:
-            sender = message.get("sender", "未知发送者")
-            content = message.get("content", "")
-            timestamp_str = message.get("timestamp") # 读取时间戳用于格式化(如果需要显示)
-
-            line_parts = [] # 用列表存储当前消息的各个部分
-
-            # --- 处理时间戳 (如果需要显示) ---
-            if show_timestamp:
-                formatted_time = "" # 初始化为空字符串
-                if timestamp_str:
-                    try:
-                        # 尝试解析 ISO 格式时间戳，处理 'Z'
-                        temp_ts = timestamp_str.replace('Z', '+00:00')
-                        dt_object = datetime.fromisoformat(temp_ts)
-                        # 强制移除时区，格式化为 YYYY-MM-DDTHH:MM:SS
-                        dt_object_naive = dt_object.replace(tzinfo=None)
-                        formatted_time = dt_object_naive.strftime('%Y-%m-%dT%H:%M:%S')
-                        print(f"  格式化时间戳 (显示): {formatted_time}")
-                    except ValueError:
-                        print(f"警告：解析时间戳 '{timestamp_str}' 失败，尝试截断。")
-                        # 解析失败，尝试截断
-                        if len(timestamp_str) >= 19 and timestamp_str[4] == '-' and timestamp_str[10] == 'T' and timestamp_str[16] == ':':
-                             formatted_time = timestamp_str[:19]
-                             print(f"  截断时间戳 (显示): {formatted_time}")
-                        else:
-                             # 截断也失败或格式不对，使用原始字符串或特定标记
-                             formatted_time = f"[无法解析时间: {timestamp_str}]"
-                             print(f"  无法处理时间戳 (显示): {timestamp_str}")
-                    line_parts.append(formatted_time) # 添加时间部分
-                else:
-                    # 时间戳字段不存在，但也要求显示时间
-                    line_parts.append("[时间戳缺失]")
-                    print("警告：消息缺少时间戳字段，但要求显示时间。")
-
-
-            # --- 清理和添加发送者与内容 ---
-            cleaned_content = re.sub(r'\[图片\]\s*路径:.*', '[图片]', str(content), flags=re.IGNORECASE)
-            cleaned_content = re.sub(r'\[视频\]\s*路径:.*', '[视频]', cleaned_content, flags=re.IGNORECASE)
-            sender_content_line = f"{sender}：{cleaned_content}"
-            line_parts.append(sender_content_line) # 添加发送者和内容部分
-
-            # --- 组合当前消息的输出 ---
-            formatted_lines.append("\n".join(line_parts)) # 使用换行符连接时间(如果存在)和内容
-
-        except Exception as e:
-            # 捕获处理单个消息时的其他意外错误
-            msg_id = message.get('id', '未知ID')
-            print(f"处理消息 {msg_id} 时发生意外错误: {e}")
-            traceback.print_exc()
-            formatted_lines.append(f"[错误：处理消息 {msg_id} 失败]")
-
-    # 使用两个换行符连接所有消息块
-    return "\n\n".join(formatted_lines)
+install_timing(app) # 各阶段耗时写入 Server-Timing 响应头和 [timing] 日志行；设置 CHAT_CLEANER_PROFILE_DIR 可开启 cProfile
 
 # --- Frontend HTML, CSS, JS ---
 HTML_TEMPLATE = """
@@ -344,15 +274,18 @@ HTML_TEMPLATE = """
 """
 
 # --- Flask Routes ---
+INDEX_PAGE = StaticPage(HTML_TEMPLATE)
+
 @app.route('/')
 def index():
-    """提供主 HTML 页面。"""
-    return HTML_TEMPLATE
+    """提供主 HTML 页面 (预压缩，浏览器再次访问时返回 304)。"""
+    return INDEX_PAGE.response()
 
 @app.route('/format', methods=['POST'])
 def format_file():
     """处理文件上传、格式化和下载。"""
     print("\n收到 /format 请求")
+    timer = current_timer()
     # 检查文件是否存在
     if 'jsonFile' not in request.files:
         print("错误：请求中缺少 'jsonFile' 部分")
@@ -381,7 +314,11 @@ def format_file():
     try:
         # 读取和解码文件内容
         print("开始读取文件内容...")
-        file_content = file.stream.read().decode('utf-8')
+        with timer.stage('read'):
+            raw_content = file.stream.read()
+        with timer.stage('decode'):
+            file_content = raw_content.decode('utf-8')
+            del raw_content
         print(f"文件内容读取完毕，长度: {len(file_content)} 字节")
 
         # 检查文件内容是否为空
@@ -391,12 +328,14 @@ def format_file():
 
         # 解析 JSON 数据
         print("开始解析 JSON...")
-        data = json.loads(file_content)
+        with timer.stage('parse'):
+            data = json.loads(file_content)
         print("JSON 解析成功。")
 
         # 调用核心格式化函数，传入显示时间戳的选项
         print(f"开始格式化聊天记录 (显示时间戳: {show_timestamp})...")
-        formatted_text = format_chat_log(data, show_timestamp=show_timestamp)
+        with timer.stage('format'):
+            formatted_text = format_chat_log(data, show_timestamp=show_timestamp)
 
         # 检查格式化结果
         if formatted_text is None:
@@ -405,9 +344,10 @@ def format_file():
         print(f"聊天记录格式化完成，输出长度: {len(formatted_text)}")
 
         # 创建内存文件用于响应
-        mem_file = io.BytesIO()
-        mem_file.write(formatted_text.encode('utf-8'))
-        mem_file.seek(0)
+        with timer.stage('encode'):
+            mem_file = io.BytesIO()
+            mem_file.write(formatted_text.encode('utf-8'))
+            mem_file.seek(0)
         print("内存文件已准备好。")
 
         # 准备下载文件名
@@ -416,12 +356,13 @@ def format_file():
         print(f"准备发送文件，下载名: '{download_name}'")
 
         # 使用 send_file 发送文件响应
-        response = send_file(
-            mem_file,
-            mimetype='text/plain; charset=utf-8',
-            as_attachment=True,
-            download_name=download_name # Flask 会处理基本的 Content-Disposition
-        )
+        with timer.stage('send_file'):
+            response = send_file(
+                mem_file,
+                mimetype='text/plain; charset=utf-8',
+                as_attachment=True,
+                download_name=download_name # Flask 会处理基本的 Content-Disposition
+            )
         # 尝试设置更兼容的 Content-Disposition 头，处理非 ASCII 文件名
         try:
             from urllib.parse import quote
@@ -456,5 +397,5 @@ if __name__ == '__main__':
     print("访问 http://127.0.0.1:5000 或 http://[你的局域网IP]:5000")
     print("按 Ctrl+C 停止服务器")
     print("---------------------------------------------")
-    # debug=True 用于开发，自动重载代码。生产环境应设为 False 并使用生产级服务器如 Gunicorn/uWSGI
-    app.run(debug=True, host='0.0.0.0', port=5000)
\ No newline at end of file
+    # 调试模式默认关闭，设置环境变量 FLASK_DEBUG=1 开启；共享部署请使用 python -m chat_cleaner.serve
+    app.run(debug=os.environ.get('FLASK_DEBUG') == '1', host='0.0.0.0', port=5000)
\ No newline at end of file
@@ -1,74 +1,37 @@
 # -*- coding: utf-8 -*-
 import json
-import re
+import os
 import io
-from datetime import datetime, timezone
 from flask import Flask, request, send_file, jsonify
 from werkzeug.utils import secure_filename
+import werkzeug.exceptions # format_file 的异常处理中用于识别上传过大
 import traceback # 用于更详细的错误追踪
+from chat_cleaner import jsonio # 可插拔 JSON 解码层，解码时只保留需要的消息字段
+from chat_cleaner.timing import install_timing, current_timer # 分阶段计时与性能剖析
+from chat_cleaner.metrics import install_metrics, record_messages, record_parse_error, record_unexpected_error # /metrics 服务指标
+from chat_cleaner.diagnostics import FormatDiagnostics # 格式化问题按类别汇总，每个请求只输出一行
+from chat_cleaner.admission import install_admission # 按内存预算限制同时处理的上传
+from chat_cleaner.static_page import StaticPage # 首页启动时预渲染、预压缩，支持 ETag / 304
+from chat_cleaner.uploads import install_uploads # 可续传的分块上传，边接收边格式化
+from chat_cleaner.results import install_results # 磁盘上的结果文件零拷贝下载，支持 Range 续传
+from chat_cleaner.store import install_store, result_key, result_response # 结果保留一段时间，短链接重新下载
+from chat_cleaner.preview import sample_head, estimate_total # 只解析文件开头的快速预览
+from chat_cleaner.core import format_chat_log, format_chat_stream # 格式化逻辑与 1.0 / 1.1、监视进程、基准测试共用
 
 # --- Flask App Initialization ---
 app = Flask(__name__)
 # *** 增加文件上传大小限制 (例如设置为 64MB) ***
 # 64 * 1024 * 1024 字节 = 64 MB
 app.config['MAX_CONTENT_LENGTH'] = 64 * 1024 * 1024
-
-# --- Core Formatting Logic (与 V5.2 相同) ---
-def format_chat_log(json_data, show_timestamp=True):
-    """
-    将聊天消息字典列表格式化为所需的文本格式。
-    Args:
-        json_data: 字典列表，每个字典代表一条聊天消息。
-        show_timestamp (bool): 是否在输出中包含时间戳行。默认为 True。
-    Returns:
-        包含格式化聊天记录的字符串，如果输入无效则返回 None。
-    """
-    if not isinstance(json_data, list):
-        print("错误：输入数据不是列表。")
-        return None
-
-    formatted_lines = []
-    for message in json_data:
-        try:
-            sender = message.get("sender", "未知发送者")
-            content = message.get("content", "")
-            timestamp_str = message.get("timestamp")
-
-            line_parts = []
-
-            if show_timestamp:
-                formatted_time = ""
-                if timestamp_str:
-                    try:
-                        temp_ts = timestamp_str.replace('Z', '+00:00')
-                        dt_object = datetime.fromisoformat(temp_ts)
-                        dt_object_naive = dt_object.replace(tzinfo=None)
-                        formatted_time = dt_object_naive.strftime('%Y-%m-%dT%H:%M:%S')
-                    except ValueError:
-                        print(f"警告：解析时间戳 '{timestamp_str}' 失败，尝试截断。")
-                        if len(timestamp_str) >= 19 and timestamp_str[4] == '-' and timestamp_str[10] == 'T' and timestamp_str[16] == ':':
-                             formatted_time = timestamp_str[:19]
-                        else:
-                             formatted_time = f"[无法解析时间: {timestamp_str}]"
-                    line_parts.append(formatted_time)
-                else:
-                    line_parts.append("[时间戳缺失]")
-
-            # 清理内容时也考虑替换无法编码的字符（更早处理可能更好，但最后encode处处理是保底）
-            cleaned_content = re.sub(r'\[图片\]\s*路径:.*', '[图片]', str(content), flags=re.IGNORECASE)
-            cleaned_content = re.sub(r'\[视频\]\s*路径:.*', '[视频]', cleaned_content, flags=re.IGNORECASE)
-            sender_content_line = f"{sender}：{cleaned_content}"
-            line_parts.append(sender_content_line)
-
-            formatted_lines.append("\n".join(line_parts))
-
-        except Exception as e:
-            msg_id = message.get('id', '未知ID')
-            print(f"处理消息 {msg_id} 时发生意外错误: {e}")
-            traceback.print_exc()
-            formatted_lines.append(f"[错误：处理消息 {msg_id} 失败]")
-
-    return "\n\n".join(formatted_lines)
+install_timing(app) # 设置 CHAT_CLEANER_PROFILE_DIR 可开启 cProfile，保留最慢的请求
+install_metrics(app)
+install_admission(app) # 预算不足时排队，超时返回 503 + Retry-After，避免多个大文件同时上传导致内存耗尽
+# 默认不保存结果；设置 CHAT_CLEANER_STORE_DIR 或 CHAT_CLEANER_STORE_TTL 后保存 (默认 24 小时、总共 1 GB)，/r/<id> 重新下载
+STORE = install_store(app)
+# /preview 只接收文件开头和少量抽样片段
+PREVIEW_HEAD_MAX = 1024 * 1024
+PREVIEW_SAMPLE_MAX = 64 * 1024
+PREVIEW_LIMIT_MAX = 200
 
 # --- Frontend HTML, CSS, JS (与 V5.2 相同) ---
 HTML_TEMPLATE = """
@@ -110,6 +73,7 @@ HTML_TEMPLATE = """
         #format-button:active { animation: jelly-press 0.5s cubic-bezier(0.34, 1.56, 0.64, 1); background-color: #004ca3; box-shadow: 0 2px 8px rgba(0, 123, 255, 0.3); transform: translateY(0); }
         #format-button:disabled { background-color: #b8cde0; cursor: not-allowed; box-shadow: none; transform: none; color: #f0f8ff; }
         #status { margin-top: 25px; font-size: 1em; font-weight: 500; min-height: 1.5em; }
+        #preview { text-align: left; white-space: pre-wrap; word-break: break-all; max-height: 260px; overflow: auto; background-color: var(--drop-bg); border: 1px solid var(--border-color); border-radius: 8px; padding: 12px 15px; margin: 0 0 25px; font-size: 0.85em; color: #445; }
         .status-success { color: var(--success-color); } .status-error { color: var(--error-color); } .status-processing { color: #555; }
     </style>
 </head>
@@ -129,6 +93,7 @@ HTML_TEMPLATE = """
                 <span class="slider"></span>
             </label>
         </div>
+        <pre id="preview" hidden></pre>
         <button id="format-button" disabled>请先选择文件</button>
         <div id="status"></div>
     </div>
@@ -139,19 +104,34 @@ HTML_TEMPLATE = """
             const fileNameDisplay = document.getElementById('file-name'); const timestampToggle = document.getElementById('timestamp-toggle');
             if (!dropZone || !fileInput || !formatButton || !statusDiv || !fileNameDisplay || !timestampToggle) { console.error('错误：页面元素未找到！'); statusDiv.textContent = '页面初始化错误！'; statusDiv.className = 'status-error'; return; }
             let selectedFile = null;
+            // 选择文件或切换时间戳开关后，只上传文件开头和几个抽样片段，预览前 20 条消息并估算总条数
+            const previewBox = document.getElementById('preview'); const PREVIEW_HEAD = 256 * 1024; const PREVIEW_SAMPLE = 32 * 1024; let previewSeq = 0;
+            async function runPreview() { if (!selectedFile) { previewBox.hidden = true; return; } const seq = ++previewSeq; const file = selectedFile; const formData = new FormData(); formData.append('jsonFile', file.slice(0, PREVIEW_HEAD), file.name); if (file.size > PREVIEW_HEAD) { for (let i = 1; i <= 4; i++) { const start = Math.floor(file.size * i / 5); formData.append('sample', file.slice(start, start + PREVIEW_SAMPLE), 'sample'); } } formData.append('totalSize', file.size); formData.append('showTimestamp', timestampToggle.checked); formData.append('limit', 20); try { const r = await fetch('/preview', { method: 'POST', body: formData }); const data = await r.json(); if (seq !== previewSeq) return; previewBox.textContent = r.ok ? `${data.exact ? '共' : '预计共约'} ${data.estimatedTotal} 条消息，以下为前 ${data.messages} 条的预览：\\n\\n${data.preview}` : `无法预览: ${data.error || r.status}`; previewBox.hidden = false; } catch (e) { if (seq === previewSeq) previewBox.hidden = true; } }
+            timestampToggle.addEventListener('change', runPreview);
+            // 大文件使用可续传的分块上传 (/uploads)：每块带 CRC32 校验，断线后再次点击只补传缺少的块
+            const CHUNKED_THRESHOLD = 16 * 1024 * 1024;
+            const CRC_TABLE = (() => { const t = new Uint32Array(256); for (let n = 0; n < 256; n++) { let c = n; for (let k = 0; k < 8; k++) c = (c & 1) ? (0xEDB88320 ^ (c >>> 1)) : (c >>> 1); t[n] = c >>> 0; } return t; })();
+            function crc32(bytes) { let c = 0xFFFFFFFF; for (let i = 0; i < bytes.length; i++) c = CRC_TABLE[(c ^ bytes[i]) & 0xFF] ^ (c >>> 8); return ((c ^ 0xFFFFFFFF) >>> 0).toString(16); }
+            async function errorMessage(response) { try { const data = await response.json(); return `HTTP ${response.status}: ${data.error || '未知错误'}`; } catch (e) { return `HTTP ${response.status}`; } }
+            async function getUploadSession(file) { const key = `upload:${file.name}:${file.size}:${file.lastModified}`; const saved = localStorage.getItem(key); if (saved) { try { const r = await fetch(`/uploads/${saved}`); if (r.ok) return { key, info: await r.json() }; } catch (e) {} localStorage.removeItem(key); } const r = await fetch('/uploads', { method: 'POST', headers: { 'Content-Type': 'application/json' }, body: JSON.stringify({ filename: file.name, size: file.size }) }); if (!r.ok) throw new Error(await errorMessage(r)); const info = await r.json(); localStorage.setItem(key, info.id); return { key, info }; }
+            async function putChunk(info, file, index) { const start = index * info.chunkSize; const bytes = new Uint8Array(await file.slice(start, Math.min(file.size, start + info.chunkSize)).arrayBuffer()); const checksum = crc32(bytes); for (let attempt = 1; ; attempt++) { let r = null; try { r = await fetch(`/uploads/${info.id}/${index}`, { method: 'PUT', headers: { 'Content-Type': 'application/octet-stream', 'X-Chunk-CRC32': checksum }, body: bytes }); } catch (e) { if (attempt >= 5) throw e; } if (r) { if (r.ok) return; const retryable = r.status === 422 || r.status >= 500; if (!retryable || attempt >= 5) throw new Error(await errorMessage(r)); } await new Promise(resolve => setTimeout(resolve, 1000 * attempt)); } }
+            async function chunkedFormat(file, showTimestamp) { const { key, info } = await getUploadSession(file); const received = new Set(info.received); const resultPromise = fetch(`/uploads/${info.id}/result?showTimestamp=${showTimestamp}`); resultPromise.catch(() => {}); let done = received.size; for (let i = 0; i < info.chunks; i++) { if (received.has(i)) continue; await putChunk(info, file, i); done++; showStatus(`正在上传并格式化... ${Math.round(100 * done / info.chunks)}%`, 'processing'); } showStatus('上传完成，正在接收格式化结果...', 'processing'); return { key, id: info.id, response: await resultPromise }; }
+            async function streamError(blob) { const marker = '\\u0000[错误：'; const tail = await blob.slice(Math.max(0, blob.size - 4096)).text(); const at = tail.lastIndexOf(marker); return at < 0 ? null : tail.slice(at + marker.length).replace(/\\]\\s*$/, ''); } // 分块上传的结果流中途出错时，服务器在输出末尾写入错误标记
             function isValidJsonFile(file) { if (!file) return false; const fileName = file.name || ''; const fileType = file.type || ''; return fileType === 'application/json' || fileName.toLowerCase().endsWith('.json'); }
             function updateButtonState() { formatButton.disabled = !selectedFile; formatButton.textContent = selectedFile ? '格式化并下载 TXT' : '请先选择文件'; }
-            function handleFileSelect(file) { if (isValidJsonFile(file)) { selectedFile = file; fileNameDisplay.textContent = `已选: ${file.name}`; showStatus(''); } else { selectedFile = null; fileNameDisplay.textContent = ''; if (file) { showStatus('请选择有效的 JSON 文件 (.json)', 'error'); } fileInput.value = ''; } updateButtonState(); }
+            function handleFileSelect(file) { if (isValidJsonFile(file)) { selectedFile = file; fileNameDisplay.textContent = `已选: ${file.name}`; showStatus(''); } else { selectedFile = null; fileNameDisplay.textContent = ''; if (file) { showStatus('请选择有效的 JSON 文件 (.json)', 'error'); } fileInput.value = ''; } updateButtonState(); runPreview(); }
             dropZone.addEventListener('click', () => { fileInput.click(); }); dropZone.addEventListener('keydown', (event) => { if (event.key === 'Enter' || event.key === ' ') { fileInput.click(); } }); fileInput.addEventListener('change', (event) => { if (event.target.files && event.target.files.length > 0) { handleFileSelect(event.target.files[0]); } }); dropZone.addEventListener('dragenter', (e) => { e.preventDefault(); e.stopPropagation(); dropZone.classList.add('drag-over'); }); dropZone.addEventListener('dragover', (e) => { e.preventDefault(); e.stopPropagation(); dropZone.classList.add('drag-over'); e.dataTransfer.dropEffect = 'copy'; }); dropZone.addEventListener('dragleave', (e) => { e.preventDefault(); e.stopPropagation(); if (!dropZone.contains(e.relatedTarget)) { dropZone.classList.remove('drag-over'); } }); dropZone.addEventListener('drop', (e) => { e.preventDefault(); e.stopPropagation(); dropZone.classList.remove('drag-over'); const files = e.dataTransfer.files; if (files && files.length > 0) { handleFileSelect(files[0]); try { fileInput.files = files; } catch (ex) { console.warn("无法设置 input.files", ex); } } else { handleFileSelect(null); } });
             formatButton.addEventListener('click', async () => {
                 if (!selectedFile) { showStatus('错误：没有选中的文件！', 'error'); formatButton.style.animation = 'shake 0.5s ease-in-out'; setTimeout(() => formatButton.style.animation = '', 500); return; }
                 formatButton.disabled = true; showStatus('正在处理...', 'processing');
                 const formData = new FormData(); formData.append('jsonFile', selectedFile, selectedFile.name);
                 const showTimestamp = timestampToggle.checked; formData.append('showTimestamp', showTimestamp); console.log(`显示时间戳开关状态: ${showTimestamp}`);
+                let resultLink = null; // 服务器保存了结果时的短链接，下载失败也可以用它重新下载 (分块上传的结果流完整结束后才可用)
                 try {
-                    const response = await fetch('/format', { method: 'POST', body: formData });
-                    if (response.ok) { const blob = await response.blob(); const url = window.URL.createObjectURL(blob); const a = document.createElement('a'); a.style.display = 'none'; a.href = url; const disposition = response.headers.get('Content-Disposition'); let filename = `${selectedFile.name.replace(/\.[^/.]+$/, "")}_formatted.txt`; if (disposition) { const m1 = disposition.match(/filename\*?=(?:UTF-8'')?([^;]+)/i); if (m1 && m1[1]) { try { filename = decodeURIComponent(m1[1].replace(/['"]/g, '')); } catch (e) {} } else { const m2 = disposition.match(/filename="([^"]+)"/i); if (m2 && m2[1]) filename = m2[1]; } } a.download = filename; document.body.appendChild(a); a.click(); window.URL.revokeObjectURL(url); a.remove(); showStatus('格式化完成！已开始下载。', 'success'); } else { let errorMsg = `处理失败 (HTTP ${response.status})`; try { const errorData = await response.json(); errorMsg += `: ${errorData.error || '未知错误'}`; } catch (e) { try { const errorText = await response.text(); errorMsg += `: ${errorText.substring(0, 100) || '(无信息)'}`; } catch (e2) {} } showStatus(errorMsg, 'error'); console.error('服务器错误:', errorMsg); }
-                } catch (error) { showStatus(`客户端错误: ${error.message}`, 'error'); console.error('Fetch错误:', error); } finally { updateButtonState(); }
+                    let chunked = null; let response;
+                    if (selectedFile.size > CHUNKED_THRESHOLD) { chunked = await chunkedFormat(selectedFile, showTimestamp); response = chunked.response; } else { response = await fetch('/format', { method: 'POST', body: formData }); }
+                    if (response.ok) { const link = response.headers.get('X-Result-Link'); if (!chunked) resultLink = link; const blob = await response.blob(); if (chunked) { const failure = await streamError(blob); if (failure !== null) { localStorage.removeItem(chunked.key); fetch(`/uploads/${chunked.id}`, { method: 'DELETE' }).catch(() => {}); showStatus(`处理失败: ${failure}`, 'error'); return; } } resultLink = link; const url = window.URL.createObjectURL(blob); const a = document.createElement('a'); a.style.display = 'none'; a.href = url; const disposition = response.headers.get('Content-Disposition'); let filename = `${selectedFile.name.replace(/\.[^/.]+$/, "")}_formatted.txt`; if (disposition) { const m1 = disposition.match(/filename\*?=(?:UTF-8'')?([^;]+)/i); if (m1 && m1[1]) { try { filename = decodeURIComponent(m1[1].replace(/['"]/g, '')); } catch (e) {} } else { const m2 = disposition.match(/filename="([^"]+)"/i); if (m2 && m2[1]) filename = m2[1]; } } a.download = filename; document.body.appendChild(a); a.click(); window.URL.revokeObjectURL(url); a.remove(); showStatus('格式化完成！已开始下载。' + (resultLink ? `需要再次下载可访问 ${location.origin}${resultLink}` : ''), 'success'); if (chunked) { localStorage.removeItem(chunked.key); fetch(`/uploads/${chunked.id}`, { method: 'DELETE' }).catch(() => {}); } } else { let errorMsg = `处理失败 (HTTP ${response.status})`; try { const errorData = await response.json(); errorMsg += `: ${errorData.error || '未知错误'}`; } catch (e) { try { const errorText = await response.text(); errorMsg += `: ${errorText.substring(0, 100) || '(无信息)'}`; } catch (e2) {} } showStatus(errorMsg, 'error'); console.error('服务器错误:', errorMsg); }
+                } catch (error) { showStatus(`客户端错误: ${error.message}` + (resultLink ? `（结果已保存，可访问 ${location.origin}${resultLink} 下载）` : selectedFile.size > CHUNKED_THRESHOLD ? '（再次点击可从断点续传）' : ''), 'error'); console.error('Fetch错误:', error); } finally { updateButtonState(); }
             });
             function showStatus(message, type = 'info') { statusDiv.textContent = message; statusDiv.className = ''; if (type === 'success') statusDiv.classList.add('status-success'); else if (type === 'error') statusDiv.classList.add('status-error'); else if (type === 'processing') statusDiv.classList.add('status-processing'); }
             const styleSheet = document.createElement("style"); styleSheet.textContent = `@keyframes shake { 10%, 90% { transform: translateX(-1px); } 20%, 80% { transform: translateX(2px); } 30%, 50%, 70% { transform: translateX(-3px); } 40%, 60% { transform: translateX(3px); }}`; document.head.appendChild(styleSheet);
@@ -163,93 +143,117 @@ HTML_TEMPLATE = """
 """
 
 # --- Flask Routes ---
+INDEX_PAGE = StaticPage(HTML_TEMPLATE)
+
 @app.route('/')
 def index():
-    return HTML_TEMPLATE
+    return INDEX_PAGE.response()
 
 @app.route('/format', methods=['POST'])
 def format_file():
-    print("\n收到 /format 请求")
-    # 文件检查
-    if 'jsonFile' not in request.files: return jsonify({"error": "缺少文件部分"}), 400
-    file = request.files['jsonFile']
+    timer = current_timer() # 各阶段耗时写入 Server-Timing 响应头和 [timing] 日志行
+    # 文件检查 (访问 request.files 时才会真正接收并解析上传内容)
+    with timer.stage('receive'):
+        files = request.files
+    if 'jsonFile' not in files: return jsonify({"error": "缺少文件部分"}), 400
+    file = files['jsonFile']
     if not file or file.filename == '': return jsonify({"error": "没有选择文件"}), 400
     original_filename = secure_filename(file.filename)
     if not (original_filename.lower().endswith('.json') or file.content_type == 'application/json'): return jsonify({"error": "不允许的文件类型"}), 400
-    print(f"处理文件: '{original_filename}' ({file.content_type})")
 
     # 获取开关状态
     show_timestamp_str = request.form.get('showTimestamp', 'true')
     show_timestamp = show_timestamp_str.lower() == 'true'
-    print(f"显示时间戳选项: {show_timestamp}")
+    timer.note(file=original_filename, show_timestamp=show_timestamp)
+    base_name = original_filename.rsplit('.', 1)[0] if '.' in original_filename else original_filename
+    download_name = f"{base_name}_formatted.txt"
 
     try:
         # 读取文件 (大小限制由 app.config['MAX_CONTENT_LENGTH'] 控制)
-        print("开始读取文件内容...")
-        # 检查文件大小是否真的超限 (虽然Flask会先拦截，但这里可以加日志)
-        # file.seek(0, os.SEEK_END)
-        # file_length = file.tell()
-        # file.seek(0)
-        # print(f"文件实际大小: {file_length} 字节")
-        # if file_length > app.config['MAX_CONTENT_LENGTH']:
-        #     return jsonify({"error": f"文件过大，超过服务器限制 ({app.config['MAX_CONTENT_LENGTH'] / 1024 / 1024} MB)"}), 413 # Payload Too Large
-
-        file_content = file.stream.read().decode('utf-8') # 假设输入文件是UTF-8
-        print("文件内容读取完毕。")
+        with timer.stage('read'):
+            raw_content = file.stream.read()
+        timer.note(bytes_in=len(raw_content))
+        # 同一个文件用同样的选项再次上传时，直接从磁盘发送上次的结果
+        key = None
+        if STORE is not None and STORE.dedup: # 按内容复用结果只在开启 CHAT_CLEANER_STORE_DEDUP 时进行
+            with timer.stage('lookup'):
+                key = result_key(raw_content, show_timestamp=show_timestamp)
+                stored = STORE.lookup(key)
+            if stored is not None:
+                timer.note(stored_result=stored['id'], bytes_out=stored['size'])
+                return result_response(STORE, stored, download_name)
+        with timer.stage('decode'):
+            file_content = raw_content.decode('utf-8') # 假设输入文件是UTF-8
+            del raw_content
 
         if not file_content.strip(): return jsonify({"error": "JSON 文件内容为空"}), 400
 
         # 解析 JSON
-        print("开始解析 JSON...")
-        data = json.loads(file_content)
-        print("JSON 解析成功。")
+        with timer.stage('parse'):
+            data = jsonio.load_messages(file_content) # 每条消息解码为紧凑的消息记录
+            del file_content
+        message_count = len(data) if isinstance(data, list) else 0
+        timer.note(json_backend=jsonio.backend.name, messages=message_count)
 
         # 格式化
-        print(f"开始格式化 (显示时间戳: {show_timestamp})...")
-        formatted_text = format_chat_log(data, show_timestamp=show_timestamp)
+        diagnostics = FormatDiagnostics()
+        with timer.stage('format'):
+            formatted_text = format_chat_log(data, show_timestamp=show_timestamp, diagnostics=diagnostics)
+            del data
+        if diagnostics:
+            print(f"[{original_filename}] {diagnostics.summary()}")
+            timer.note(format_issues=diagnostics.counts)
         if formatted_text is None: return jsonify({"error": "输入数据格式无效"}), 400
-        print("格式化完成。")
+        record_messages(message_count)
 
-        # 创建内存文件并发送响应
-        mem_file = io.BytesIO()
         # *** 修改点：添加 errors='replace' 处理编码错误 ***
         try:
-            mem_file.write(formatted_text.encode('utf-8', errors='replace'))
-            print("文本已成功编码为 UTF-8 (使用 'replace' 处理错误)")
+            with timer.stage('encode'):
+                body = formatted_text.encode('utf-8', errors='replace')
+            del formatted_text
         except Exception as encode_err:
              # 这个理论上不应该再发生 UnicodeEncodeError 了，但保留以防万一
              print(f"!!! 编码时发生意料之外的错误: {encode_err}")
              traceback.print_exc()
              return jsonify({"error": "在准备下载文件时发生内部编码错误"}), 500
 
-        mem_file.seek(0)
+        timer.note(bytes_out=len(body))
 
-        # 准备下载
-        base_name = original_filename.rsplit('.', 1)[0] if '.' in original_filename else original_filename
-        download_name = f"{base_name}_formatted.txt"
-        print(f"准备发送文件: '{download_name}'")
+        # 保存结果后从磁盘发送 (零拷贝)，响应头 X-Result-Link 为重新下载的短链接
+        if STORE is not None:
+            with timer.stage('store'):
+                stored = STORE.put(body, download_name, key=key, messages=message_count)
+            if stored is not None:
+                del body
+                with timer.stage('send_file'):
+                    return result_response(STORE, stored, download_name)
 
-        response = send_file(
-            mem_file,
-            mimetype='text/plain; charset=utf-8',
-            as_attachment=True,
-            download_name=download_name
-        )
-        # 设置 Content-Disposition
-        try:
-            from urllib.parse import quote
-            response.headers['Content-Disposition'] = f"attachment; filename=\"{download_name}\"; filename*=UTF-8''{quote(download_name)}"
-        except Exception: response.headers['Content-Disposition'] = f"attachment; filename=\"{download_name}\""
+        # 不保存 (或结果超过存储上限) 时创建内存文件发送
+        mem_file = io.BytesIO(body)
+        del body
+        with timer.stage('send_file'):
+            response = send_file(
+                mem_file,
+                mimetype='text/plain; charset=utf-8',
+                as_attachment=True,
+                download_name=download_name
+            )
+            # 设置 Content-Disposition
+            try:
+                from urllib.parse import quote
+                response.headers['Content-Disposition'] = f"attachment; filename=\"{download_name}\"; filename*=UTF-8''{quote(download_name)}"
+            except Exception: response.headers['Content-Disposition'] = f"attachment; filename=\"{download_name}\""
 
-        print("文件发送成功。")
         return response
 
     # 错误处理
     except json.JSONDecodeError as e:
+        record_parse_error(e)
         print(f"JSON 解析错误: {e}")
         return jsonify({"error": f"无效的 JSON 文件: {e}"}), 400
-    except UnicodeDecodeError:
+    except UnicodeDecodeError as e:
         # 这个错误发生在 file.stream.read().decode('utf-8')
+        record_parse_error(e)
         print("文件编码错误，需要 UTF-8")
         return jsonify({"error": "文件编码错误，请确保上传的文件本身是 UTF-8 编码"}), 400
     except Exception as e:
@@ -261,19 +265,46 @@ def format_file():
              print(f"错误原因：文件大小超过配置限制 ({mb_limit:.1f} MB)")
              return jsonify({"error": f"上传的文件过大，请确保小于 {mb_limit:.1f} MB"}), 413
         else:
+            record_unexpected_error(e) # 服务端的问题，不计入解析错误
             traceback.print_exc()
             return jsonify({"error": "处理文件时发生内部服务器错误"}), 500
 
+@app.route('/preview', methods=['POST'])
+def preview_file():
+    """只解析上传的文件开头，返回前 N 条消息的格式化结果和总条数估算。"""
+    head_file = request.files.get('jsonFile')
+    if not head_file or head_file.filename == '': return jsonify({"error": "没有选择文件"}), 400
+    head = head_file.stream.read(PREVIEW_HEAD_MAX)
+    samples = [sample.stream.read(PREVIEW_SAMPLE_MAX) for sample in request.files.getlist('sample')[:16]]
+    total_size = request.form.get('totalSize', type=int) or len(head)
+    limit = max(1, min(request.form.get('limit', 20, type=int), PREVIEW_LIMIT_MAX))
+    show_timestamp = request.form.get('showTimestamp', 'true').lower() == 'true'
+    try:
+        messages, count, complete = sample_head(head, limit)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    diagnostics = FormatDiagnostics()
+    preview_text = format_chat_log(messages, show_timestamp=show_timestamp, diagnostics=diagnostics)
+    estimated, exact = estimate_total(count, head, samples, total_size, complete)
+    return jsonify({"preview": preview_text, "messages": len(messages), "estimatedTotal": estimated,
+                    "exact": exact, "issues": diagnostics.counts})
+
+# 分块上传：/uploads 系列路由，结果由 format_chat_stream 逐条生成，与 /format 的输出相同
+install_uploads(app, format_chat_stream, store=STORE)
+# 设置 CHAT_CLEANER_RESULTS_DIR (例如监视进程的输出目录) 后，/results/<文件名> 直接从磁盘发送结果
+RESULTS_DIR = install_results(app)
+
 
 # --- Main Execution ---
 if __name__ == '__main__':
-    # 导入 Werkzeug 异常，以便在 except 块中检查
-    import werkzeug.exceptions
-
     print("---------------------------------------------")
     print("启动 Flask 服务器 (V5.3 - 大文件与编码修复)...")
+    print(f"JSON 解码后端: {jsonio.backend.name}")
     print(f"最大上传限制: {app.config['MAX_CONTENT_LENGTH'] / 1024 / 1024:.1f} MB")
+    if RESULTS_DIR: print(f"结果下载: /results/<文件名> -> {RESULTS_DIR}")
+    if STORE: print(f"结果保留: {STORE.directory} ({STORE.ttl / 3600:g} 小时，上限 {STORE.quota / 1048576:.0f} MB{'，按内容复用' if STORE.dedup else ''})")
     print("访问 http://127.0.0.1:5000 或 http://[你的局域网IP]:5000")
     print("按 Ctrl+C 停止服务器")
     print("---------------------------------------------")
-    app.run(debug=True, host='0.0.0.0', port=5000)
\ No newline at end of file
+    # 调试模式默认关闭，设置环境变量 FLASK_DEBUG=1 开启；共享部署请使用 python -m chat_cleaner.serve
+    app.run(debug=os.environ.get('FLASK_DEBUG') == '1', host='0.0.0.0', port=5000)
\ No newline at end of file
@@ -1,13 +1,17 @@
 import os
-from flask import Flask, render_template_string, request, send_file, flash, redirect, url_for
+from flask import Flask, request, send_file, flash, redirect, url_for
 from werkzeug.utils import secure_filename
 import io # 用于在内存中处理文件
-import json
-import re
+from chat_cleaner.core import process_chat_data_core # Markdown 清理与发言提取，正则只编译一次
+from chat_cleaner.metrics import install_metrics, record_messages, record_parse_error, record_unexpected_error # /metrics 服务指标
+from chat_cleaner.static_page import prerender, render_flash_aware # 首页预渲染；有 flash 消息时才动态渲染
+from chat_cleaner.timing import install_timing, current_timer # 分阶段计时与性能剖析
 
 app = Flask(__name__)
 app.secret_key = "another_very_secret_and_random_string_for_flash" # 生产环境应使用更安全的密钥
 app.config['MAX_CONTENT_LENGTH'] = 16 * 1024 * 1024  # 设置最大上传文件大小为16MB
+install_metrics(app)
+install_timing(app) # 各阶段耗时写入 Server-Timing 响应头和 [timing] 日志行；设置 CHAT_CLEANER_PROFILE_DIR 可开启 cProfile
 
 # --- HTML模板字符串 ---
 INDEX_HTML_STRING = """
@@ -164,73 +168,14 @@ INDEX_HTML_STRING = """
 </html>
 """
 
-# --- Markdown 清理和核心处理逻辑 (与之前相同) ---
-def clean_markdown_to_plain_text(text):
-    if not isinstance(text, str):
-        return ""
-    text = text.replace('\\n', ' ')
-    text = text.replace('\n', ' ')
-    text = re.sub(r'```[\s\S]*?```', '', text)
-    text = re.sub(r'`([^`]+)`', r'\1', text)
-    text = text.replace('`', '')
-    text = re.sub(r'\[([^\]]+)\]\([^\)]+\)', r'\1', text)
-    text = re.sub(r'!\[([^\]]*)\]\([^\)]+\)', r'\1', text)
-    text = re.sub(r'^[ \t]*#{1,6}\s+', '', text, flags=re.MULTILINE)
-    text = re.sub(r'#{1,6}\s+', '', text)
-    text = re.sub(r'\*\*(.*?)\*\*', r'\1', text)
-    text = re.sub(r'__(.*?)__', r'\1', text)
-    text = re.sub(r'\*(.*?)\*', r'\1', text)
-    text = re.sub(r'_(.*?)_', r'\1', text)
-    text = re.sub(r'~~(.*?)~~', r'\1', text)
-    text = re.sub(r'^[ \t]*>\s?', '', text, flags=re.MULTILINE)
-    text = text.replace('> ', ' ').replace('>', ' ')
-    text = re.sub(r'^[ \t]*([*-+])\s+', '', text, flags=re.MULTILINE)
-    text = re.sub(r'^[ \t]*\d+\.\s+', '', text, flags=re.MULTILINE)
-    text = text.replace('- ', ' ')
-    text = re.sub(r'^[ \t]*([-*_]){3,}[ \t]*$', '', text, flags=re.MULTILINE)
-    text = re.sub(r'\s+', ' ', text).strip()
-    return text
-
-def process_chat_data_core(json_data_string):
-    try:
-        data = json.loads(json_data_string)
-    except json.JSONDecodeError:
-        raise ValueError("上传的文件不是有效的JSON格式。")
-
-    processed_lines = []
-    def extract_and_clean(chunks_list):
-        if not isinstance(chunks_list, list):
-            return
-        for chunk in chunks_list:
-            if not isinstance(chunk, dict):
-                continue
-            role = chunk.get("role")
-            text_content = chunk.get("text")
-            formatted_role = ""
-            if role == "user":
-                formatted_role = "(user)"
-            elif role == "model":
-                formatted_role = "(model)"
-
-            if formatted_role:
-                if text_content:
-                    cleaned_text = clean_markdown_to_plain_text(text_content)
-                    if cleaned_text:
-                        processed_lines.append(f"{formatted_role}\n{cleaned_text}\n")
-
-    chunked_prompt = data.get("chunkedPrompt", {})
-    if isinstance(chunked_prompt, dict):
-        extract_and_clean(chunked_prompt.get("chunks", []))
-    extract_and_clean(data.get("pendingInputs", []))
-    return processed_lines
-# --- 核心处理逻辑结束 ---
-
 ALLOWED_EXTENSIONS = {'txt'}
 
 def allowed_file(filename):
     return '.' in filename and \
            filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
 
+INDEX_PAGE = prerender(app, INDEX_HTML_STRING)
+
 @app.route('/', methods=['GET', 'POST'])
 def index():
     if request.method == 'POST':
@@ -242,43 +187,56 @@ def index():
             flash('未选择任何文件', 'error')
             return redirect(url_for('index'))
         if file and allowed_file(file.filename):
+            timer = current_timer()
             try:
-                json_string = file.stream.read().decode("utf-8")
-                processed_data_lines = process_chat_data_core(json_string)
+                with timer.stage('read'):
+                    raw_content = file.stream.read()
+                with timer.stage('decode'):
+                    json_string = raw_content.decode("utf-8")
+                    del raw_content
+                with timer.stage('format'): # 解析 JSON 与提取发言在同一个函数里完成
+                    processed_data_lines = process_chat_data_core(json_string)
+                record_messages(len(processed_data_lines))
 
                 if not processed_data_lines:
                     flash('处理后的内容为空，请检查JSON结构或内容是否符合预期。', 'warning')
                     return redirect(url_for('index'))
 
-                output_text_content = "\n".join(processed_data_lines)
+                with timer.stage('encode'):
+                    output_text_content = "\n".join(processed_data_lines)
 
-                str_io = io.BytesIO()
-                str_io.write(output_text_content.encode('utf-8'))
-                str_io.seek(0)
+                    str_io = io.BytesIO()
+                    str_io.write(output_text_content.encode('utf-8'))
+                    str_io.seek(0)
 
                 original_filename = secure_filename(file.filename)
                 download_filename = f"cleaned_{os.path.splitext(original_filename)[0]}.txt"
 
-                return send_file(
-                    str_io,
-                    mimetype='text/plain',
-                    as_attachment=True,
-                    download_name=download_filename
-                )
+                with timer.stage('send_file'):
+                    return send_file(
+                        str_io,
+                        mimetype='text/plain',
+                        as_attachment=True,
+                        download_name=download_filename
+                    )
 
             except ValueError as e:
+                # 无效 JSON 会被包装成 ValueError，统计时记录原始的 JSONDecodeError
+                record_parse_error(e.__context__ or e)
                 flash(str(e), 'error')
                 return redirect(url_for('index'))
             except Exception as e:
+                record_unexpected_error(e) # 不是输入数据的问题，不计入解析错误
                 flash(f'处理文件时发生未知错误: {str(e)}', 'error')
                 return redirect(url_for('index'))
         else:
             flash('只允许上传 .txt 格式的文件', 'error')
             return redirect(url_for('index'))
 
-    # 渲染嵌入的HTML字符串
-    return render_template_string(INDEX_HTML_STRING)
+    # 没有 flash 消息时直接返回启动时预渲染好的页面
+    return render_flash_aware(INDEX_PAGE, INDEX_HTML_STRING)
 
 if __name__ == '__main__':
     # 现在不需要自动创建 templates 文件夹或 index.html 文件了
-    app.run(debug=True, host='0.0.0.0', port=5000)
\ No newline at end of file
+    # 调试模式默认关闭，设置环境变量 FLASK_DEBUG=1 开启；共享部署请使用 python -m chat_cleaner.serve
+    app.run(debug=os.environ.get('FLASK_DEBUG') == '1', host='0.0.0.0', port=5000)
\ No newline at end of file
@@ -0,0 +1,105 @@
+# -*- coding: utf-8 -*-
+"""
+活跃度统计 (chat_cleaner.core.analytics) 的耗时：NumPy 批量统计与逐条 Python 循环对比。
+
+用法:
+    python benchmarks/bench_analytics.py [--messages 10000000] [--loop-messages 1000000]
+
+消息只带 timestamp 字段 (ChatMessage 记录，与 jsonio.load_messages 的结果相同)，
+间隔在几秒到几小时之间随机，约 2% 的时间戳带 +08:00 偏移、缺失或无法解析。
+Python 循环只跑 --loop-messages 条，按比例换算到 --messages 条。
+"""
+import argparse
+import os
+import sys
+import time
+from collections import Counter
+from datetime import datetime, timedelta, timezone
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from chat_cleaner.core.analytics import analyze_activity  # noqa: E402
+from chat_cleaner.core.timezones import TargetTimezone  # noqa: E402
+from chat_cleaner.records import ChatMessage  # noqa: E402
+
+
+def make_messages(count, seed=0):
+    rng = np.random.default_rng(seed)
+    # 大多数间隔几秒到几分钟，偶尔停几个小时
+    gaps = np.where(rng.random(count) < 0.01, rng.integers(3600, 6 * 3600, count), rng.integers(1, 120, count))
+    times = np.datetime64('2024-05-01T00:00:00', 'ms') + np.cumsum(gaps).astype('timedelta64[s]')
+    stamps = np.datetime_as_string(times, unit='ms', timezone='UTC').tolist()
+    irregular = np.flatnonzero(rng.random(count) < 0.02).tolist()
+    for i in irregular:
+        kind = i % 3
+        if kind == 0:
+            stamps[i] = None
+        elif kind == 1:
+            stamps[i] = stamps[i][:-1] + '+08:00'
+        else:
+            stamps[i] = stamps[i][:19] + ' 北京时间'
+    messages = []
+    for stamp in stamps:
+        message = ChatMessage()
+        if stamp is not None:
+            message.timestamp = stamp
+        messages.append(message)
+    return messages
+
+
+def python_loop(messages, session_gap, tz):
+    """以前的做法：格式化之后逐条解析时间戳再统计。"""
+    gap = timedelta(minutes=session_gap)
+    hourly, daily = Counter(), Counter()
+    sessions, previous = 0, None
+    for message in messages:
+        stamp = message.get('timestamp')
+        if not stamp:
+            continue
+        try:
+            dt = datetime.fromisoformat(stamp.replace('Z', '+00:00'))
+        except ValueError:
+            continue
+        if dt.tzinfo is None:
+            dt = dt.replace(tzinfo=timezone.utc)
+        if previous is None or dt - previous > gap:
+            sessions += 1
+        previous = dt
+        local = dt.astimezone(tz)
+        hourly[local.hour] += 1
+        daily[local.date()] += 1
+    return sessions, hourly, daily
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--messages', type=int, default=10000000)
+    parser.add_argument('--loop-messages', type=int, default=1000000, help='Python 循环实际处理的消息数')
+    parser.add_argument('--session-gap', type=float, default=30, help='分钟')
+    parser.add_argument('--timezone', default='Asia/Shanghai')
+    args = parser.parse_args()
+
+    started = time.perf_counter()
+    messages = make_messages(args.messages)
+    print(f"生成 {len(messages)} 条消息: {time.perf_counter() - started:.1f} 秒")
+
+    target = TargetTimezone(args.timezone)
+    started = time.perf_counter()
+    report = analyze_activity(messages, args.session_gap, target)
+    vectorized = time.perf_counter() - started
+    print(f"NumPy 批量统计: {vectorized:.2f} 秒，{len(report.session_starts)} 个会话，"
+          f"时区区间查找 {target.lookups} 次")
+
+    sample = messages[:args.loop_messages]
+    started = time.perf_counter()
+    sessions, _, _ = python_loop(sample, args.session_gap, target.tz)
+    loop = (time.perf_counter() - started) * len(messages) / len(sample)
+    print(f"Python 循环: {loop:.1f} 秒 (按 {len(sample)} 条换算)，约为 NumPy 的 {loop / vectorized:.0f} 倍")
+    expected = len(analyze_activity(sample, args.session_gap).session_starts)
+    print(f"会话数核对 ({len(sample)} 条): 循环 {sessions}，NumPy {expected}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,71 @@
+# -*- coding: utf-8 -*-
+"""
+对比各 JSON 解码后端 (chat_cleaner.jsonio) 在 QQ 导出与 Gemini 导出上的速度，
+并校验格式化结果与标准库完全一致。
+
+用法:
+    python benchmarks/bench_json_backends.py [--messages 200000] [--repeat 3] [--file 导出.json]
+"""
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from chat_cleaner import jsonio  # noqa: E402
+from chat_cleaner.core import format_chat_log, process_chat_data_core  # noqa: E402
+
+import synthetic  # noqa: E402
+
+
+def best_of(repeat, func, *args):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func(*args)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--messages', type=int, default=200000)
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--file', help='使用真实 QQ 导出文件代替合成数据')
+    args = parser.parse_args()
+
+    if args.file:
+        with open(args.file, encoding='utf-8') as f:
+            qq_text = f.read()
+    else:
+        qq_text = synthetic.qq_export(args.messages)
+    gemini_text = synthetic.gemini_export(max(1, args.messages // 20))
+    qq_mb = len(qq_text.encode('utf-8')) / 1048576
+    gemini_mb = len(gemini_text.encode('utf-8')) / 1048576
+
+    backends = jsonio.available_backends()
+    print(f"已安装后端: {', '.join(b.name for b in backends)} (默认: {jsonio.backend.name})")
+    print(f"QQ 导出 {qq_mb:.1f} MB，Gemini 导出 {gemini_mb:.1f} MB")
+
+    reference = format_chat_log(jsonio.select_backend('json').load_messages(qq_text))
+    gemini_reference = process_chat_data_core(gemini_text)
+    original_backend = jsonio.backend
+    try:
+        for backend in backends:
+            qq_seconds, data = best_of(args.repeat, backend.load_messages, qq_text)
+            same = format_chat_log(data) == reference
+            del data
+            gemini_seconds, _ = best_of(args.repeat, backend.loads, gemini_text)
+            jsonio.backend = backend
+            gemini_same = process_chat_data_core(gemini_text) == gemini_reference
+            print(f"{backend.name:<10} QQ {qq_seconds:6.3f} s ({qq_mb / qq_seconds:7.1f} MB/s)   "
+                  f"Gemini {gemini_seconds:6.3f} s ({gemini_mb / gemini_seconds:7.1f} MB/s)   "
+                  f"结果一致: {'是' if same and gemini_same else '否'}")
+    finally:
+        jsonio.backend = original_backend
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,78 @@
+# -*- coding: utf-8 -*-
+"""
+JSONL 输入 (chat_cleaner.jsonl) 与 JSON 数组输入的转换吞吐对比。
+
+用法:
+    python benchmarks/bench_jsonl.py [--messages 1000000] [--workers 1,2,4] [--chunk-mb 16]
+
+同样的合成消息分别写成 JSON 数组 (.json) 和每行一条 (.jsonl)，用 chat_cleaner.convert.convert_file 转换，
+输出 MB/s (按输入大小)，并核对各种方式的输出完全相同。
+多进程的加速取决于 CPU 核数；单核机器上 workers > 1 只会多出进程间传输的开销。
+"""
+import argparse
+import filecmp
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from chat_cleaner import jsonl  # noqa: E402
+from chat_cleaner.convert import convert_file  # noqa: E402
+
+import synthetic  # noqa: E402
+
+
+def write_inputs(directory, count):
+    messages = json.loads(synthetic.qq_export(count))
+    array_path = os.path.join(directory, 'export.json')
+    lines_path = os.path.join(directory, 'export.jsonl')
+    with open(array_path, 'w', encoding='utf-8') as f:
+        json.dump(messages, f, ensure_ascii=False)
+    with open(lines_path, 'w', encoding='utf-8') as f:
+        for message in messages:
+            f.write(json.dumps(message, ensure_ascii=False))
+            f.write('\n')
+    return array_path, lines_path
+
+
+def run(label, src, dst, size, **kwargs):
+    started = time.perf_counter()
+    result = convert_file(src, dst, **kwargs)
+    elapsed = time.perf_counter() - started
+    print(f"{label:<24} {elapsed:7.2f} 秒  {size / elapsed / 1e6:7.1f} MB/s  {result['messages']} 条")
+    return elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--messages', type=int, default=1000000)
+    parser.add_argument('--workers', default=f"1,{os.cpu_count() or 1}", help='逗号分隔的进程数')
+    parser.add_argument('--chunk-mb', type=float, default=jsonl.DEFAULT_CHUNK_SIZE / 1024 / 1024, help='每个区间的大小 (MB)')
+    args = parser.parse_args()
+    jsonl.DEFAULT_CHUNK_SIZE = int(args.chunk_mb * 1024 * 1024)
+
+    directory = tempfile.mkdtemp(prefix='bench-jsonl-')
+    try:
+        started = time.perf_counter()
+        array_path, lines_path = write_inputs(directory, args.messages)
+        print(f"生成 {args.messages} 条消息: {time.perf_counter() - started:.1f} 秒，"
+              f"数组 {os.path.getsize(array_path) / 1e6:.1f} MB，JSONL {os.path.getsize(lines_path) / 1e6:.1f} MB，"
+              f"CPU {os.cpu_count()} 核")
+
+        expected = os.path.join(directory, 'array.txt')
+        baseline = run('JSON 数组', array_path, expected, os.path.getsize(array_path))
+        for workers in sorted({int(n) for n in args.workers.split(',')}):
+            dst = os.path.join(directory, f'jsonl-{workers}.txt')
+            elapsed = run(f'JSONL workers={workers}', lines_path, dst, os.path.getsize(lines_path), workers=workers)
+            same = filecmp.cmp(expected, dst, shallow=False)
+            print(f"{'':<24} 为数组的 {baseline / elapsed:.2f} 倍，输出{'相同' if same else '不同!'}")
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
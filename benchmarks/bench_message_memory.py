@@ -0,0 +1,59 @@
+# -*- coding: utf-8 -*-
+"""
+对比 json.loads 与紧凑消息记录 (chat_cleaner.records) 的内存占用。
+
+用法:
+    python benchmarks/bench_message_memory.py [--messages 200000] [--file 导出.json]
+
+不指定 --file 时会生成一份结构接近 QQ Chat Exporter 导出的合成数据。
+内存使用 tracemalloc 统计解码结果常驻部分与解码过程中的峰值。
+"""
+import argparse
+import gc
+import json
+import os
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from chat_cleaner.records import decode_messages  # noqa: E402
+
+import synthetic  # noqa: E402
+
+
+def measure(label, decode, text):
+    gc.collect()
+    tracemalloc.start()
+    start = time.perf_counter()
+    data = decode(text)
+    elapsed = time.perf_counter() - start
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print(f"{label:<22} 常驻 {current / 1048576:8.1f} MB   峰值 {peak / 1048576:8.1f} MB   耗时 {elapsed:6.2f} s")
+    del data
+    return {"current": current, "peak": peak, "seconds": elapsed}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--messages', type=int, default=200000)
+    parser.add_argument('--file', help='使用真实导出文件代替合成数据')
+    args = parser.parse_args()
+
+    if args.file:
+        with open(args.file, encoding='utf-8') as f:
+            text = f.read()
+    else:
+        text = synthetic.qq_export(args.messages)
+    print(f"输入大小: {len(text.encode('utf-8')) / 1048576:.1f} MB")
+
+    before = measure("json.loads (dict)", json.loads, text)
+    after = measure("decode_messages", decode_messages, text)
+    print(f"常驻内存减少 {100 * (1 - after['current'] / before['current']):.0f}%，"
+          f"峰值减少 {100 * (1 - after['peak'] / before['peak']):.0f}%")
+
+
+if __name__ == '__main__':
+    main()
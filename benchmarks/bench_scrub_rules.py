@@ -0,0 +1,82 @@
+# -*- coding: utf-8 -*-
+"""
+对比清理规则的两种执行方式随规则数增长的耗时:
+
+    combined   chat_cleaner.core.scrub.Scrubber，所有规则编译成一个正则，每条消息扫描一遍
+    chained    每条规则一个 re.sub，依次执行 (以前 format_chat_log 的做法)
+
+用法:
+    python benchmarks/bench_scrub_rules.py [--messages 100000] [--counts 2,5,10,25,50,100]
+
+额外规则分两组测试：固定文本 ([表情N] 之类的表情代码) 与正则 (带数字的各种标记)。
+"""
+import argparse
+import os
+import re
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from chat_cleaner import jsonio  # noqa: E402
+from chat_cleaner.core.scrub import QQ_RULES, Scrubber  # noqa: E402
+
+import synthetic  # noqa: E402
+
+
+def extra_rules(kind, count):
+    if kind == 'literal':
+        return [{"name": f"face{i}", "literal": f"[表情{i}]", "replace": ""} for i in range(count)]
+    return [{"name": f"tag{i}", "pattern": f"<tag{i}:\\d+>", "replace": ""} for i in range(count)]
+
+
+def chained(rules):
+    compiled = []
+    for rule in rules:
+        pattern = rule['pattern'] if 'pattern' in rule else re.escape(rule['literal'])
+        compiled.append((re.compile(pattern, re.IGNORECASE if rule.get('ignorecase') else 0), rule.get('replace', '')))
+
+    def run(text):
+        for regex, replace in compiled:
+            text = regex.sub(replace.replace('\\', '\\\\'), text)
+        return text
+    return run
+
+
+def best_of(repeat, func, contents):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for content in contents:
+            func(content)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--messages', type=int, default=100000)
+    parser.add_argument('--counts', default='2,5,10,25,50,100', help='规则总数 (含默认的两条)')
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    contents = [str(message.get('content', '')) for message in
+                jsonio.load_messages(synthetic.qq_export(args.messages))]
+    # 让一部分消息命中额外规则
+    contents = [f"{content}[表情{i % 7}]<tag{i % 7}:{i}>" if i % 10 == 0 else content
+                for i, content in enumerate(contents)]
+    print(f"{len(contents)} 条消息，每种方式取 {args.repeat} 次中最快的一次 (毫秒)")
+    print(f"{'规则数':>6} {'固定文本 combined':>18} {'chained':>10} {'正则 combined':>16} {'chained':>10}")
+    for total in (int(value) for value in args.counts.split(',')):
+        row = [f"{total:>8}"]
+        for kind in ('literal', 'pattern'):
+            rules = list(QQ_RULES) + extra_rules(kind, max(0, total - len(QQ_RULES)))
+            combined = best_of(args.repeat, Scrubber(rules).scrub, contents)
+            sequential = best_of(args.repeat, chained(rules), contents)
+            row.append(f"{combined * 1000:>18.0f} {sequential * 1000:>10.0f}")
+        print(' '.join(row))
+
+
+if __name__ == '__main__':
+    main()
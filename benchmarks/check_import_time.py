@@ -0,0 +1,78 @@
+# -*- coding: utf-8 -*-
+"""
+检查转换入口的导入耗时 (python -X importtime)，超出预算或导入了 Flask 等网页依赖时以非零状态退出。
+
+用法:
+    python benchmarks/check_import_time.py [--budget-ms 30] [--runs 5]
+
+每个目标在新的解释器中导入若干次，取最快的一次；耗时只统计空解释器 (python -c pass)
+本来不会导入的模块，解释器自身的启动时间不计入。tests/test_import_time.py 用同样的预算在测试中检查。
+"""
+import argparse
+import os
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# 名称 -> 在新解释器中执行的代码
+TARGETS = {
+    "chat_cleaner.core": ("import chat_cleaner.core as core; "
+                          "core.format_chat_log; core.clean_text_content; core.process_chat_data_core"),
+    "chat_cleaner.convert": "import chat_cleaner.convert",
+}
+# 这些模块只有网页版或真正解码 JSON 时才需要
+FORBIDDEN = ('flask', 'werkzeug', 'jinja2', 'click', 'itsdangerous', 'brotli', 'msgspec', 'orjson', 'simdjson')
+DEFAULT_BUDGET_MS = 30.0
+
+
+def import_times(code):
+    """返回 {模块名: 自身导入耗时 (微秒)}。"""
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c', code], cwd=ROOT,
+                            capture_output=True, text=True, check=True)
+    times = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        self_us, _, name = line[len('import time:'):].split('|')
+        times[name.strip()] = int(self_us)
+    return times
+
+
+def measure(code, baseline, runs):
+    """返回 (最快一次的额外导入耗时 (毫秒), 额外导入的模块)。"""
+    best = None
+    for _ in range(runs):
+        times = import_times(code)
+        extra = {name: us for name, us in times.items() if name not in baseline}
+        if best is None or sum(extra.values()) < sum(best.values()):
+            best = extra
+    return sum(best.values()) / 1000, best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--budget-ms', type=float, default=DEFAULT_BUDGET_MS,
+                        help=f'每个目标允许的导入耗时 (默认 {DEFAULT_BUDGET_MS:g} ms)')
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--top', type=int, default=5, help='列出最慢的几个模块')
+    args = parser.parse_args()
+
+    baseline = set(import_times('pass'))
+    failed = False
+    for name, code in TARGETS.items():
+        elapsed, modules = measure(code, baseline, args.runs)
+        forbidden = sorted(m for m in modules if m.split('.')[0] in FORBIDDEN)
+        ok = elapsed <= args.budget_ms and not forbidden
+        failed = failed or not ok
+        slowest = sorted(modules.items(), key=lambda item: -item[1])[:args.top]
+        print(f"{'通过' if ok else '失败'}  {name:<22} {elapsed:6.1f} ms / 预算 {args.budget_ms:g} ms，"
+              f"额外导入 {len(modules)} 个模块")
+        print("      最慢: " + ", ".join(f"{m} {us / 1000:.1f} ms" for m, us in slowest))
+        if forbidden:
+            print(f"      不应导入: {', '.join(forbidden)}")
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
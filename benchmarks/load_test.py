@@ -0,0 +1,414 @@
+# -*- coding: utf-8 -*-
+"""
+本地压力测试：启动服务，模拟多个用户同时上传导出文件。
+
+    python benchmarks/load_test.py                                 # 50 个用户、1–64 MB、运行 120 秒
+    python benchmarks/load_test.py --users 10 --sizes 1,4 --duration 30 --mix format=1
+    python benchmarks/load_test.py --server waitress --workers 1 --threads 16
+
+每个目标接口用 python -m chat_cleaner.serve 在本机启动一个服务 (不需要任何外部服务):
+    format    Turbo 版 POST /format        (QQ JSON，showTimestamp 按 --timestamp-ratio 随机开关)
+    process   0.9 版 POST /process         (txt，remove_timestamp 按 --timestamp-ratio 随机开关)
+    gemini    GeminiNext POST /            (AI Studio 导出)
+每个用户循环：按 --mix 的权重选接口、按 --sizes / --size-weights 选文件大小，上传并读完响应，直到 --duration 结束。
+上传内容由 synthetic.py 按目标大小生成，同一大小只生成一次，请求体分段发送，不会为每个请求复制一份。
+
+报告:
+    按接口 (与按文件大小) 的请求数、错误率、吞吐 (请求/s、上传 MB/s)、延迟 p50 / p90 / p99 / 最大
+    各服务进程 (含 gunicorn worker) 的 RSS 随时间变化，每 --sample-interval 秒采样一次
+结果 (含每个请求的明细与 RSS 曲线) 写入 benchmarks/results/load-时间.json。
+只有 200 算成功；413、503 (准入控制拒绝)、0.9 / GeminiNext 出错时重定向回首页的 302 都算错误。
+服务启动时关闭结果保存 (CHAT_CLEANER_STORE_TTL=0)；--keep-store 开启保存与按内容复用，测试重复上传直接返回的情况。
+"""
+import argparse
+import datetime
+import http.client
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import synthetic  # noqa: E402
+from run_benchmarks import RESULTS_DIR, percentile  # noqa: E402
+
+MB = 1024 * 1024
+RESPONSE_BLOCK = 256 * 1024
+
+
+# 目标接口 -> (版本, 路径, 文件字段, 文件名, 生成函数, 开关字段 (开, 关))
+TARGETS = {
+    'format': ('turbo', '/format', 'jsonFile', 'load.json', synthetic.qq_export,
+               ('showTimestamp', 'true', 'false')),
+    'process': ('0.9', '/process', 'inputFile', 'load.txt', synthetic.txt_log,
+                ('remove_timestamp', 'on', None)),
+    'gemini': ('gemini', '/', 'file', 'load.txt', synthetic.gemini_export, None),
+}
+
+
+# --- 上传内容 ---
+class Payloads(object):
+    """按 (接口, 目标大小) 生成并缓存上传内容。生成器的参数是条数，按小样本的平均大小换算。"""
+
+    def __init__(self, seed=0):
+        self.seed = seed
+        self._cache = {}
+        self._unit = {}
+        self._lock = threading.Lock()
+
+    def get(self, target, size_mb):
+        key = (target, size_mb)
+        with self._lock:
+            payload = self._cache.get(key)
+            if payload is None:
+                generate = TARGETS[target][4]
+                unit = self._unit.get(target)
+                if unit is None:
+                    unit = self._unit[target] = len(generate(2000, seed=self.seed).encode('utf-8')) / 2000
+                count = max(10, int(size_mb * MB / unit))
+                payload = self._cache[key] = generate(count, seed=self.seed).encode('utf-8')
+            return payload
+
+
+def multipart(target, payload, toggle_on):
+    """返回 (Content-Type, 分段的请求体, 总长度)；文件内容作为单独一段，不拷贝。"""
+    _, _, field, filename, _, toggle = TARGETS[target]
+    boundary = uuid.uuid4().hex
+    head = ''
+    if toggle is not None:
+        name, on, off = toggle
+        value = on if toggle_on else off
+        if value is not None:
+            head += f'--{boundary}\r\nContent-Disposition: form-data; name="{name}"\r\n\r\n{value}\r\n'
+    head += (f'--{boundary}\r\nContent-Disposition: form-data; name="{field}"; filename="{filename}"\r\n'
+             f'Content-Type: application/octet-stream\r\n\r\n')
+    parts = [head.encode('utf-8'), payload, f'\r\n--{boundary}--\r\n'.encode('ascii')]
+    return f'multipart/form-data; boundary={boundary}', parts, sum(len(part) for part in parts)
+
+
+# --- 服务 ---
+def _rss_kb(pid):
+    try:
+        with open(f'/proc/{pid}/status') as f:
+            for line in f:
+                if line.startswith('VmRSS:'):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    return 0
+
+
+def _children(pid):
+    """pid 的所有子孙进程 (gunicorn / uvicorn 的 worker)。"""
+    parents = {}
+    for name in os.listdir('/proc'):
+        if not name.isdigit():
+            continue
+        try:
+            with open(f'/proc/{name}/stat') as f:
+                ppid = int(f.read().rsplit(')', 1)[1].split()[1])
+        except (OSError, IndexError, ValueError):
+            continue
+        parents.setdefault(ppid, []).append(int(name))
+    found, pending = [], [pid]
+    while pending:
+        for child in parents.get(pending.pop(), ()):
+            found.append(child)
+            pending.append(child)
+    return found
+
+
+def tree_rss_bytes(pid):
+    """进程及其子孙进程的 RSS 之和 (字节)；没有 /proc 时用 psutil，都不可用时为 None。"""
+    if os.path.isdir('/proc'):
+        return sum(_rss_kb(p) for p in [pid] + _children(pid)) * 1024
+    try:
+        import psutil
+    except ImportError:
+        return None
+    try:
+        process = psutil.Process(pid)
+        return sum(p.memory_info().rss for p in [process] + process.children(recursive=True))
+    except psutil.Error:
+        return None
+
+
+class Server(object):
+    """用 chat_cleaner.serve 在本机启动的一个服务。"""
+
+    def __init__(self, app, port, options, log_dir):
+        self.app = app
+        self.port = port
+        self.log_path = os.path.join(log_dir, f'server-{app}.log')
+        env = dict(os.environ)
+        if options.keep_store:
+            env.setdefault('CHAT_CLEANER_STORE_TTL', '3600')
+            env['CHAT_CLEANER_STORE_DEDUP'] = '1'
+        else:
+            env['CHAT_CLEANER_STORE_TTL'] = '0'
+        command = [sys.executable, '-m', 'chat_cleaner.serve', '--app', app, '--host', '127.0.0.1',
+                   '--port', str(port), '--server', options.server, '--workers', str(options.workers),
+                   '--threads', str(options.threads), '--timeout', str(options.timeout),
+                   '--max-content-length', options.max_content_length]
+        self._log = open(self.log_path, 'wb')
+        self.process = subprocess.Popen(command, cwd=ROOT, env=env, stdout=self._log, stderr=subprocess.STDOUT)
+
+    def wait_ready(self, timeout=60):
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            if self.process.poll() is not None:
+                raise RuntimeError(f"{self.app} 服务启动失败，见 {self.log_path}")
+            try:
+                conn = http.client.HTTPConnection('127.0.0.1', self.port, timeout=5)
+                conn.request('GET', '/')
+                if conn.getresponse().status == 200:
+                    return
+            except OSError:
+                pass
+            time.sleep(0.5)
+        raise RuntimeError(f"{self.app} 服务 {timeout} 秒内没有就绪，见 {self.log_path}")
+
+    def rss(self):
+        return tree_rss_bytes(self.process.pid)
+
+    def stop(self):
+        self.process.terminate()
+        try:
+            self.process.wait(30)
+        except subprocess.TimeoutExpired:
+            self.process.kill()
+        self._log.close()
+
+
+def _free_port():
+    import socket
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+# --- 负载 ---
+def send(target, port, payload, toggle_on, timeout):
+    """发送一次上传并读完响应，返回 (状态码或异常名, 响应字节数)。"""
+    path = TARGETS[target][1]
+    content_type, parts, length = multipart(target, payload, toggle_on)
+    conn = http.client.HTTPConnection('127.0.0.1', port, timeout=timeout)
+    try:
+        conn.putrequest('POST', path)
+        conn.putheader('Content-Type', content_type)
+        conn.putheader('Content-Length', str(length))
+        conn.endheaders()
+        for part in parts:
+            conn.send(part)
+        response = conn.getresponse()
+        received = 0
+        while True:
+            block = response.read(RESPONSE_BLOCK)
+            if not block:
+                break
+            received += len(block)
+        return response.status, received
+    except (OSError, http.client.HTTPException) as e:
+        return type(e).__name__, 0
+    finally:
+        conn.close()
+
+
+def user(number, options, ports, payloads, results, lock, started, deadline):
+    rng = random.Random(options.seed * 1000 + number)
+    targets, weights = zip(*options.mix.items())
+    while time.monotonic() < deadline:
+        target = rng.choices(targets, weights)[0]
+        size_mb = rng.choices(options.sizes, options.size_weights)[0]
+        toggle_on = rng.random() < options.timestamp_ratio
+        payload = payloads.get(target, size_mb)
+        begin = time.monotonic()
+        status, received = send(target, ports[target], payload, toggle_on, options.timeout)
+        end = time.monotonic()
+        with lock:
+            results.append({"target": target, "size_mb": size_mb, "bytes_in": len(payload), "toggle": toggle_on,
+                            "start": round(begin - started, 3), "latency": round(end - begin, 4),
+                            "status": status, "bytes_out": received})
+
+
+def sample_rss(servers, interval, started, stop, samples):
+    while not stop.wait(interval):
+        point = {"t": round(time.monotonic() - started, 1)}
+        for target, server in servers.items():
+            point[target] = server.rss()
+        samples.append(point)
+
+
+# --- 报告 ---
+def summarize(records, elapsed):
+    ok = [r for r in records if r['status'] == 200]
+    latencies = [r['latency'] for r in ok]
+    errors = {}
+    for r in records:
+        if r['status'] != 200:
+            errors[str(r['status'])] = errors.get(str(r['status']), 0) + 1
+    summary = {
+        "requests": len(records),
+        "ok": len(ok),
+        "error_rate": round(1 - len(ok) / len(records), 4) if records else 0.0,
+        "errors": errors,
+        "requests_per_s": round(len(ok) / elapsed, 3),
+        "upload_mb_per_s": round(sum(r['bytes_in'] for r in ok) / MB / elapsed, 2),
+    }
+    if latencies:
+        summary.update({f"p{pct}_s": round(percentile(latencies, pct), 3) for pct in (50, 90, 99)})
+        summary["max_s"] = round(max(latencies), 3)
+    return summary
+
+
+def build_report(records, samples, options, elapsed):
+    report = {"meta": {"time": datetime.datetime.now().isoformat(timespec='seconds'),
+                       "users": options.users, "duration": options.duration, "elapsed": round(elapsed, 1),
+                       "mix": options.mix, "sizes": options.sizes, "size_weights": options.size_weights,
+                       "timestamp_ratio": options.timestamp_ratio, "server": options.server,
+                       "workers": options.workers, "threads": options.threads},
+              "targets": {}, "rss": samples, "requests": records}
+    for target in options.mix:
+        mine = [r for r in records if r['target'] == target]
+        entry = summarize(mine, elapsed)
+        entry["by_size"] = {f"{size:g}": summarize([r for r in mine if r['size_mb'] == size], elapsed)
+                            for size in options.sizes if any(r['size_mb'] == size for r in mine)}
+        series = [point[target] for point in samples if point.get(target)]
+        if series:
+            entry["rss_mb"] = {"start": round(series[0] / MB, 1), "peak": round(max(series) / MB, 1),
+                               "end": round(series[-1] / MB, 1)}
+        report["targets"][target] = entry
+    return report
+
+
+def print_report(report, rss_rows=12):
+    meta = report["meta"]
+    print(f"\n{meta['users']} 个用户，{meta['elapsed']} 秒，服务器 {meta['server']} "
+          f"({meta['workers']} 进程 × {meta['threads']} 线程)")
+    for target, r in report["targets"].items():
+        latency = (f"p50 {r['p50_s']:.2f} s  p90 {r['p90_s']:.2f} s  p99 {r['p99_s']:.2f} s  最大 {r['max_s']:.2f} s"
+                   if r['ok'] else "没有成功的请求")
+        print(f"\n  {target:<8} {r['requests']} 个请求，错误率 {r['error_rate'] * 100:.1f}% {r['errors'] or ''}")
+        print(f"           {r['requests_per_s']:.2f} 请求/s，上传 {r['upload_mb_per_s']:.1f} MB/s，{latency}")
+        for size, s in r["by_size"].items():
+            p50 = f"p50 {s['p50_s']:.2f} s  p99 {s['p99_s']:.2f} s" if s['ok'] else ""
+            print(f"           {size:>5} MB  {s['requests']:5d} 个  错误 {s['error_rate'] * 100:5.1f}%  {p50}")
+        if "rss_mb" in r:
+            rss = r["rss_mb"]
+            print(f"           服务 RSS: 开始 {rss['start']} MB，峰值 {rss['peak']} MB，结束 {rss['end']} MB")
+    samples = report["rss"]
+    if samples:
+        print("\n  服务 RSS (MB) 随时间变化:")
+        step = max(1, len(samples) // rss_rows)
+        names = list(report["targets"])
+        print("    " + f"{'秒':>7}" + "".join(f"{name:>10}" for name in names))
+        for point in samples[::step]:
+            cells = "".join(f"{(point.get(name) or 0) / MB:10.0f}" for name in names)
+            print(f"    {point['t']:7.1f}{cells}")
+
+
+def _parse_mix(text):
+    mix = {}
+    for item in text.split(','):
+        name, _, weight = item.partition('=')
+        name = name.strip()
+        if name not in TARGETS:
+            raise argparse.ArgumentTypeError(f"未知接口 {name}，可选: {', '.join(TARGETS)}")
+        mix[name] = float(weight or 1)
+    return {name: weight for name, weight in mix.items() if weight > 0}
+
+
+def _numbers(kind):
+    return lambda text: [kind(item) for item in text.split(',') if item.strip()]
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--users', type=int, default=50, help='并发用户数')
+    parser.add_argument('--duration', type=float, default=120, help='持续秒数 (进行中的请求会等它完成)')
+    parser.add_argument('--mix', type=_parse_mix, default=_parse_mix('format=6,process=2,gemini=2'),
+                        help='接口权重，例如 format=6,process=2,gemini=2')
+    parser.add_argument('--sizes', type=_numbers(float), default=[1, 2, 4, 8, 16, 32, 64], help='上传大小 (MB)')
+    parser.add_argument('--size-weights', type=_numbers(float), help='各大小的权重 (默认相同)')
+    parser.add_argument('--timestamp-ratio', type=float, default=0.5,
+                        help='时间戳开关打开的比例 (format 的 showTimestamp、process 的 remove_timestamp)')
+    parser.add_argument('--server', default='auto', choices=('auto', 'gunicorn', 'waitress', 'werkzeug', 'uvicorn'))
+    parser.add_argument('--workers', type=int, default=min(8, (os.cpu_count() or 1) * 2))
+    parser.add_argument('--threads', type=int, default=8)
+    parser.add_argument('--timeout', type=int, default=600, help='服务与客户端的超时 (秒)')
+    parser.add_argument('--max-content-length', default='80M', help='各服务的上传上限，需大于最大的 --sizes')
+    parser.add_argument('--sample-interval', type=float, default=1.0, help='RSS 采样间隔 (秒)')
+    parser.add_argument('--keep-store', action='store_true', help='不关闭结果保存 (测试重复上传直接返回的情况)')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', help='结果 JSON 路径 (默认 benchmarks/results/load-时间.json)')
+    return parser
+
+
+def main(argv=None):
+    options = build_parser().parse_args(argv)
+    if not options.mix:
+        print("--mix 中没有权重大于 0 的接口")
+        return 2
+    if options.size_weights is None:
+        options.size_weights = [1] * len(options.sizes)
+    if len(options.size_weights) != len(options.sizes):
+        print("--size-weights 的个数必须与 --sizes 相同")
+        return 2
+
+    payloads = Payloads(options.seed)
+    started = time.perf_counter()
+    for target in options.mix:
+        for size in options.sizes:
+            payloads.get(target, size)
+    print(f"生成上传内容: {time.perf_counter() - started:.1f} 秒")
+
+    log_dir = tempfile.mkdtemp(prefix='chat-cleaner-load-')
+    servers = {}
+    try:
+        for target in options.mix:
+            servers[target] = Server(TARGETS[target][0], _free_port(), options, log_dir)
+        for server in servers.values():
+            server.wait_ready()
+        print(f"服务已启动 ({', '.join(f'{t}: {s.app} :{s.port}' for t, s in servers.items())})，日志在 {log_dir}")
+
+        ports = {target: server.port for target, server in servers.items()}
+        records, samples = [], []
+        lock, stop = threading.Lock(), threading.Event()
+        started = time.monotonic()
+        deadline = started + options.duration
+        sampler = threading.Thread(target=sample_rss, args=(servers, options.sample_interval, started, stop, samples),
+                                   daemon=True)
+        sampler.start()
+        with ThreadPoolExecutor(max_workers=options.users) as executor:
+            for future in [executor.submit(user, number, options, ports, payloads, records, lock, started, deadline)
+                           for number in range(options.users)]:
+                future.result()
+        elapsed = time.monotonic() - started
+        stop.set()
+        sampler.join()
+    finally:
+        for server in servers.values():
+            server.stop()
+
+    report = build_report(records, samples, options, elapsed)
+    output = options.output
+    if not output:
+        os.makedirs(RESULTS_DIR, exist_ok=True)
+        output = os.path.join(RESULTS_DIR, f"load-{datetime.datetime.now():%Y%m%d-%H%M%S}.json")
+    with open(output, 'w', encoding='utf-8') as f:
+        json.dump(report, f, ensure_ascii=False, indent=1)
+    print_report(report)
+    print(f"\n结果已写入 {output}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,256 @@
+# -*- coding: utf-8 -*-
+"""
+基准测试套件。
+
+对 chat_cleaner.core 中的清理引擎 (QQ JSON 格式化的 1.1 / Turbo 与 1.0 两种规则、0.9 txt 清理、
+Gemini markdown 清理) 与各版本的上传接口做吞吐和延迟测试，结果写入 JSON 文件，便于比较不同时间的运行结果。
+
+用法:
+    python benchmarks/run_benchmarks.py                       # 默认规模
+    python benchmarks/run_benchmarks.py --scale 0.1           # 快速冒烟
+    python benchmarks/run_benchmarks.py --compare benchmarks/results/上次的结果.json
+
+报告内容:
+    引擎   吞吐 (MB/s、消息/s)、最佳耗时、该阶段的峰值 RSS
+    接口   通过 Flask test client 请求的 p50 / p99 延迟
+"""
+import argparse
+import contextlib
+import datetime
+import io
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from chat_cleaner import core, jsonio  # noqa: E402
+from chat_cleaner.apps import load_module  # noqa: E402
+
+import synthetic  # noqa: E402
+
+RESULTS_DIR = os.path.join(ROOT, 'benchmarks', 'results')
+
+
+# --- 内存 ---
+def reset_peak_rss():
+    """尽量把峰值 RSS 清零 (仅 Linux 支持)，使每个阶段的峰值互不影响。"""
+    try:
+        with open('/proc/self/clear_refs', 'w') as f:
+            f.write('5')
+        return True
+    except OSError:
+        return False
+
+
+def peak_rss_bytes():
+    """返回进程的峰值 RSS (字节)，无法获取时返回 None。"""
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    try:
+        import resource
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak if sys.platform == 'darwin' else peak * 1024
+    except ImportError:
+        pass
+    try:
+        import psutil
+        return psutil.Process().memory_info().peak_wset  # Windows
+    except (ImportError, AttributeError):
+        return None
+
+
+def _mb(value):
+    return None if value is None else round(value / 1048576, 2)
+
+
+# --- 引擎吞吐 ---
+def bench_engine(func, arg, size_bytes, messages, repeat):
+    reset_peak_rss()
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func(arg)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return {
+        "seconds": round(best, 4),
+        "input_mb": _mb(size_bytes),
+        "mb_per_s": round(size_bytes / 1048576 / best, 2),
+        "messages": messages,
+        "messages_per_s": round(messages / best, 1),
+        "peak_rss_mb": _mb(peak_rss_bytes()),
+    }
+
+
+# --- 接口延迟 ---
+def percentile(values, pct):
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, int(round(pct / 100 * (len(ordered) - 1)))))
+    return ordered[index]
+
+
+def bench_route(app, method, path, make_data, requests):
+    client = app.test_client()
+    latencies = []
+    statuses = {}
+    reset_peak_rss()
+    # 各版本会为每个请求打印进度，输出到控制台的开销不计入对比，但格式化字符串的开销仍保留
+    with contextlib.redirect_stdout(io.StringIO()) as sink:
+        for _ in range(requests):
+            data = make_data() if make_data else None
+            start = time.perf_counter()
+            response = client.open(path, method=method, data=data)
+            response.get_data()
+            latencies.append(time.perf_counter() - start)
+            statuses[response.status_code] = statuses.get(response.status_code, 0) + 1
+            sink.seek(0)
+            sink.truncate()
+    return {
+        "requests": requests,
+        "p50_ms": round(percentile(latencies, 50) * 1000, 2),
+        "p99_ms": round(percentile(latencies, 99) * 1000, 2),
+        "max_ms": round(max(latencies) * 1000, 2),
+        "status": {str(k): v for k, v in sorted(statuses.items())},
+        "peak_rss_mb": _mb(peak_rss_bytes()),
+    }
+
+
+def _upload(field, name, payload, **form):
+    def make_data():
+        data = {field: (io.BytesIO(payload), name)}
+        data.update(form)
+        return data
+    return make_data
+
+
+# --- 运行 ---
+def run(scale, repeat, requests):
+    turbo = load_module('turbo')
+    v09 = load_module('0.9')
+    gemini = load_module('gemini')
+
+    qq_count = max(100, int(200000 * scale))
+    txt_lines = max(100, int(500000 * scale))
+    gemini_turns = max(10, int(20000 * scale))
+
+    qq_text = synthetic.qq_export(qq_count)
+    txt_text = synthetic.txt_log(txt_lines)
+    gemini_text = synthetic.gemini_export(gemini_turns)
+    qq_size = len(qq_text.encode('utf-8'))
+    qq_data = jsonio.load_messages(qq_text)
+
+    engines = {}
+    with contextlib.redirect_stdout(io.StringIO()):
+        engines["qq_decode"] = bench_engine(jsonio.load_messages, qq_text, qq_size, qq_count, repeat)
+        engines["qq_format"] = bench_engine(core.format_chat_log, qq_data, qq_size, qq_count, repeat)
+        engines["qq_format_1.0"] = bench_engine(
+            lambda data: core.format_chat_log(data, missing_timestamp='skip', unparsable_timestamp='raw'),
+            qq_data, qq_size, qq_count, repeat)
+        engines["qq_format_pseudonym"] = bench_engine(
+            lambda data: core.format_chat_log(data, pseudonymizer=core.Pseudonymizer()),
+            qq_data, qq_size, qq_count, repeat)
+        engines["qq_format_tz"] = bench_engine(
+            lambda data: core.format_chat_log(data, target_timezone=core.TargetTimezone('America/New_York')),
+            qq_data, qq_size, qq_count, repeat)
+        engines["qq_format_repeats"] = bench_engine(
+            lambda data: core.format_chat_log(data, repeats=core.RepeatCollapser()),
+            qq_data, qq_size, qq_count, repeat)
+    engines["txt_clean"] = bench_engine(core.clean_text_content, txt_text, len(txt_text.encode('utf-8')),
+                                        txt_lines, repeat)
+    engines["gemini_clean"] = bench_engine(core.process_chat_data_core, gemini_text,
+                                           len(gemini_text.encode('utf-8')), gemini_turns * 2, repeat)
+    del qq_data
+
+    # 接口延迟使用较小的文件，主要反映单个请求的开销
+    small_qq = synthetic.qq_export(max(100, qq_count // 100), seed=1).encode('utf-8')
+    small_txt = synthetic.txt_log(max(100, txt_lines // 100), seed=1).encode('utf-8')
+    small_gemini = synthetic.gemini_export(max(10, gemini_turns // 100), seed=1).encode('utf-8')
+    routes = {
+        "turbo GET /": bench_route(turbo.app, 'GET', '/', None, requests),
+        "turbo POST /format": bench_route(turbo.app, 'POST', '/format',
+                                          _upload('jsonFile', 'bench.json', small_qq, showTimestamp='true'), requests),
+        "0.9 POST /process": bench_route(v09.app, 'POST', '/process',
+                                         _upload('inputFile', 'bench.txt', small_txt, remove_timestamp='on'), requests),
+        "gemini POST /": bench_route(gemini.app, 'POST', '/',
+                                     _upload('file', 'bench.txt', small_gemini), requests),
+    }
+    return {"engines": engines, "routes": routes}
+
+
+def metadata(scale, repeat, requests):
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT, capture_output=True,
+                                text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {
+        "time": datetime.datetime.now().isoformat(timespec='seconds'),
+        "commit": commit,
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "json_backend": jsonio.backend.name,
+        "scale": scale,
+        "repeat": repeat,
+        "requests": requests,
+    }
+
+
+def print_report(report, previous=None):
+    def change(section, key, metric, value):
+        if not previous:
+            return ""
+        old = previous.get(section, {}).get(key, {}).get(metric)
+        if not old or value is None:
+            return ""
+        return f" ({(value / old - 1) * 100:+.0f}%)"
+
+    print(f"提交 {report['meta']['commit']}，Python {report['meta']['python']}，JSON 后端 {report['meta']['json_backend']}")
+    print("\n引擎吞吐:")
+    for name, r in report["engines"].items():
+        print(f"  {name:<14} {r['mb_per_s']:8.1f} MB/s{change('engines', name, 'mb_per_s', r['mb_per_s'])}"
+              f"  {r['messages_per_s']:12.0f} 条/s  {r['seconds']:7.3f} s  峰值 RSS {r['peak_rss_mb']} MB")
+    print("\n接口延迟:")
+    for name, r in report["routes"].items():
+        print(f"  {name:<20} p50 {r['p50_ms']:7.2f} ms{change('routes', name, 'p50_ms', r['p50_ms'])}"
+              f"  p99 {r['p99_ms']:7.2f} ms{change('routes', name, 'p99_ms', r['p99_ms'])}  状态 {r['status']}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="次元文本整理术基准测试")
+    parser.add_argument('--scale', type=float, default=1.0, help='数据规模系数 (1.0 约为 20 万条 QQ 消息)')
+    parser.add_argument('--repeat', type=int, default=3, help='引擎测试重复次数，取最佳值')
+    parser.add_argument('--requests', type=int, default=200, help='每个接口的请求次数')
+    parser.add_argument('--output', help='结果 JSON 路径 (默认 benchmarks/results/bench-时间.json)')
+    parser.add_argument('--compare', help='与之前的结果 JSON 对比')
+    args = parser.parse_args()
+
+    report = {"meta": metadata(args.scale, args.repeat, args.requests)}
+    report.update(run(args.scale, args.repeat, args.requests))
+
+    output = args.output
+    if not output:
+        os.makedirs(RESULTS_DIR, exist_ok=True)
+        output = os.path.join(RESULTS_DIR, f"bench-{datetime.datetime.now():%Y%m%d-%H%M%S}.json")
+    with open(output, 'w', encoding='utf-8') as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+
+    previous = None
+    if args.compare:
+        with open(args.compare, encoding='utf-8') as f:
+            previous = json.load(f)
+    print_report(report, previous)
+    print(f"\n结果已写入 {output}")
+
+
+if __name__ == '__main__':
+    main()
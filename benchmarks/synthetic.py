@@ -0,0 +1,137 @@
+# -*- coding: utf-8 -*-
+"""
+确定性的合成数据生成器，供基准测试使用。
+
+同样的参数与 seed 总是生成同样的内容，不同时间的测试结果才有可比性。
+    qq_export      QQ Chat Exporter 风格的 JSON (1.x / Turbo 使用)
+    txt_log        0.9 版处理的 txt 聊天记录
+    gemini_export  AI Studio 导出的 chunkedPrompt 文件 (GeminiNext 使用)
+"""
+import json
+import random
+import zlib
+
+_WORDS = ("今天", "晚上", "一起", "打游戏", "哈哈哈", "好的", "收到", "明天见", "这个", "真的",
+          "可以", "不行", "吃饭", "开会", "文件", "看看", "+1", "？", "ok", "辛苦了")
+
+
+def _sentence(rng, low=1, high=12):
+    return "".join(rng.choice(_WORDS) for _ in range(rng.randint(low, high)))
+
+
+def _senders(rng, count):
+    return [f"群友{i:03d}_{rng.choice(_WORDS)}" for i in range(count)]
+
+
+def qq_export(count, media_ratio=0.1, irregular_ratio=0.02, senders=200, seed=0):
+    """
+    生成 QQ 聊天记录 JSON 文本。
+
+    Args:
+        count (int): 消息条数。
+        media_ratio (float): 带 [图片]/[视频] 路径的消息比例。
+        irregular_ratio (float): 时间戳不规则的消息比例 (缺失、带时区偏移、无法解析、乱序)。
+        senders (int): 发送者人数。
+        seed (int): 随机种子。
+    Returns:
+        UTF-8 JSON 字符串，顶层为消息列表。
+    """
+    rng = random.Random(seed)
+    names = _senders(rng, senders)
+    base = 1714521600  # 2024-05-01T00:00:00Z
+    messages = []
+    for i in range(count):
+        sender = rng.choice(names)
+        if rng.random() < media_ratio:
+            kind = "图片" if rng.random() < 0.8 else "视频"
+            ext = "jpg" if kind == "图片" else "mp4"
+            content = f"{_sentence(rng, 0, 3)}[{kind}] 路径: C:/Users/qq/Documents/Tencent Files/{rng.getrandbits(48):012x}.{ext}"
+        else:
+            content = _sentence(rng)
+        ts = base + i * 37 + rng.randint(0, 30)
+        message = {
+            "id": str(7300000000000000000 + i),
+            "seq": str(100000 + i),
+            "timestamp": _iso(ts),
+            "sender": sender,
+            "senderUid": f"u_{zlib.crc32(sender.encode('utf-8')):010d}",
+            "type": "text",
+            "content": content,
+            "elements": [{"type": "text", "data": {"text": content}}],
+            "resources": [],
+            "recalled": False,
+            "system": False,
+        }
+        if rng.random() < irregular_ratio:
+            kind = rng.randrange(4)
+            if kind == 0:
+                del message["timestamp"]
+            elif kind == 1:
+                message["timestamp"] = _iso(ts, "+08:00")
+            elif kind == 2:
+                message["timestamp"] = f"{_iso(ts)[:19]} 北京时间"
+            else:
+                message["timestamp"] = _iso(ts - rng.randint(3600, 86400))
+        messages.append(message)
+    return json.dumps(messages, ensure_ascii=False)
+
+
+def _iso(ts, suffix="Z"):
+    days, rem = divmod(ts, 86400)
+    hour, rem = divmod(rem, 3600)
+    minute, second = divmod(rem, 60)
+    # 2024-05 之后的日期用简单的月份推算即可，生成器不需要真实日历
+    month, day = divmod(days - 19844, 28)
+    return f"2024-{5 + month % 8:02d}-{1 + day:02d}T{hour:02d}:{minute:02d}:{second:02d}.000{suffix}"
+
+
+def txt_log(lines, media_ratio=0.1, timestamp_ratio=0.9, seed=0):
+    """
+    生成 0.9 版处理的 txt 聊天记录：行首可能带数字时间戳，行尾可能带媒体路径。
+
+    Args:
+        lines (int): 行数。
+        media_ratio (float): 带 [图片]/[视频] 路径的行比例。
+        timestamp_ratio (float): 行首带数字时间戳的行比例。
+        seed (int): 随机种子。
+    """
+    rng = random.Random(seed)
+    names = _senders(rng, 50)
+    out = []
+    for i in range(lines):
+        if rng.random() < 0.05:
+            out.append("")
+            continue
+        line = f"{rng.choice(names)}: {_sentence(rng)}"
+        if rng.random() < media_ratio:
+            marker = "[图片] 路径: " if rng.random() < 0.8 else "[视频] 路径: "
+            line += f" {marker}D:/QQ/{rng.getrandbits(48):012x}.dat"
+        if rng.random() < timestamp_ratio:
+            line = f"{1714521600 + i * 13}  {line}"
+        out.append(line)
+    return "\n".join(out)
+
+
+def gemini_export(turns, seed=0):
+    """
+    生成 AI Studio 导出文件 (chunkedPrompt 结构)，模型回复带有常见的 markdown 元素。
+
+    Args:
+        turns (int): 问答轮数。
+        seed (int): 随机种子。
+    """
+    rng = random.Random(seed)
+    chunks = []
+    for i in range(turns):
+        chunks.append({"role": "user", "text": f"第 {i} 个问题：{_sentence(rng)} **重点** `code`", "tokenCount": 20})
+        answer = [f"## {_sentence(rng, 1, 3)}"]
+        for _ in range(rng.randint(1, 5)):
+            answer.append(f"- {_sentence(rng)} [链接](https://example.com/{i})")
+        if rng.random() < 0.3:
+            answer.append("```python\nprint('hello')\n```")
+        answer.append(f"> {_sentence(rng)}\n\n1. *第一步*\n2. __第二步__\n\n---")
+        chunks.append({"role": "model", "text": "\n".join(answer), "tokenCount": 200, "finishReason": "STOP"})
+    return json.dumps({"runSettings": {"model": "models/gemini-2.5-pro", "temperature": 1},
+                       "systemInstruction": {},
+                       "chunkedPrompt": {"chunks": chunks},
+                       "pendingInputs": [{"role": "user", "text": ""}]}, ensure_ascii=False)
@@ -0,0 +1,7 @@
+# -*- coding: utf-8 -*-
+"""
+次元文本整理术的公共模块。
+
+各个 WebUI 脚本 (0.9 / 1.x / GeminiNext) 共用的逻辑放在这里，
+脚本本身仍然可以单文件运行，只需要与本目录放在一起。
+"""
@@ -0,0 +1,178 @@
+# -*- coding: utf-8 -*-
+"""
+按内存预算的准入控制。
+
+一个上传请求在处理过程中需要的内存约为上传大小的数倍 (原始 bytes、解码后的 str、
+消息记录、输出 str、BytesIO)，几个 64 MB 的上传同时到达就可能把进程撑爆。
+install_admission(app) 之后，每个带请求体的请求在读取上传内容之前先按
+Content-Length × 系数 估算内存并向全局预算申请:
+
+    * 预算够用时立即放行，响应发送完毕后归还
+    * 不够时排队等待 (先到先得)，最多等 CHAT_CLEANER_ADMISSION_WAIT 秒 (默认 10)
+    * 仍然不够则返回 503，并带 Retry-After 头，浏览器/客户端稍后重试即可
+    * Content-Length 超过 MAX_CONTENT_LENGTH 的请求直接返回 413，不申请预算、不排队
+
+预算用 CHAT_CLEANER_MEMORY_BUDGET 设置 (例如 2G)，按进程计算。
+默认取物理内存的一半再除以 worker 进程数 (CHAT_CLEANER_WORKERS，python -m chat_cleaner.serve 会按实际的
+进程数设置)，所有 worker 加起来不超过物理内存的一半。
+"""
+import collections
+import math
+import os
+import threading
+import time
+
+from flask import g, jsonify, request
+
+from chat_cleaner.metrics import registry
+from chat_cleaner.timing import call_after_send
+
+BUDGET_ENV = 'CHAT_CLEANER_MEMORY_BUDGET'
+WAIT_ENV = 'CHAT_CLEANER_ADMISSION_WAIT'
+WORKERS_ENV = 'CHAT_CLEANER_WORKERS'
+
+# 每字节上传所需内存的估计值，实测 Turbo 峰值约为上传大小的 3.8 倍
+DEFAULT_FACTOR = 4.0
+# 与上传大小无关的固定开销 (请求对象、multipart 解析缓冲等)
+BASE_COST = 1024 * 1024
+
+
+def default_budget(workers=None):
+    """
+    每个进程的默认预算：物理内存的一半 (无法获取时为 1 GB) 平分给所有 worker 进程。
+
+    Args:
+        workers (int): worker 进程数；为空时读取 CHAT_CLEANER_WORKERS，默认 1。
+    """
+    if workers is None:
+        workers = int(os.environ.get(WORKERS_ENV) or 1)
+    try:
+        total = os.sysconf('SC_PHYS_PAGES') * os.sysconf('SC_PAGE_SIZE') // 2
+    except (AttributeError, ValueError, OSError):
+        total = 1024 ** 3
+    return total // max(1, workers)
+
+
+class MemoryBudget(object):
+    """
+    线程安全的内存预算，按申请顺序排队。
+
+    Args:
+        limit (int): 预算总量 (字节)。
+    """
+
+    def __init__(self, limit):
+        self.limit = limit
+        self.in_use = 0
+        self._cond = threading.Condition()
+        self._queue = collections.deque()
+
+    def acquire(self, amount, timeout):
+        """
+        申请 amount 字节，最多等待 timeout 秒。
+
+        单个请求的估算超过整个预算时按整个预算计算 (等其他请求都结束后单独处理)。
+
+        Returns:
+            int: 实际占用的字节数 (归还时传给 release)；超时返回 None。
+        """
+        amount = min(amount, self.limit)
+        deadline = time.monotonic() + timeout
+        ticket = object()
+        with self._cond:
+            self._queue.append(ticket)
+            try:
+                # 只有排在队首的请求可以占用预算，大请求不会被源源不断的小请求饿死
+                while self._queue[0] is not ticket or self.in_use + amount > self.limit:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        return None
+                    self._cond.wait(remaining)
+                self.in_use += amount
+                return amount
+            finally:
+                self._queue.remove(ticket)
+                self._cond.notify_all()
+
+    def release(self, amount):
+        with self._cond:
+            self.in_use -= amount
+            self._cond.notify_all()
+
+
+def install_admission(app, budget=None, factor=DEFAULT_FACTOR, wait=None, retry_after=None):
+    """
+    为 Flask app 启用按内存预算的准入控制。
+
+    Args:
+        app: Flask 应用。
+        budget (int): 每个进程的内存预算 (字节)；为空时读取 CHAT_CLEANER_MEMORY_BUDGET，
+            默认物理内存的一半除以 worker 进程数 (见 default_budget)。
+        factor (float): 每字节上传估算的内存占用。
+        wait (float): 预算不足时最多排队的秒数；为空时读取 CHAT_CLEANER_ADMISSION_WAIT，默认 10。
+        retry_after (int): 503 响应中 Retry-After 的秒数；为空时与排队时间相同。
+
+    Returns:
+        MemoryBudget: 该 app 使用的预算对象。
+    """
+    from chat_cleaner.serve import parse_size
+    if budget is None:
+        budget = parse_size(os.environ.get(BUDGET_ENV, '')) or default_budget()
+    if wait is None:
+        wait = float(os.environ.get(WAIT_ENV, '10'))
+    if retry_after is None:
+        retry_after = max(1, math.ceil(wait))
+    memory = MemoryBudget(budget)
+
+    @app.before_request
+    def _admit():
+        # 此时上传内容还没有被读取，拒绝的请求不会占用内存
+        size = request.content_length
+        max_length = app.config.get('MAX_CONTENT_LENGTH')
+        if size is None:
+            if request.method not in ('POST', 'PUT', 'PATCH'):
+                return None
+            # chunked 上传没有 Content-Length，按上限估算
+            size = max_length or 0
+        if not size:
+            return None
+        if max_length and size > max_length:
+            # 反正会被拒绝：先申请预算的话，它可能占满整个预算、挡住排在后面的请求
+            response = jsonify({"error": f"上传的文件过大，请确保小于 {max_length / 1048576:.1f} MB"})
+            response.status_code = 413
+            return response
+        reserved = memory.acquire(int(size * factor) + BASE_COST, wait)
+        if reserved is None:
+            registry.inc('chat_cleaner_admission_rejected_total')
+            print(f"[admission] 内存预算不足，拒绝 {request.method} {request.path} "
+                  f"({size / 1048576:.1f} MB，已占用 {memory.in_use / 1048576:.0f}"
+                  f"/{memory.limit / 1048576:.0f} MB)")
+            response = jsonify({"error": "服务器繁忙，请稍后重试"})
+            response.status_code = 503
+            response.headers['Retry-After'] = str(retry_after)
+            return response
+        g.admission_reserved = reserved
+        registry.inc('chat_cleaner_memory_reserved_bytes', value=reserved)
+        return None
+
+    def _release(reserved):
+        memory.release(reserved)
+        registry.inc('chat_cleaner_memory_reserved_bytes', value=-reserved)
+
+    @app.after_request
+    def _release_after_send(response):
+        reserved = g.pop('admission_reserved', None)
+        if reserved is not None:
+            # 发送 BytesIO 结果期间内存仍被占用，发送完毕才归还
+            call_after_send(response, lambda: _release(reserved))
+        return response
+
+    @app.teardown_request
+    def _release_on_error(exc):
+        # 视图抛出未处理异常时 after_request 不会执行，这里归还预算
+        reserved = g.pop('admission_reserved', None)
+        if reserved is not None:
+            _release(reserved)
+
+    print(f"准入控制：内存预算 {budget / 1048576:.0f} MB，每 MB 上传估算 {factor:g} MB，最多排队 {wait:g} 秒")
+    return memory
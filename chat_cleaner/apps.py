@@ -0,0 +1,56 @@
+# -*- coding: utf-8 -*-
+"""
+按版本名加载各个 WebUI 脚本。
+
+脚本文件名并不都是合法的模块名 (例如 "Chat Exporter cleaner 0.9.py")，
+基准测试、生产部署等工具通过这里统一加载，而不用关心具体文件名。
+"""
+import importlib
+import importlib.util
+import os
+import sys
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# 版本名 -> (脚本文件名, 导入时使用的模块名)
+SCRIPTS = {
+    '0.9': ('Chat Exporter cleaner 0.9.py', 'Chat_Exporter_cleaner_0_9'),
+    '1.0': ('Chat_Exporter_cleaner_1_0.py', 'Chat_Exporter_cleaner_1_0'),
+    '1.1': ('Chat_Exporter_cleaner_1_1.py', 'Chat_Exporter_cleaner_1_1'),
+    'turbo': ('Chat_Exporter_cleaner_1_1Turbo.py', 'Chat_Exporter_cleaner_1_1Turbo'),
+    'gemini': ('GeminiNext.py', 'GeminiNext'),
+}
+
+
+def load_module(name):
+    """
+    导入指定版本的脚本模块 (同一进程内只导入一次)。
+
+    Args:
+        name: SCRIPTS 中的版本名，例如 'turbo'、'0.9'、'gemini'。
+    Returns:
+        脚本模块对象。
+    """
+    if name not in SCRIPTS:
+        raise KeyError(f"未知的版本 '{name}'，可选: {', '.join(SCRIPTS)}")
+    filename, module_name = SCRIPTS[name]
+    if module_name in sys.modules:
+        return sys.modules[module_name]
+    if REPO_ROOT not in sys.path:
+        sys.path.insert(0, REPO_ROOT)
+    if os.path.splitext(filename)[0] == module_name:
+        return importlib.import_module(module_name)
+    spec = importlib.util.spec_from_file_location(module_name, os.path.join(REPO_ROOT, filename))
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[module_name] = module
+    try:
+        spec.loader.exec_module(module)
+    except BaseException:
+        del sys.modules[module_name]
+        raise
+    return module
+
+
+def load_app(name):
+    """返回指定版本脚本中的 Flask app。"""
+    return load_module(name).app
@@ -0,0 +1,229 @@
+# -*- coding: utf-8 -*-
+"""
+asyncio 服务入口 (ASGI)。
+
+同步 WSGI 服务器里，一个慢速客户端上传 64 MB 文件时，worker 线程会在
+file.stream.read() 里阻塞好几分钟，线程数一满，其他请求只能排队。
+这里把网络读写交给事件循环:
+
+    1. 在事件循环里异步接收请求体，写入 SpooledTemporaryFile (小请求留在内存，大请求落盘)，
+       不占用任何线程；超过 MAX_CONTENT_LENGTH 时直接返回 413
+    2. 请求体接收完整后，才把原来的 Flask app 交给线程池执行 (解析、格式化这些 CPU 工作)，
+       此时读 wsgi.input 不会再等网络
+    3. 响应体按块从线程池取出，在事件循环里异步发送给客户端
+
+Flask 视图、计时、/metrics 都不用改，同一个 app 既可以用 WSGI 也可以用 ASGI 运行。
+几百个慢速连接只需要事件循环加上少量线程。
+
+有些路由在视图里长时间等待 (分块上传的 /uploads/<id>/result 等后续的块到达，最长 2 分钟)，
+它们如果占用格式化线程池，几个同时进行的分块上传就会占满线程，自己的块 PUT 反而无法执行。
+app.config['LONG_POLL_PATHS'] 中的正则 (由 install_uploads 等注册) 匹配的请求改在单独的线程池中运行，
+线程数为 LONG_POLL_THREADS，不占用 --threads 的名额。
+
+    python -m chat_cleaner.serve --app turbo --server uvicorn --threads 4
+"""
+import asyncio
+import contextvars
+import os
+import re
+import sys
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+
+SPOOL_MAX_MEMORY = 1024 * 1024  # 超过 1 MB 的请求体写入临时文件
+RESPONSE_BATCH = 256 * 1024  # 每次从线程池取出的响应数据量，减少线程切换
+LONG_POLL_THREADS = 32  # 长时间等待的路由使用的线程数 (大部分时间在 sleep)
+
+
+class WSGIBridge(object):
+    """
+    把 WSGI app 包装为 ASGI app：请求体先异步接收完整，再在线程池中调用 WSGI app。
+
+    Args:
+        wsgi_app: Flask 应用 (或任何 WSGI 应用)。
+        threads (int): 执行 WSGI app 的线程数，也就是同时进行 CPU 工作的请求数上限。
+        max_content_length (int): 请求体大小上限；为空时读取 wsgi_app.config['MAX_CONTENT_LENGTH']。
+        long_poll_threads (int): 长时间等待的路由 (wsgi_app.config['LONG_POLL_PATHS']) 使用的线程数。
+    """
+
+    def __init__(self, wsgi_app, threads=4, max_content_length=None, long_poll_threads=LONG_POLL_THREADS):
+        self.wsgi_app = wsgi_app
+        self.executor = ThreadPoolExecutor(max_workers=threads, thread_name_prefix='chat-cleaner')
+        self.long_poll_executor = ThreadPoolExecutor(max_workers=long_poll_threads,
+                                                     thread_name_prefix='chat-cleaner-poll')
+        config = getattr(wsgi_app, 'config', {})
+        if max_content_length is None:
+            max_content_length = config.get('MAX_CONTENT_LENGTH')
+        self.max_content_length = max_content_length
+        self.long_poll_paths = [re.compile(pattern) for pattern in config.get('LONG_POLL_PATHS', ())]
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            await self._lifespan(receive, send)
+        elif scope['type'] == 'http':
+            await self._http(scope, receive, send)
+        else:
+            raise RuntimeError(f"不支持的连接类型: {scope['type']}")
+
+    async def _lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                self.executor.shutdown(wait=False)
+                self.long_poll_executor.shutdown(wait=False)
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+    async def _http(self, scope, receive, send):
+        headers = dict(scope['headers'])
+        declared = headers.get(b'content-length')
+        limit = self.max_content_length
+        if declared is not None:
+            if not declared.strip().isdigit():
+                await _plain_response(send, 400, "Content-Length 无效")
+                return
+            if limit is not None and int(declared) > limit:
+                await _plain_response(send, 413, "上传的文件过大")
+                return
+
+        body = tempfile.SpooledTemporaryFile(max_size=SPOOL_MAX_MEMORY)
+        try:
+            # 1. 异步接收请求体 (慢速客户端只占用事件循环里的一个协程)
+            size = 0
+            more_body = True
+            while more_body:
+                message = await receive()
+                if message['type'] == 'http.disconnect':
+                    return
+                chunk = message.get('body', b'')
+                size += len(chunk)
+                if limit is not None and size > limit:
+                    # 没有声明 Content-Length (chunked 上传) 时在这里拦截
+                    await _plain_response(send, 413, "上传的文件过大")
+                    return
+                if chunk:
+                    body.write(chunk)
+                more_body = message.get('more_body', False)
+            body.seek(0)
+
+            # 2. 在线程池中运行 WSGI app，请求体已经在本地，不会阻塞在网络读取上
+            loop = asyncio.get_running_loop()
+            executor = self.executor
+            if any(pattern.match(scope['path']) for pattern in self.long_poll_paths):
+                executor = self.long_poll_executor
+            # 同一个请求的各次调用可能落在不同线程上，都在同一个 Context 中执行：
+            # stream_with_context 在第一批数据时压入、最后一批时弹出 Flask 上下文 (ContextVar)
+            context = contextvars.copy_context()
+            environ = build_environ(scope, body, size)
+            started = {}
+
+            def start_response(status, response_headers, exc_info=None):
+                started['status'] = int(status.split(' ', 1)[0])
+                started['headers'] = [(name.lower().encode('latin-1'), value.encode('latin-1'))
+                                      for name, value in response_headers]
+
+            def run_app():
+                result = self.wsgi_app(environ, start_response)
+                return result, iter(result)
+
+            result, chunks = await loop.run_in_executor(executor, context.run, run_app)
+            try:
+                # 3. 按批从线程池取响应数据，异步发送
+                batch, finished = await loop.run_in_executor(executor, context.run, _next_batch, chunks)
+                await send({'type': 'http.response.start', 'status': started['status'],
+                            'headers': started['headers']})
+                while not finished:
+                    await send({'type': 'http.response.body', 'body': batch, 'more_body': True})
+                    batch, finished = await loop.run_in_executor(executor, context.run, _next_batch, chunks)
+                await send({'type': 'http.response.body', 'body': batch, 'more_body': False})
+            finally:
+                close = getattr(result, 'close', None)
+                if close is not None:
+                    # 计时日志和 /metrics 的收尾回调挂在 close() 上
+                    await loop.run_in_executor(executor, context.run, close)
+        finally:
+            body.close()
+
+
+def _next_batch(chunks):
+    """从响应迭代器中取出约 RESPONSE_BATCH 字节，返回 (数据, 是否已取完)。"""
+    parts = []
+    size = 0
+    for chunk in chunks:
+        if chunk:
+            parts.append(chunk)
+            size += len(chunk)
+        if size >= RESPONSE_BATCH:
+            return b''.join(parts), False
+    return b''.join(parts), True
+
+
+async def _plain_response(send, status, text):
+    body = text.encode('utf-8')
+    await send({'type': 'http.response.start', 'status': status,
+                'headers': [(b'content-type', b'text/plain; charset=utf-8'),
+                            (b'content-length', str(len(body)).encode('latin-1')),
+                            (b'connection', b'close')]})
+    await send({'type': 'http.response.body', 'body': body, 'more_body': False})
+
+
+def build_environ(scope, body, content_length):
+    """根据 ASGI scope 构造 WSGI environ，wsgi.input 是已接收完整的请求体。"""
+    server = scope.get('server') or ('localhost', 80)
+    client = scope.get('client') or ('', 0)
+    script_name = scope.get('root_path', '').encode('utf-8').decode('latin-1')
+    path = scope['path'].encode('utf-8').decode('latin-1')
+    if script_name and path.startswith(script_name):
+        path = path[len(script_name):]
+    environ = {
+        'REQUEST_METHOD': scope['method'],
+        'SCRIPT_NAME': script_name,
+        'PATH_INFO': path,
+        'QUERY_STRING': scope.get('query_string', b'').decode('latin-1'),
+        'SERVER_NAME': server[0],
+        'SERVER_PORT': str(server[1]),
+        'SERVER_PROTOCOL': f"HTTP/{scope.get('http_version', '1.1')}",
+        'REMOTE_ADDR': client[0],
+        'REMOTE_PORT': str(client[1]),
+        'CONTENT_LENGTH': str(content_length),
+        'wsgi.version': (1, 0),
+        'wsgi.url_scheme': scope.get('scheme', 'http'),
+        'wsgi.input': body,
+        'wsgi.errors': sys.stderr,
+        'wsgi.multithread': True,
+        'wsgi.multiprocess': True,
+        'wsgi.run_once': False,
+    }
+    for name, value in scope['headers']:
+        name = name.decode('latin-1').upper().replace('-', '_')
+        value = value.decode('latin-1')
+        if name == 'CONTENT_TYPE':
+            environ['CONTENT_TYPE'] = value
+            continue
+        if name == 'CONTENT_LENGTH':
+            continue
+        key = f"HTTP_{name}"
+        environ[key] = f"{environ[key]},{value}" if key in environ else value
+    return environ
+
+
+def create_app(name=None, threads=None, max_content_length=None):
+    """
+    加载指定版本的 Flask app 并包装为 ASGI app。
+
+    Args:
+        name (str): 版本名，见 chat_cleaner.apps.SCRIPTS；为空时读取环境变量 CHAT_CLEANER_APP。
+        threads (int): 线程池大小；为空时读取 CHAT_CLEANER_THREADS，默认 4。
+        max_content_length (int): 覆盖上传大小限制；为空时读取 CHAT_CLEANER_MAX_CONTENT_LENGTH。
+
+    Returns:
+        WSGIBridge: 可交给 uvicorn / hypercorn 运行的 ASGI app。
+    """
+    from chat_cleaner.serve import parse_size, prepare_app
+    name = name or os.environ.get('CHAT_CLEANER_APP', 'turbo')
+    threads = threads or int(os.environ.get('CHAT_CLEANER_THREADS', '4'))
+    if max_content_length is None:
+        max_content_length = parse_size(os.environ.get('CHAT_CLEANER_MAX_CONTENT_LENGTH', ''))
+    return WSGIBridge(prepare_app(name, max_content_length), threads=threads)
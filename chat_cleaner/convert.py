@@ -0,0 +1,237 @@
+# -*- coding: utf-8 -*-
+"""
+不启动网页的单文件转换，供批处理脚本和监视进程 (chat_cleaner.watch) 使用。
+
+    python -m chat_cleaner.convert 导出.json 记录.txt ... [--output 输出目录] [--no-timestamp] [--keep-txt-timestamp]
+                                   [--pseudonym-map 对照表.json [--no-mentions]] [--rules 规则.json]
+                                   [--timezone Asia/Shanghai] [--session-gap 分钟] [--stats] [--collapse-repeats [exact]]
+                                   [--workers 4]
+
+规则与网页版相同：.json 按 Turbo 版格式化为 <名称>_formatted.txt，.txt 按 0.9 版清理为 cleaned_<名称>.txt。
+.jsonl (每行一条消息) 的输出与同样内容的 .json 相同，文件按区间分给 --workers 个进程格式化 (见 chat_cleaner.jsonl)。
+指定 --pseudonym-map 时 .json 的发送者和 @提及会被替换为代号 (见 chat_cleaner.core.pseudonym)，
+对照表在所有文件转换完后写回，下一批使用同一个文件即可保持代号一致。
+--rules 指定额外的内容清理规则 (格式见 chat_cleaner.core.scrub)，结束时输出各规则的命中次数。
+--timezone 把 .json 中的时间换算到指定时区输出 (见 chat_cleaner.core.timezones)，默认原样输出 UTC 时间。
+--session-gap 在间隔超过指定分钟数的消息之间插入 "--- 新会话 ---"，--stats 输出会话数与活跃时段等统计
+(见 chat_cleaner.core.analytics，需要 NumPy)。
+--collapse-repeats 把连续重复 (或几乎相同) 的消息折叠为一条并加上条数 (见 chat_cleaner.core.repeats)，
+--collapse-repeats exact 只折叠内容完全相同的消息。
+
+批处理常常每个文件启动一个进程，所以本模块和 chat_cleaner.core 都不导入 Flask / Werkzeug，
+格式化引擎与 JSON 后端也在用到时才导入。导入耗时用 benchmarks/check_import_time.py 检查。
+"""
+import argparse
+import os
+import sys
+import time
+
+
+def output_name(path):
+    """输出文件名，与网页版下载的文件名一致。"""
+    base, ext = os.path.splitext(os.path.basename(path))
+    if ext.lower() in ('.json', '.jsonl'):
+        return f"{base}_formatted.txt"
+    return f"cleaned_{base}.txt"
+
+
+def remove_partial_outputs(dst):
+    """删除 _write_atomic 留下的 dst 临时文件 (写入的进程被杀死时来不及清理)。返回删除的个数。"""
+    directory, name = os.path.split(dst)
+    prefix = f".{name}."
+    removed = 0
+    try:
+        names = os.listdir(directory)
+    except OSError:
+        return 0
+    for entry in names:
+        if entry.startswith(prefix) and entry.endswith('.tmp') and entry[len(prefix):-4].isdigit():
+            try:
+                os.remove(os.path.join(directory, entry))
+                removed += 1
+            except OSError:
+                pass
+    return removed
+
+
+def _write_atomic(dst, write):
+    """调用 write(f) 写入 dst 旁边的临时文件，成功后原子地改名为 dst。返回 (write 的返回值, 写入的字节数)。"""
+    directory = os.path.dirname(dst)
+    os.makedirs(directory, exist_ok=True)
+    tmp = os.path.join(directory, f".{os.path.basename(dst)}.{os.getpid()}.tmp")
+    try:
+        with open(tmp, 'wb') as f:
+            result = write(f)
+            size = f.tell()
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, dst)
+    except BaseException:
+        try:
+            os.remove(tmp)
+        except OSError:
+            pass
+        raise
+    return result, size
+
+
+def convert_file(src, dst, show_timestamp=True, remove_txt_timestamp=True, pseudonymizer=None,
+                 scrubber=None, txt_scrubber=None, target_timezone=None, session_gap=None, activity=False,
+                 collapse_repeats=None, workers=1):
+    """
+    转换一个文件并原子地写入 dst。pseudonymizer 不为 None 时对 .json 输入做匿名化；
+    scrubber / txt_scrubber 为 .json / .txt 输入使用的清理规则，为 None 时使用默认规则；
+    target_timezone (TargetTimezone) 为 .json 输出时间所用的时区，为 None 时不换算；
+    session_gap (分钟) 不为 None 时在 .json 输出中插入会话分隔；activity 为 True 时在结果中附带活跃度统计；
+    collapse_repeats 为 'fuzzy' / 'exact' 时折叠 .json 中连续重复的消息，每个文件单独判定。
+    .jsonl (每行一条消息) 与 .json 的选项相同，按区间用 workers 个进程格式化 (见 chat_cleaner.jsonl)；
+    需要会话分隔或统计时整个文件一次解码。
+
+    Returns:
+        dict: 消息 (行) 数、输出字节数、耗时、格式化问题汇总、活跃度统计 (ActivityReport 或 None)
+            与折叠掉的消息数。
+
+    Raises:
+        ValueError: 输入无法解析或格式无效 (含 json.JSONDecodeError、UnicodeDecodeError)。
+    """
+    started = time.perf_counter()
+    lower = src.lower()
+    summary = activity_report = repeats = None
+    if collapse_repeats and lower.endswith(('.json', '.jsonl')):
+        from chat_cleaner.core.repeats import RepeatCollapser
+        repeats = RepeatCollapser(fuzzy=collapse_repeats != 'exact')
+
+    if lower.endswith('.jsonl') and session_gap is None and not activity:
+        from chat_cleaner.diagnostics import FormatDiagnostics
+        from chat_cleaner.jsonl import format_jsonl_file
+        diagnostics = FormatDiagnostics()
+        count, size = _write_atomic(dst, lambda f: format_jsonl_file(
+            src, f, workers=workers, show_timestamp=show_timestamp, diagnostics=diagnostics,
+            pseudonymizer=pseudonymizer, scrubber=scrubber, target_timezone=target_timezone, repeats=repeats))
+        if diagnostics:
+            summary = diagnostics.summary()
+        return {"messages": count, "bytes_out": size, "seconds": time.perf_counter() - started,
+                "issues": summary, "activity": None, "collapsed": repeats.collapsed if repeats else 0}
+
+    with open(src, 'rb') as f:
+        raw = f.read()
+    if lower.endswith(('.json', '.jsonl')):
+        from chat_cleaner import jsonio
+        from chat_cleaner.core import format_chat_log
+        from chat_cleaner.diagnostics import FormatDiagnostics
+        if lower.endswith('.jsonl'):
+            data = jsonio.load_messages_jsonl(raw)
+        else:
+            data = jsonio.load_messages(raw.decode('utf-8'))
+        del raw
+        diagnostics = FormatDiagnostics()
+        session_breaks = None
+        if (session_gap is not None or activity) and isinstance(data, list):
+            from chat_cleaner.core.analytics import DEFAULT_SESSION_GAP, analyze_activity
+            report = analyze_activity(data, DEFAULT_SESSION_GAP if session_gap is None else session_gap,
+                                      target_timezone)
+            if session_gap is not None:
+                session_breaks = report.session_breaks
+            if activity:
+                activity_report = report
+        text = format_chat_log(data, show_timestamp=show_timestamp, diagnostics=diagnostics,
+                               session_breaks=session_breaks, pseudonymizer=pseudonymizer, scrubber=scrubber,
+                               target_timezone=target_timezone, repeats=repeats)
+        if text is None:
+            raise ValueError("输入数据格式无效 (顶层不是消息列表)")
+        count = len(data)
+        if diagnostics:
+            summary = diagnostics.summary()
+    else:
+        try:
+            content = raw.decode('utf-8')
+        except UnicodeDecodeError:
+            content = raw.decode('gbk')  # 与 0.9 网页版相同的回退
+        del raw
+        from chat_cleaner.core import clean_text_content
+        text = clean_text_content(content, remove_timestamp=remove_txt_timestamp, scrubber=txt_scrubber)
+        count = text.count('\n') + 1 if text else 0
+    body = text.encode('utf-8', errors='replace')
+    del text
+    _write_atomic(dst, lambda f: f.write(body))
+    return {"messages": count, "bytes_out": len(body), "seconds": time.perf_counter() - started,
+            "issues": summary, "activity": activity_report, "collapsed": repeats.collapsed if repeats else 0}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m chat_cleaner.convert', description='转换聊天记录导出文件 (不启动网页)')
+    parser.add_argument('files', nargs='+', help='要转换的 .json / .jsonl / .txt 文件')
+    parser.add_argument('--output', help='输出目录 (默认与输入文件相同)')
+    parser.add_argument('--no-timestamp', action='store_true', help='JSON 输出中不包含时间戳行')
+    parser.add_argument('--keep-txt-timestamp', action='store_true', help='txt 输入保留行首的时间戳数字')
+    parser.add_argument('--pseudonym-map', metavar='FILE', help='匿名化 JSON 输入的发送者，代号对照表读写此文件 (不存在时新建)')
+    parser.add_argument('--no-mentions', action='store_true', help='匿名化时不改写内容中的 @提及')
+    parser.add_argument('--rules', metavar='FILE', help='额外的内容清理规则 (JSON 列表)')
+    parser.add_argument('--timezone', metavar='TZ', help='JSON 输出的时间换算到此时区 (如 Asia/Shanghai、+08:00)')
+    parser.add_argument('--session-gap', type=float, metavar='MINUTES', help='间隔超过此分钟数时插入 "--- 新会话 ---"')
+    parser.add_argument('--stats', action='store_true', help='输出 JSON 输入的会话数、活跃时段等统计')
+    parser.add_argument('--collapse-repeats', nargs='?', const='fuzzy', choices=('fuzzy', 'exact'),
+                        help='折叠连续重复的消息 (默认 fuzzy：几乎相同也折叠；exact：只折叠完全相同的)')
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1, help='.jsonl 输入的格式化进程数 (默认 CPU 核数)')
+    args = parser.parse_args(argv)
+    scrubber = txt_scrubber = None
+    if args.rules:
+        from chat_cleaner.core.scrub import TXT_RULES, build_scrubber, load_rules
+        try:
+            rules = load_rules(args.rules)
+            scrubber = build_scrubber(rules)
+            txt_scrubber = build_scrubber(rules, defaults=TXT_RULES)
+        except (OSError, ValueError) as e:
+            print(f"无法加载清理规则 {args.rules}: {e}", file=sys.stderr)
+            return 2
+    target_timezone = None
+    if args.timezone:
+        from chat_cleaner.core.timezones import TargetTimezone
+        try:
+            target_timezone = TargetTimezone(args.timezone)
+        except ValueError as e:
+            print(f"{e}", file=sys.stderr)
+            return 2
+    if args.session_gap is not None or args.stats:
+        try:
+            import chat_cleaner.core.analytics  # noqa: F401
+        except ImportError:
+            print("--session-gap / --stats 需要 NumPy，请先 pip install numpy", file=sys.stderr)
+            return 2
+    pseudonymizer = None
+    if args.pseudonym_map:
+        from chat_cleaner.core.pseudonym import Pseudonymizer
+        pseudonymizer = Pseudonymizer.load(args.pseudonym_map, mentions=not args.no_mentions)
+    failed = 0
+    for src in args.files:
+        directory = args.output or os.path.dirname(os.path.abspath(src))
+        dst = os.path.join(directory, output_name(src))
+        try:
+            result = convert_file(src, dst, show_timestamp=not args.no_timestamp,
+                                  remove_txt_timestamp=not args.keep_txt_timestamp, pseudonymizer=pseudonymizer,
+                                  scrubber=scrubber, txt_scrubber=txt_scrubber, target_timezone=target_timezone,
+                                  session_gap=args.session_gap, activity=args.stats,
+                                  collapse_repeats=args.collapse_repeats, workers=args.workers)
+        except (OSError, ValueError) as e:
+            failed += 1
+            print(f"转换失败 {src}: {type(e).__name__}: {e}", file=sys.stderr)
+            continue
+        print(f"{src} -> {dst} ({result['messages']} 条，{result['bytes_out']} 字节，{result['seconds'] * 1000:.0f} ms)")
+        if result['collapsed']:
+            print(f"  折叠了 {result['collapsed']} 条连续重复的消息")
+        if result['issues']:
+            print(f"  {result['issues']}")
+        if result['activity'] is not None:
+            print("  " + result['activity'].summary().replace("\n", "\n  "))
+    if scrubber is not None:
+        hits = {name: scrubber.hit_counts().get(name, 0) + txt_scrubber.hit_counts().get(name, 0)
+                for name in dict.fromkeys(scrubber.names + txt_scrubber.names)}
+        print("清理规则命中: " + ", ".join(f"{name} {count}" for name, count in hits.items()))
+    if pseudonymizer is not None:
+        pseudonymizer.save(args.pseudonym_map)
+        print(f"代号对照表 ({len(pseudonymizer.mapping)} 人) 已保存到 {args.pseudonym_map}，其中含有真实姓名，请勿一起发送")
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
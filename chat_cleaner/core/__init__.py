@@ -0,0 +1,53 @@
+# -*- coding: utf-8 -*-
+"""
+各版本共用的清理引擎。
+
+网页脚本、监视进程和基准测试都调用这里，性能优化只需要做一次。
+稳定的对外接口 (名称与各脚本原来的函数相同):
+
+    QQ Chat Exporter JSON    format_chat_log / format_message / format_chat_stream   (chat_cleaner.core.qq)
+    0.9 txt 记录             clean_text_content                                      (chat_cleaner.core.txt)
+    Gemini AI Studio 导出    process_chat_data_core / clean_markdown_to_plain_text   (chat_cleaner.core.gemini)
+    发送者匿名化             Pseudonymizer                                           (chat_cleaner.core.pseudonym)
+    内容清理规则             Scrubber / build_scrubber / load_rules                  (chat_cleaner.core.scrub)
+    输出时区换算             TargetTimezone                                          (chat_cleaner.core.timezones)
+    折叠连续重复消息         RepeatCollapser                                         (chat_cleaner.core.repeats)
+    活跃度统计 (需要 NumPy)  analyze_activity / message_times                        (chat_cleaner.core.analytics)
+
+子模块在第一次访问对应名称时才导入，`import chat_cleaner.core` 本身几乎没有开销，
+也不依赖 Flask。
+"""
+import importlib
+
+# 名称 -> 所在子模块
+_EXPORTS = {
+    'format_chat_log': 'qq',
+    'format_message': 'qq',
+    'format_chat_stream': 'qq',
+    'Pseudonymizer': 'pseudonym',
+    'RepeatCollapser': 'repeats',
+    'Scrubber': 'scrub',
+    'TargetTimezone': 'timezones',
+    'analyze_activity': 'analytics',
+    'message_times': 'analytics',
+    'build_scrubber': 'scrub',
+    'load_rules': 'scrub',
+    'clean_text_content': 'txt',
+    'clean_markdown_to_plain_text': 'gemini',
+    'process_chat_data_core': 'gemini',
+}
+
+__all__ = sorted(_EXPORTS)
+
+
+def __getattr__(name):
+    submodule = _EXPORTS.get(name)
+    if submodule is None:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    value = getattr(importlib.import_module(f"{__name__}.{submodule}"), name)
+    globals()[name] = value  # 之后直接从模块字典取，不再经过 __getattr__
+    return value
+
+
+def __dir__():
+    return sorted(set(globals()) | set(__all__))
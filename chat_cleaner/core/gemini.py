@@ -0,0 +1,97 @@
+# -*- coding: utf-8 -*-
+"""
+Gemini AI Studio 导出文件的清理：取出 user / model 的发言，去掉 Markdown 标记，输出纯文本。
+
+正则在导入时编译一次，替换顺序与原来逐条 re.sub 的顺序完全相同 (顺序会影响结果，不能合并)。
+"""
+import json
+import re
+
+from chat_cleaner import jsonio
+
+# (编译好的正则, 替换内容)，按顺序依次执行
+_MARKDOWN_RULES = [
+    (re.compile(r'```[\s\S]*?```'), ''),
+    (re.compile(r'`([^`]+)`'), r'\1'),
+]
+_LINK_RULES = [
+    (re.compile(r'\[([^\]]+)\]\([^\)]+\)'), r'\1'),
+    (re.compile(r'!\[([^\]]*)\]\([^\)]+\)'), r'\1'),
+    (re.compile(r'^[ \t]*#{1,6}\s+', re.MULTILINE), ''),
+    (re.compile(r'#{1,6}\s+'), ''),
+    (re.compile(r'\*\*(.*?)\*\*'), r'\1'),
+    (re.compile(r'__(.*?)__'), r'\1'),
+    (re.compile(r'\*(.*?)\*'), r'\1'),
+    (re.compile(r'_(.*?)_'), r'\1'),
+    (re.compile(r'~~(.*?)~~'), r'\1'),
+    (re.compile(r'^[ \t]*>\s?', re.MULTILINE), ''),
+]
+_LIST_RULES = [
+    (re.compile(r'^[ \t]*([*-+])\s+', re.MULTILINE), ''),
+    (re.compile(r'^[ \t]*\d+\.\s+', re.MULTILINE), ''),
+]
+_RULE_RE = re.compile(r'^[ \t]*([-*_]){3,}[ \t]*$', re.MULTILINE)
+_WHITESPACE_RE = re.compile(r'\s+')
+
+ROLE_LABELS = {"user": "(user)", "model": "(model)"}
+
+
+def clean_markdown_to_plain_text(text):
+    """去掉 Markdown 标记并把所有空白压缩成一个空格；非字符串返回空字符串。"""
+    if not isinstance(text, str):
+        return ""
+    text = text.replace('\\n', ' ')
+    text = text.replace('\n', ' ')
+    for pattern, repl in _MARKDOWN_RULES:
+        text = pattern.sub(repl, text)
+    text = text.replace('`', '')
+    for pattern, repl in _LINK_RULES:
+        text = pattern.sub(repl, text)
+    text = text.replace('> ', ' ').replace('>', ' ')
+    for pattern, repl in _LIST_RULES:
+        text = pattern.sub(repl, text)
+    text = text.replace('- ', ' ')
+    text = _RULE_RE.sub('', text)
+    text = _WHITESPACE_RE.sub(' ', text).strip()
+    return text
+
+
+def process_chat_data_core(json_data_string):
+    """
+    解析 Gemini 导出的 JSON 并清理每条发言。
+
+    Args:
+        json_data_string (str | bytes): 导出文件内容。
+
+    Returns:
+        list: 每条发言一项，格式为 "(user)\\n文本\\n" 或 "(model)\\n文本\\n"。
+
+    Raises:
+        ValueError: 内容不是有效的 JSON。
+    """
+    try:
+        data = jsonio.loads(json_data_string)
+    except json.JSONDecodeError:
+        raise ValueError("上传的文件不是有效的JSON格式。")
+
+    processed_lines = []
+
+    def extract_and_clean(chunks_list):
+        if not isinstance(chunks_list, list):
+            return
+        for chunk in chunks_list:
+            if not isinstance(chunk, dict):
+                continue
+            role = chunk.get("role")
+            formatted_role = ROLE_LABELS.get(role) if isinstance(role, str) else None
+            text_content = chunk.get("text")
+            if formatted_role and text_content:
+                cleaned_text = clean_markdown_to_plain_text(text_content)
+                if cleaned_text:
+                    processed_lines.append(f"{formatted_role}\n{cleaned_text}\n")
+
+    chunked_prompt = data.get("chunkedPrompt", {})
+    if isinstance(chunked_prompt, dict):
+        extract_and_clean(chunked_prompt.get("chunks", []))
+    extract_and_clean(data.get("pendingInputs", []))
+    return processed_lines
@@ -0,0 +1,132 @@
+# -*- coding: utf-8 -*-
+"""
+发送者匿名化：在格式化的同时把 sender 换成稳定的代号 (用户1、用户2 ...)，并改写内容中的 @提及。
+
+以前要把聊天记录交给外部 AI 时，需要对几百 MB 的输出再跑一遍替换。现在替换在 format_message 里完成:
+
+    * 发送者：一次字典查找。代号在第一次出现时按顺序分配，字符串经过 sys.intern，
+      同一发送者的所有消息共享同一个代号对象
+    * @提及：所有已知名字编译成一个按前缀树展开的正则 (@(?:张(?:三|四)|...))，
+      每个 @ 位置只需沿着前缀树匹配一次，不会逐个尝试每个名字；同一位置有多个名字可匹配时取最长的。
+      名字后面紧跟文字 (字母、数字、汉字) 时不替换，只认识 张三 时 @张三丰 保持原样；
+      因此 @张三你好 这样名字后面直接接正文的提及也不会被替换。内容里没有 @ 的消息直接跳过
+    * 对照表可以保存为 JSON 文件，下次运行时加载，分批处理的记录使用同一套代号。
+      新代号的序号接在对照表中同一前缀的最大序号之后，并跳过已经用过的代号
+
+format_chat_log 会在格式化前先登记所有发送者，这样提到还没发过言的人也能被替换；
+流式格式化 (format_chat_stream) 只能替换已经出现过或对照表中已有的名字。
+"""
+import json
+import os
+import re
+import sys
+import threading
+
+DEFAULT_PREFIX = '用户'
+
+
+def trie_pattern(names):
+    """把一组名字展开为前缀树形式的正则 (不含外层分组)，匹配时自然取最长的名字。"""
+    trie = {}
+    for name in names:
+        node = trie
+        for char in name:
+            node = node.setdefault(char, {})
+        node[''] = None  # 名字在此结束
+
+    def build(node):
+        branches = [re.escape(char) + build(child) for char, child in sorted(node.items()) if char]
+        if not branches:
+            return ''
+        body = branches[0] if len(branches) == 1 else '(?:' + '|'.join(branches) + ')'
+        return f'(?:{body})?' if '' in node else body
+
+    return build(trie)
+
+
+class Pseudonymizer(object):
+    """
+    发送者到代号的对照表。
+
+    Args:
+        mapping (dict): 已有的 原名 -> 代号 对照表。
+        prefix (str): 新代号的前缀，代号为 前缀 + 序号。
+        mentions (bool): 是否改写内容中的 @提及。
+    """
+
+    def __init__(self, mapping=None, prefix=DEFAULT_PREFIX, mentions=True):
+        self.prefix = prefix
+        self.mentions = mentions
+        self.mapping = {sys.intern(name): sys.intern(alias) for name, alias in (mapping or {}).items()}
+        self._used = set(self.mapping.values())
+        # 加载的对照表序号可能不连续，或者用的是别的前缀：从已有的最大序号之后开始
+        suffix = re.compile(re.escape(prefix) + r'(\d+)$')
+        numbers = [int(m.group(1)) for m in map(suffix.match, self._used) if m]
+        self._next = max(numbers, default=0) + 1
+        self._lock = threading.Lock()
+        self._mention_re = None  # 有新名字时置空，下次需要时重新编译
+
+    @classmethod
+    def load(cls, path, prefix=DEFAULT_PREFIX, mentions=True):
+        """从 save() 写出的 JSON 文件加载；文件不存在时返回空对照表。"""
+        try:
+            with open(path, encoding='utf-8') as f:
+                data = json.load(f)
+        except FileNotFoundError:
+            return cls(prefix=prefix, mentions=mentions)
+        return cls(data.get('mapping'), data.get('prefix', prefix), mentions)
+
+    def save(self, path):
+        """原子地写入 JSON 文件。对照表含有真实姓名，请勿与输出一起发送。"""
+        directory = os.path.dirname(os.path.abspath(path))
+        tmp = os.path.join(directory, f".{os.path.basename(path)}.{os.getpid()}.tmp")
+        with open(tmp, 'w', encoding='utf-8') as f:
+            json.dump({'prefix': self.prefix, 'mapping': self.mapping}, f, ensure_ascii=False, indent=1)
+        os.replace(tmp, path)
+
+    def _assign(self, name):
+        with self._lock:
+            alias = self.mapping.get(name)
+            if alias is None:
+                alias = f"{self.prefix}{self._next}"
+                while alias in self._used:
+                    self._next += 1
+                    alias = f"{self.prefix}{self._next}"
+                alias = sys.intern(alias)
+                self._next += 1
+                self._used.add(alias)
+                self.mapping[sys.intern(name)] = alias
+                self._mention_re = None
+            return alias
+
+    def sender(self, sender):
+        """返回发送者的代号，第一次出现时分配新代号。"""
+        name = sender if type(sender) is str else str(sender)
+        alias = self.mapping.get(name)
+        if alias is None:
+            alias = self._assign(name)
+        return alias
+
+    def add_senders(self, senders):
+        """预先登记一批发送者 (按出现顺序分配代号)。"""
+        for sender in senders:
+            if sender is not None:
+                self.sender(sender)
+
+    def _replace_mention(self, match):
+        return '@' + self.mapping[match.group(1)]
+
+    def rewrite_mentions(self, content):
+        """把内容中的 @原名 改写为 @代号。"""
+        if not self.mentions or '@' not in content:
+            return content
+        mention_re = self._mention_re
+        if mention_re is None:
+            with self._lock:
+                names = [name for name in self.mapping if name]
+                # 名字的最后一个字符和后面的字符都是文字时，说明后面还有名字的一部分 (@张三丰)，不替换
+                mention_re = self._mention_re = (re.compile(f"@({trie_pattern(names)})(?:(?<!\\w)|(?!\\w))")
+                                                 if names else False)
+        if mention_re is False:
+            return content
+        return mention_re.sub(self._replace_mention, content)
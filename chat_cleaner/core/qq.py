@@ -0,0 +1,200 @@
+# -*- coding: utf-8 -*-
+"""
+QQ Chat Exporter JSON 的格式化。
+
+每条消息输出为 "时间戳行\n发送者：内容"，消息之间空一行；图片、视频后面的本地路径会被去掉。
+
+1.0 与 1.1 / Turbo 的规则有三处不同，用参数区分:
+    missing_timestamp      'mark' (1.1 / Turbo) 输出 "[时间戳缺失]"；'skip' (1.0) 跳过整条消息
+    unparsable_timestamp   'truncate' (1.1 / Turbo) 能截断到秒就截断，否则输出 "[无法解析时间: ...]"；
+                           'raw' (1.0) 原样输出
+    message_error          消息处理出错时输出的行：'failed' (1.1 / Turbo) 为 "[错误：处理消息 id 失败]"；
+                           'unprocessable' (1.0) 为 "[错误：无法处理消息 id]"
+    pseudonymizer          Pseudonymizer (chat_cleaner.core.pseudonym)，把发送者和 @提及替换为代号；默认不替换
+    scrubber               Scrubber (chat_cleaner.core.scrub)，内容清理规则；默认只有图片、视频路径两条
+    target_timezone        TargetTimezone (chat_cleaner.core.timezones)，把带时区的时间戳换算到该时区；
+                           默认去掉时区信息，原样输出时间戳中的时刻
+    repeats                RepeatCollapser (chat_cleaner.core.repeats)，连续重复的消息只输出第一条并加上条数；
+                           默认不折叠
+
+format_chat_log 还接受 session_breaks (消息序号列表，通常来自 chat_cleaner.core.analytics)，
+在这些消息前插入一行 "--- 新会话 ---"。
+"""
+from datetime import datetime
+
+from chat_cleaner.core.scrub import QQ_RULES, Scrubber
+from chat_cleaner.diagnostics import FormatDiagnostics
+
+# 默认的内容清理规则 (图片、视频路径)，编译为一个正则
+DEFAULT_SCRUBBER = Scrubber(QQ_RULES)
+SESSION_SEPARATOR = "--- 新会话 ---"
+
+
+def format_message(message, show_timestamp=True, diagnostics=None, missing_timestamp='mark',
+                   unparsable_timestamp='truncate', pseudonymizer=None, scrubber=None,
+                   target_timezone=None, repeats=None, message_error='failed'):
+    """
+    格式化单条消息。
+
+    Args:
+        message: 消息字典或紧凑消息记录 (带 get 方法)。
+        show_timestamp (bool): 是否包含时间戳行。
+        diagnostics (FormatDiagnostics): 收集时间戳解析失败、消息处理失败等问题；为 None 时不收集。
+        missing_timestamp (str): 'mark' 或 'skip'，见模块说明。
+        unparsable_timestamp (str): 'truncate' 或 'raw'，见模块说明。
+        message_error (str): 'failed' 或 'unprocessable'，见模块说明。
+        pseudonymizer (Pseudonymizer): 匿名化对照表；为 None 时不替换。
+        scrubber (Scrubber): 内容清理规则，例如 build_scrubber(load_rules('rules.json'))；
+            为 None 时使用 DEFAULT_SCRUBBER。
+        target_timezone (TargetTimezone): 输出时间所用的时区；为 None 时不换算。
+        repeats (RepeatCollapser): 与上一条重复的消息返回 None，条数记在 repeats 中，
+            由 format_chat_log / format_chat_stream 加到第一条后面；为 None 时不折叠。
+
+    Returns:
+        该消息对应的文本块；被跳过或被折叠时返回 None。
+    """
+    if diagnostics is None:
+        diagnostics = FormatDiagnostics()
+    if scrubber is None:
+        scrubber = DEFAULT_SCRUBBER
+    try:
+        sender = message.get("sender", "未知发送者")
+        content = message.get("content", "")
+        timestamp_str = message.get("timestamp")
+
+        if not timestamp_str and missing_timestamp == 'skip':
+            diagnostics.record('timestamp_skipped', message.get('id'))
+            return None
+
+        line_parts = []
+
+        if show_timestamp:
+            formatted_time = ""
+            if timestamp_str:
+                try:
+                    temp_ts = timestamp_str.replace('Z', '+00:00')
+                    dt_object = datetime.fromisoformat(temp_ts)
+                    dt_object_naive = dt_object.replace(tzinfo=None)
+                    if target_timezone is not None:
+                        dt_object_naive = target_timezone.convert(dt_object, dt_object_naive)
+                    formatted_time = dt_object_naive.strftime('%Y-%m-%dT%H:%M:%S')
+                except ValueError:
+                    if unparsable_timestamp == 'raw':
+                        formatted_time = timestamp_str
+                        diagnostics.record('timestamp_unparsable', message.get('id'), timestamp_str)
+                    elif len(timestamp_str) >= 19 and timestamp_str[4] == '-' and timestamp_str[10] == 'T' and timestamp_str[16] == ':':
+                        formatted_time = timestamp_str[:19]
+                        diagnostics.record('timestamp_truncated', message.get('id'), timestamp_str)
+                    else:
+                        formatted_time = f"[无法解析时间: {timestamp_str}]"
+                        diagnostics.record('timestamp_unparsable', message.get('id'), timestamp_str)
+                line_parts.append(formatted_time)
+            else:
+                line_parts.append("[时间戳缺失]")
+                diagnostics.record('timestamp_missing', message.get('id'))
+
+        cleaned_content = scrubber.scrub(str(content))
+        if pseudonymizer is not None:
+            sender = pseudonymizer.sender(sender)
+            cleaned_content = pseudonymizer.rewrite_mentions(cleaned_content)
+        if repeats is not None and repeats.add(cleaned_content):
+            return None
+        line_parts.append(f"{sender}：{cleaned_content}")
+
+        return "\n".join(line_parts)
+
+    except Exception as e:
+        msg_id = message.get('id', '未知ID') if hasattr(message, 'get') else '未知ID'
+        diagnostics.record('message_error', msg_id, f"{type(e).__name__}: {e}", exc=True)
+        if repeats is not None:
+            repeats.add_unique()
+        if message_error == 'unprocessable':
+            # 1.0 原有的写法，没有 id 时留空
+            return f"[错误：无法处理消息 {message.get('id', '') if hasattr(message, 'get') else ''}]"
+        return f"[错误：处理消息 {msg_id} 失败]"
+
+
+def format_chat_stream(messages, show_timestamp=True, diagnostics=None, **options):
+    """
+    逐条格式化消息并产出文本片段，拼接结果与 format_chat_log 相同。
+    用于分块上传等场景：messages 可以是边接收边解码的消息迭代器。
+    """
+    if diagnostics is None:
+        diagnostics = FormatDiagnostics()
+    blocks = (format_message(message, show_timestamp, diagnostics, **options) for message in messages)
+    repeats = options.get('repeats')
+    if repeats is not None:
+        blocks = repeats.collapse(blocks)
+    first = True
+    for block in blocks:
+        if block is None:
+            continue
+        yield block if first else f"\n\n{block}"
+        first = False
+
+
+def _session_blocks(messages, session_breaks, show_timestamp, diagnostics, options):
+    """逐条格式化；session_breaks 中的消息前插入会话分隔，重复消息的连续段也在此结束。"""
+    breaks = {int(index) for index in session_breaks}
+    repeats = options['repeats']
+    for index, message in enumerate(messages):
+        new_session = index in breaks
+        if new_session:
+            repeats.break_run()
+        block = format_message(message, show_timestamp, diagnostics, **options)
+        if new_session and block is not None:
+            block = f"{SESSION_SEPARATOR}\n\n{block}"
+        yield block
+
+
+def format_chat_log(json_data, show_timestamp=True, diagnostics=None, session_breaks=None, **options):
+    """
+    将聊天消息列表格式化为所需的文本格式。
+
+    Args:
+        json_data: 消息列表，每项是消息字典或紧凑消息记录。
+        show_timestamp (bool): 是否在输出中包含时间戳行。默认为 True。
+        diagnostics (FormatDiagnostics): 收集格式化问题，由调用方输出汇总；
+            为 None 时在函数结束前打印一行汇总。
+        session_breaks: 新会话开始的消息序号 (如 ActivityReport.session_breaks)，
+            在这些消息前插入 SESSION_SEPARATOR。
+        **options: missing_timestamp / unparsable_timestamp / message_error / pseudonymizer / scrubber / target_timezone / repeats，
+            见 format_message。
+
+    Returns:
+        包含格式化聊天记录的字符串，如果输入无效则返回 None。
+    """
+    if not isinstance(json_data, list):
+        print("错误：输入数据不是列表。")
+        return None
+
+    report_here = diagnostics is None
+    if report_here:
+        diagnostics = FormatDiagnostics()
+
+    pseudonymizer = options.get('pseudonymizer')
+    if pseudonymizer is not None and pseudonymizer.mentions:
+        # 先登记所有发送者，提到还没发过言的人也能替换
+        pseudonymizer.add_senders(message.get("sender", "未知发送者") for message in json_data
+                                  if hasattr(message, 'get'))
+
+    repeats = options.get('repeats')
+    if repeats is not None:
+        if session_breaks is None:
+            blocks = (format_message(message, show_timestamp, diagnostics, **options) for message in json_data)
+        else:
+            blocks = _session_blocks(json_data, session_breaks, show_timestamp, diagnostics, options)
+        blocks = list(repeats.collapse(blocks))
+    else:
+        blocks = [format_message(message, show_timestamp, diagnostics, **options) for message in json_data]
+        if session_breaks is not None:
+            for index in session_breaks:
+                block = blocks[index]
+                if block is not None:
+                    blocks[index] = f"{SESSION_SEPARATOR}\n\n{block}"
+        if options.get('missing_timestamp') == 'skip':
+            blocks = [block for block in blocks if block is not None]
+
+    if report_here and diagnostics:
+        print(diagnostics.summary())
+    return "\n\n".join(blocks)
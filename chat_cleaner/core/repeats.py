@@ -0,0 +1,132 @@
+# -*- coding: utf-8 -*-
+"""
+折叠连续重复的消息 ("+1" 接龙、复制粘贴刷屏)。
+
+连续几条内容相同或几乎相同的消息只输出第一条，并在内容后面加上条数，例如 "群友A：+1 ×37"。
+时间与发送者为这一串中的第一条；不同人发的相同内容也会折叠。
+
+比较的是清理、匿名化之后的内容，每条消息与上一条比较:
+
+    * 完全相同时直接判定为重复，不需要再做任何处理
+    * 否则按规范化后的内容判定 (NFKC 全角转半角、忽略大小写、去掉空白与标点、连续的相同字符只留一个)：
+      "+1"、"＋1！"、" +1 " 视为相同，"哈哈哈"、"哈哈哈哈哈" 视为相同。
+      完整的规范化要跑两个正则，比格式化一条消息还慢，所以先比较一个很便宜的签名：
+      去掉首尾空白与标点后的第一个和最后一个字符 (NFKC + casefold)。规范化后相同的内容签名也相同，
+      签名不同的 (绝大多数消息) 就不必规范化
+    * 只保存上一条消息的内容、签名和当前连续段的条数，额外内存与消息数无关，可以用于流式格式化
+
+规范化后为空的内容 (只有标点，例如 "？？？") 按去掉首尾空白的原始内容比较。
+"""
+import re
+import unicodedata
+
+# 空白、标点与符号 (\W 包括 _ 以外的所有非文字字符)
+_NOISE_RE = re.compile(r'[\W_]+')
+_REPEATED_CHAR_RE = re.compile(r'(.)(?=\1)', re.DOTALL)
+# 签名忽略的首尾字符：ASCII、常用标点、CJK 标点与全角符号中的非文字字符。
+# 比 _NOISE_RE 少 (例如不含表情)，只会让个别几乎相同的消息没有折叠，不会误折叠
+_EDGE_NOISE = ''.join(
+    chr(code) for first, last in ((0, 0x80), (0x2000, 0x2070), (0x3000, 0x3040), (0xFE30, 0xFE70), (0xFF00, 0xFF66))
+    for code in range(first, last) if not chr(code).isalnum())
+
+
+def _fold(content):
+    return unicodedata.normalize('NFKC', content).casefold()
+
+
+def _strip(folded, content):
+    return _REPEATED_CHAR_RE.sub('', _NOISE_RE.sub('', folded)) or content.strip()
+
+
+def normalize(content):
+    """重复判定所用的规范化内容。"""
+    return _strip(_fold(content), content)
+
+
+def _signature(content):
+    core = content.strip(_EDGE_NOISE)
+    return _fold(core[0] + core[-1]) if core else ''
+
+
+class RepeatCollapser(object):
+    """
+    连续重复消息的判定状态，一次格式化 (或一个流) 使用一个。
+
+    Args:
+        fuzzy (bool): 为 True 时按规范化后的内容判定 "几乎相同"，为 False 时只折叠完全相同的内容。
+
+    Attributes:
+        collapsed (int): 被折叠掉的消息数。
+        runs (int): 发生折叠的连续段数。
+    """
+
+    def __init__(self, fuzzy=True):
+        self.fuzzy = fuzzy
+        self.collapsed = 0
+        self.runs = 0
+        self._last = None        # 上一条消息的内容
+        self._signature = None   # 上一条消息的签名
+        self.count = 0           # 当前连续段的消息数
+        self.previous_count = 0  # 上一个连续段的消息数 (开始新连续段时更新)
+
+    def add(self, content):
+        """
+        登记一条消息的内容。
+
+        Returns:
+            bool: 与当前连续段重复 (应当折叠) 时为 True；否则开始新的连续段，返回 False。
+        """
+        if content == self._last:
+            return self._repeat()
+        if self.fuzzy:
+            signature = _signature(content)
+            same = signature == self._signature and normalize(content) == normalize(self._last)
+            self._signature = signature
+        else:
+            same = False
+        self._last = content
+        if same:
+            return self._repeat()
+        self.previous_count, self.count = self.count, 1
+        return False
+
+    def _repeat(self):
+        self.count += 1
+        self.collapsed += 1
+        if self.count == 2:
+            self.runs += 1
+        return True
+
+    def break_run(self):
+        """结束当前连续段 (例如会话分隔处)，下一条消息不会与之前的消息折叠。"""
+        self._last = self._signature = None
+
+    def add_unique(self):
+        """登记一条不参与折叠的消息 (例如处理失败时输出的错误提示)。"""
+        self.previous_count, self.count = self.count, 1
+        self.break_run()
+
+    def collapse(self, blocks):
+        """
+        为连续段的第一条消息加上条数。
+
+        blocks 是与 add() 同步逐个生成的文本块迭代器 (format_message 的结果，
+        被折叠或跳过的消息为 None)：每拿到下一个新连续段的块时，上一个块的条数才确定，
+        所以最多只暂存一个块。
+
+        Yields:
+            str: 文本块，重复的块末尾带 " ×条数"。
+        """
+        pending = None
+        for block in blocks:
+            if block is None:
+                continue
+            if pending is not None:
+                yield self.mark(pending, self.previous_count)
+            pending = block
+        if pending is not None:
+            yield self.mark(pending, self.count)
+
+    @staticmethod
+    def mark(block, count):
+        return f"{block} ×{count}" if count > 1 else block
@@ -0,0 +1,270 @@
+# -*- coding: utf-8 -*-
+"""
+可配置的内容清理规则。
+
+每条规则是一个字典:
+
+    {"name": "url", "pattern": "https?://\\\\S+", "replace": "[链接]"}
+    {"name": "face", "literal": "[表情]", "replace": ""}
+    {"name": "image_path", "pattern": "\\\\[图片\\\\]\\\\s*路径:.*", "replace": "[图片]", "ignorecase": true}
+
+    name        规则名，用于命中统计，不能重复
+    literal     要替换的固定文本 (与 pattern 二选一)
+    pattern     正则表达式；不要使用 (?P<_r数字>...) 形式的组名，不同规则的组名不能重复。
+                规则会被包进组合正则的分组里，分组编号随之变化，因此不支持 \\1、(?(1)...) 这样按编号的引用，
+                请改用命名分组 (?P<名>...) 与 (?P=名)
+    replace     替换内容，原样插入 (不展开 \\1 等反向引用)，默认为空字符串
+    ignorecase  是否忽略大小写，默认 false
+
+所有规则在构造 Scrubber 时编译成一个组合正则，每条消息只扫描一遍:
+
+    * 正则规则各占一个命名分组 (?P<_r序号>...)，按配置顺序排列
+    * 固定文本规则合并成一个按前缀树展开的分组，规则再多，每个位置也只沿前缀树匹配一次，
+      耗时几乎不随规则数增长
+    * 替换函数只在命中时调用，按分组找到规则并计数；没有命中的消息只有一次正则扫描的开销
+    * 组合正则前面加一个 "下一个字符可能是某条规则的开头" 的前瞻 (?=[...])。每条规则都包在分组里，
+      re 无法自己推算出首字符集合，没有这个前瞻时每个字符位置都要逐条尝试所有规则，
+      几十条正则规则时比逐条 re.sub 还慢。规则以 . \\S 这类几乎匹配任何字符的内容开头时前瞻就起不到作用
+
+与逐条 re.sub 的区别：同一位置有多条规则可以匹配时，先按配置顺序尝试正则规则，
+再尝试固定文本规则 (取最长的)；一条规则替换出的文本不会再被后面的规则处理。
+"""
+import json
+import re
+
+try:
+    from re import _parser as sre_parse  # Python 3.11+
+except ImportError:
+    import sre_parse
+
+from chat_cleaner.core.pseudonym import trie_pattern
+
+# format_chat_log 原有的两条规则：去掉图片、视频后面的本地路径
+QQ_RULES = (
+    {"name": "image_path", "pattern": r'\[图片\]\s*路径:.*', "replace": "[图片]", "ignorecase": True},
+    {"name": "video_path", "pattern": r'\[视频\]\s*路径:.*', "replace": "[视频]", "ignorecase": True},
+)
+# clean_text_content 原有的两个标记：从标记处截断整行
+TXT_RULES = (
+    {"name": "image_path", "pattern": r'\[图片\] 路径: .*', "replace": ""},
+    {"name": "video_path", "pattern": r'\[视频\] 路径: .*', "replace": ""},
+)
+
+_RULE_KEYS = {'name', 'literal', 'pattern', 'replace', 'ignorecase'}
+_CATEGORY_CLASSES = {
+    sre_parse.CATEGORY_DIGIT: r'\d', sre_parse.CATEGORY_NOT_DIGIT: r'\D',
+    sre_parse.CATEGORY_SPACE: r'\s', sre_parse.CATEGORY_NOT_SPACE: r'\S',
+    sre_parse.CATEGORY_WORD: r'\w', sre_parse.CATEGORY_NOT_WORD: r'\W',
+}
+
+
+def _first_chars(items, ignorecase, out):
+    """
+    把解析后的正则 items 可能匹配的第一个字符加入 out ({是否忽略大小写: [字符类片段]})。
+
+    Returns:
+        bool: 能确定首字符时为 True；可能匹配空串或首字符无法用字符类表示时为 False。
+    """
+    for op, av in items:
+        if op in (sre_parse.AT, sre_parse.ASSERT, sre_parse.ASSERT_NOT):
+            continue  # 不消耗字符，看下一项
+        if op is sre_parse.LITERAL:
+            out[ignorecase].append(re.escape(chr(av)))
+            return True
+        if op is sre_parse.IN:
+            for item_op, item in av:
+                if item_op is sre_parse.LITERAL:
+                    out[ignorecase].append(re.escape(chr(item)))
+                elif item_op is sre_parse.RANGE:
+                    out[ignorecase].append(f"{re.escape(chr(item[0]))}-{re.escape(chr(item[1]))}")
+                elif item_op is sre_parse.CATEGORY and item in _CATEGORY_CLASSES:
+                    out[ignorecase].append(_CATEGORY_CLASSES[item])
+                else:
+                    return False
+            return True
+        if op is sre_parse.SUBPATTERN:
+            _, add_flags, del_flags, sub = av
+            sub_ignorecase = (ignorecase or bool(add_flags & re.IGNORECASE)) and not del_flags & re.IGNORECASE
+            return _first_chars(sub, sub_ignorecase, out)
+        if op is sre_parse.BRANCH:
+            return all(_first_chars(branch, ignorecase, out) for branch in av[1])
+        if op in (sre_parse.MAX_REPEAT, sre_parse.MIN_REPEAT):
+            low, _, sub = av
+            if not _first_chars(sub, ignorecase, out):
+                return False
+            if low:
+                return True
+            continue  # 可以重复 0 次，后面的项也可能是开头
+        return False
+    return False
+
+
+def _prefilter(patterns, literals):
+    """所有规则首字符的前瞻 (?=[...])；有规则无法确定首字符时返回空字符串。"""
+    out = {False: [], True: []}
+    for pattern in patterns:
+        try:
+            parsed = sre_parse.parse(pattern)
+        except re.error:
+            return ''
+        if not _first_chars(parsed, bool(parsed.state.flags & re.IGNORECASE), out):
+            return ''
+    out[False].extend(re.escape(literal[0]) for literal in literals)
+    classes = []
+    if out[False]:
+        classes.append(f"[{''.join(sorted(set(out[False])))}]")
+    if out[True]:
+        classes.append(f"(?i:[{''.join(sorted(set(out[True])))}])")
+    return f"(?={'|'.join(classes)})" if classes else ''
+
+
+def _numbered_reference(pattern):
+    """
+    找出 pattern 中按编号引用分组的地方 (\\1 反向引用、(?(1)...) 条件分组)。
+
+    Returns:
+        str: 第一处编号引用的文本，没有时为 None。
+    """
+    in_class = False
+    i, size = 0, len(pattern)
+    while i < size:
+        char = pattern[i]
+        if char == '\\':
+            following = pattern[i + 1:i + 2]
+            if not in_class and following and following in '123456789':
+                return re.match(r'\\\d+', pattern[i:]).group()
+            i += 2
+            continue
+        if in_class:
+            if char == ']':
+                in_class = False
+        elif char == '[':
+            in_class = True
+            # [] 或 [^] 开头的 ] 是普通字符
+            if pattern[i + 1:i + 2] == '^':
+                i += 1
+            if pattern[i + 1:i + 2] == ']':
+                i += 1
+        elif pattern.startswith('(?(', i):
+            condition = re.match(r'\(\?\((\d+)\)', pattern[i:])
+            if condition:
+                return condition.group()
+        i += 1
+    return None
+
+
+def load_rules(path):
+    """从 JSON 文件读取规则列表。"""
+    with open(path, encoding='utf-8') as f:
+        rules = json.load(f)
+    if not isinstance(rules, list):
+        raise ValueError(f"规则文件 {path} 的顶层应为列表")
+    return rules
+
+
+class Scrubber(object):
+    """
+    编译好的一组清理规则。
+
+    Args:
+        rules (list): 规则字典列表，格式见模块说明。
+
+    Raises:
+        ValueError: 规则格式错误或正则无法编译。
+    """
+
+    def __init__(self, rules):
+        self.names = []
+        self._replacements = []
+        self._by_group = {}  # 正则规则：分组序号 -> 规则序号
+        self._literals = {}  # 固定文本 -> 规则序号
+        parts = []
+        patterns = []
+        for index, rule in enumerate(rules):
+            name = self._check(rule, index)
+            if name in self.names:
+                raise ValueError(f"清理规则名 {name!r} 重复")
+            self.names.append(name)
+            self._replacements.append(str(rule.get('replace', '')))
+            if 'literal' in rule and not rule.get('ignorecase'):
+                literal = str(rule['literal'])
+                # 同一文本出现在多条规则中时，以第一条为准
+                self._literals.setdefault(literal, index)
+                continue
+            if 'literal' in rule:
+                pattern = re.escape(str(rule['literal']))
+            else:
+                pattern = rule['pattern']
+            if rule.get('ignorecase'):
+                pattern = f'(?i:{pattern})'
+            try:
+                compiled = re.compile(pattern)
+            except re.error as e:
+                raise ValueError(f"清理规则 {name!r} 的正则无法编译: {e}")
+            if compiled.match(''):
+                raise ValueError(f"清理规则 {name!r} 的正则可以匹配空字符串")
+            reference = _numbered_reference(pattern)
+            if reference:
+                raise ValueError(f"清理规则 {name!r} 按编号引用分组 ({reference})，"
+                                 f"合并后编号会变化，请改用命名分组 (?P<名>...) 与 (?P=名)")
+            patterns.append(pattern)
+            parts.append((f'_r{index}', f'(?P<_r{index}>{pattern})'))
+        if self._literals:
+            parts.append(('_literal', f'(?P<_literal>{trie_pattern(self._literals)})'))
+        self.hits = [0] * len(self.names)
+        self._regex = None
+        if parts:
+            combined = '|'.join(part for _, part in parts)
+            prefilter = _prefilter(patterns, self._literals)
+            try:
+                self._regex = re.compile(f"{prefilter}(?:{combined})" if prefilter else combined)
+            except re.error as e:
+                # 单独编译都没有问题，合并后出错：通常是不同规则使用了相同的组名
+                raise ValueError(f"清理规则无法合并为一个正则 (不同规则的组名不能重复): {e}")
+        if self._regex is not None:
+            for group, _ in parts:
+                if group != '_literal':
+                    self._by_group[self._regex.groupindex[group]] = int(group[2:])
+            self._literal_group = self._regex.groupindex.get('_literal')
+            self._sub = self._regex.sub
+
+    @staticmethod
+    def _check(rule, index):
+        if not isinstance(rule, dict):
+            raise ValueError(f"第 {index + 1} 条清理规则不是对象")
+        name = rule.get('name') or f"rule{index + 1}"
+        unknown = set(rule) - _RULE_KEYS
+        if unknown:
+            raise ValueError(f"清理规则 {name!r} 有未知的键: {', '.join(sorted(unknown))}")
+        if ('literal' in rule) == ('pattern' in rule):
+            raise ValueError(f"清理规则 {name!r} 必须且只能指定 literal 或 pattern 之一")
+        if 'literal' in rule and not rule['literal']:
+            raise ValueError(f"清理规则 {name!r} 的 literal 不能为空")
+        return name
+
+    def _replace(self, match):
+        group = match.lastindex
+        if group == self._literal_group:
+            index = self._literals[match.group(group)]
+        else:
+            index = self._by_group[group]
+        self.hits[index] += 1
+        return self._replacements[index]
+
+    def scrub(self, text):
+        """按所有规则替换 text 中命中的部分，只扫描一遍。"""
+        if self._regex is None:
+            return text
+        return self._sub(self._replace, text)
+
+    def hit_counts(self):
+        """各规则的命中次数 {规则名: 次数}。多线程共用同一个 Scrubber 时为近似值。"""
+        return dict(zip(self.names, self.hits))
+
+    def reset_counts(self):
+        self.hits = [0] * len(self.names)
+
+
+def build_scrubber(rules=(), defaults=QQ_RULES):
+    """返回 默认规则 + rules 的 Scrubber。"""
+    return Scrubber(list(defaults) + list(rules))
@@ -0,0 +1,169 @@
+# -*- coding: utf-8 -*-
+"""
+把消息时间转换到指定时区输出。
+
+QQ Chat Exporter 的时间戳是 UTC (带 Z)，1.1 / Turbo 解析后直接去掉时区，输出的是 UTC 时间。
+TargetTimezone 在格式化时直接换算，不需要再对输出做一遍处理:
+
+    * 目标时区的 UTC 偏移按"偏移不变的区间"缓存：第一次遇到某个时刻时向前、向后查找最近的
+      夏令时切换点，之后落在同一区间内的消息直接使用缓存的偏移。聊天记录按时间排序，
+      一份记录通常只需要查找几次
+    * 区间边界同时换算到消息自身的时区 (通常是 UTC)，命中缓存时每条消息只需要
+      比较一次时区、比较一次区间、加一次偏移，不需要换算成 UTC 秒数，也不调用 astimezone
+    * 固定偏移 (+08:00、UTC+8) 没有切换点，不需要查找
+
+没有时区信息的时间戳原样输出；无法解析、被截断输出的时间戳也不做换算。
+"""
+import re
+from datetime import datetime, timedelta, timezone
+
+_OFFSET_RE = re.compile(r'^(?:UTC|GMT)?([+-])(\d{1,2})(?::?(\d{2}))?$', re.IGNORECASE)
+# 查找切换点时的最大步长与最大范围 (秒)。步长必须小于最短的夏令时区间，否则可能跳过一对切换点
+_MAX_STEP = 7 * 86400
+_SEARCH_LIMIT = 400 * 86400
+
+
+def parse_timezone(spec):
+    """
+    把时区名称转换为 tzinfo。
+
+    Args:
+        spec (str): UTC、+08:00、-0530、UTC+8 这类固定偏移，或 Asia/Shanghai 这类 IANA 时区名。
+
+    Raises:
+        ValueError: 无法识别的时区。
+    """
+    spec = spec.strip()
+    if spec.upper() in ('UTC', 'GMT', 'Z'):
+        return timezone.utc
+    match = _OFFSET_RE.match(spec)
+    if match:
+        sign, hours, minutes = match.groups()
+        offset = timedelta(hours=int(hours), minutes=int(minutes or 0))
+        if offset >= timedelta(hours=24):
+            raise ValueError(f"无效的时区偏移: {spec}")
+        return timezone(-offset if sign == '-' else offset)
+    from zoneinfo import ZoneInfo  # 只有用到时区名时才导入
+    try:
+        return ZoneInfo(spec)
+    except (KeyError, ValueError) as e:  # ZoneInfoNotFoundError 是 KeyError 的子类
+        raise ValueError(f"未知时区: {spec} ({type(e).__name__})")
+
+
+def _naive_bound(ts, utcoffset):
+    """把 UTC 秒数形式的区间边界换算为指定偏移下不带 tzinfo 的时间，超出范围时取 datetime.min / max。"""
+    if ts == float('-inf'):
+        return datetime.min
+    if ts == float('inf'):
+        return datetime.max
+    try:
+        return datetime.fromtimestamp(ts, timezone.utc).replace(tzinfo=None) + utcoffset
+    except (OverflowError, OSError, ValueError):
+        return datetime.min if ts < 0 else datetime.max
+
+
+class TargetTimezone(object):
+    """
+    带偏移缓存的目标时区。
+
+    Args:
+        tz (str | tzinfo): 时区名称 (见 parse_timezone) 或 tzinfo 对象。
+    """
+
+    def __init__(self, tz):
+        self.tz = parse_timezone(tz) if isinstance(tz, str) else tz
+        self.name = str(tz)
+        # 当前缓存的区间 (start, end, offset)：[start, end) (UTC 秒) 内偏移为 offset。
+        # 整体替换元组，多线程共用时不会读到不一致的区间与偏移
+        self._interval = (0.0, 0.0, None)
+        self.lookups = 0  # 查找切换点的次数，用于观察缓存效果
+        if isinstance(self.tz, timezone):
+            self._interval = (float('-inf'), float('inf'), self.tz.utcoffset(None))
+        # 命中缓存用的 (消息时区, 区间开始, 区间结束, 偏移差)，区间为消息时区下不带 tzinfo 的时间
+        self._fast = (None, None, None, None)
+
+    def _offset_at(self, ts):
+        try:
+            return datetime.fromtimestamp(ts, self.tz).utcoffset()
+        except (OverflowError, ValueError):
+            # 换算后的本地时间超出 datetime 的范围 (如 9999-12-31T23:30Z 在东八区)：按 UTC 时间查偏移；
+            # UTC 时间本身也超出范围时照常抛出
+            return self.tz.utcoffset(datetime.fromtimestamp(ts, timezone.utc).replace(tzinfo=None))
+
+    def _edge(self, ts, offset, direction):
+        """从 ts 向 direction (+1 / -1) 方向查找偏移变化的位置，返回区间的边界。"""
+        last, step = ts, 3600
+        while abs(last - ts) < _SEARCH_LIMIT:
+            probe = last + direction * step
+            try:
+                changed = self._offset_at(probe) != offset
+            except (OverflowError, OSError, ValueError):
+                # 超出平台支持的时间范围：这一侧不会再有切换点。返回 last 会让区间不包含 ts 本身，
+                # 调用方按区间前进时停在原地
+                return float('inf') if direction > 0 else float('-inf')
+            if changed:
+                same, other = last, probe
+                while abs(other - same) > 1:
+                    middle = (same + other) // 2
+                    if self._offset_at(middle) == offset:
+                        same = middle
+                    else:
+                        other = middle
+                # 向后找时返回第一个偏移不同的秒 (不含)，向前找时返回最早的偏移相同的秒 (含)
+                return other if direction > 0 else same
+            last = probe
+            step = min(step * 2, _MAX_STEP)
+        return last
+
+    def offset(self, ts):
+        """UTC 秒数 ts 对应的目标时区偏移。"""
+        start, end, offset = self._interval
+        if start <= ts < end:
+            return offset
+        return self.interval(ts)[2]
+
+    def interval(self, ts):
+        """
+        包含 UTC 秒数 ts 的偏移不变区间。
+
+        Returns:
+            tuple: (start, end, offset)，[start, end) (UTC 秒) 内的偏移都是 offset (timedelta)。
+                固定偏移时 start / end 为 -inf / inf。
+        """
+        interval = self._interval
+        if interval[0] <= ts < interval[1]:
+            return interval
+        self.lookups += 1
+        second = int(ts // 1)
+        offset = self._offset_at(second)
+        interval = self._interval = (self._edge(second, offset, -1), self._edge(second, offset, 1), offset)
+        return interval
+
+    def convert(self, dt, naive=None):
+        """
+        把带时区的 datetime 换算为目标时区的本地时间 (不带 tzinfo)；不带时区的原样返回。
+
+        Args:
+            dt (datetime): 要换算的时间。
+            naive (datetime): dt.replace(tzinfo=None)。调用方已经算好时传入，
+                replace(tzinfo=...) 比命中缓存后的换算本身还慢。
+        """
+        tzinfo = dt.tzinfo
+        if tzinfo is None:
+            return dt
+        if naive is None:
+            naive = dt.replace(tzinfo=None)
+        source, start, end, delta = self._fast
+        if tzinfo == source and start <= naive < end:
+            return naive + delta
+        return self._convert_slow(dt, naive)
+
+    def _convert_slow(self, dt, naive):
+        utcoffset = dt.utcoffset()
+        utc = naive - utcoffset
+        offset = self.offset(dt.timestamp())
+        if isinstance(dt.tzinfo, timezone):
+            start, end, _ = self._interval
+            self._fast = (dt.tzinfo, _naive_bound(start, utcoffset), _naive_bound(end, utcoffset),
+                          offset - utcoffset)
+        return utc + offset
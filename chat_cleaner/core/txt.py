@@ -0,0 +1,53 @@
+# -*- coding: utf-8 -*-
+"""0.9 版 txt 聊天记录的清理：去掉行首的时间戳数字，截掉图片、视频的本地路径。"""
+import re
+
+IMAGE_MARKER = "[图片] 路径: "
+VIDEO_MARKER = "[视频] 路径: "
+_TIMESTAMP_RE = re.compile(r"^\d+\s+")
+
+
+def clean_text_content(text_content, remove_timestamp=True, scrubber=None):
+    """
+    清理 txt 聊天记录。
+
+    Args:
+        text_content (str): 文件内容。
+        remove_timestamp (bool): 是否移除每行开头的时间戳数字。
+        scrubber (Scrubber): 额外的清理规则 (chat_cleaner.core.scrub)，应包含 TXT_RULES；
+            为 None 时只按图片、视频标记截断，不经过正则。
+
+    Returns:
+        清理后的文本；清理后为空的行会被去掉 (原本就是空行的保留)。
+    """
+    processed_lines = []
+
+    for line in text_content.splitlines():
+        current_line_after_ts = _TIMESTAMP_RE.sub('', line) if remove_timestamp else line
+
+        if scrubber is not None:
+            final_line_content = scrubber.scrub(current_line_after_ts).rstrip()
+            if final_line_content or line.strip() == '':
+                processed_lines.append(final_line_content)
+            continue
+
+        img_index = current_line_after_ts.find(IMAGE_MARKER)
+        vid_index = current_line_after_ts.find(VIDEO_MARKER)
+
+        trunc_index = -1
+        if img_index != -1 and vid_index != -1:
+            trunc_index = min(img_index, vid_index)
+        elif img_index != -1:
+            trunc_index = img_index
+        elif vid_index != -1:
+            trunc_index = vid_index
+
+        if trunc_index != -1:
+            final_line_content = current_line_after_ts[:trunc_index].rstrip()
+        else:
+            final_line_content = current_line_after_ts.rstrip()
+
+        if final_line_content or line.strip() == '':
+            processed_lines.append(final_line_content)
+
+    return '\n'.join(processed_lines)
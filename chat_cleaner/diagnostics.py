@@ -0,0 +1,80 @@
+# -*- coding: utf-8 -*-
+"""
+格式化过程中的问题汇总。
+
+以前每条格式错误的消息都会 print 一次 (外加 traceback)，损坏的大文件会让控制台输出
+成为主要耗时。现在格式化循环只在出错的分支里调用 record()，按类别计数，
+并保留每类前几个示例 (含消息 id)，一个请求结束时输出一行汇总。
+正常消息不会经过这里，没有额外开销。
+"""
+import json
+
+# 类别 -> 汇总里使用的中文说明
+CATEGORIES = {
+    'timestamp_missing': '缺少时间戳',
+    'timestamp_skipped': '缺少时间戳，已跳过',
+    'timestamp_truncated': '时间戳无法解析，已截断',
+    'timestamp_unparsable': '时间戳无法解析',
+    'message_error': '消息处理失败',
+}
+
+
+class FormatDiagnostics(object):
+    """
+    按类别统计格式化时遇到的问题。
+
+    Args:
+        max_examples (int): 每个类别保留的示例数量。
+    """
+
+    def __init__(self, max_examples=5):
+        self.max_examples = max_examples
+        self.counts = {}
+        self.examples = {}
+
+    def record(self, category, msg_id=None, detail=None, exc=False):
+        """
+        记录一个问题。
+
+        Args:
+            category (str): 问题类别，见 CATEGORIES。
+            msg_id: 出问题的消息 id。
+            detail: 附加说明，例如原始时间戳或异常信息。
+            exc (bool): 为 True 时在示例中附带当前异常的 traceback (只对保留的示例生成)。
+        """
+        count = self.counts.get(category, 0)
+        self.counts[category] = count + 1
+        if count < self.max_examples:
+            example = {"id": msg_id, "detail": detail}
+            if exc:
+                import traceback  # 只有出错时才需要，不在导入时加载
+                example["traceback"] = traceback.format_exc()
+            self.examples.setdefault(category, []).append(example)
+
+    def merge(self, data):
+        """合并另一个 FormatDiagnostics 的 as_dict() 结果 (例如工作进程中收集的问题)。"""
+        for category, count in data["counts"].items():
+            self.counts[category] = self.counts.get(category, 0) + count
+        for category, items in data["examples"].items():
+            examples = self.examples.setdefault(category, [])
+            examples.extend(items[:self.max_examples - len(examples)])
+
+    def __bool__(self):
+        return bool(self.counts)
+
+    def total(self):
+        return sum(self.counts.values())
+
+    def as_dict(self):
+        return {"counts": dict(self.counts), "examples": self.examples}
+
+    def summary(self):
+        """一行文字汇总，例如: 格式化问题 3 条 (时间戳无法解析，已截断 2, 消息处理失败 1)，示例: ..."""
+        if not self.counts:
+            return "格式化问题 0 条"
+        parts = ", ".join(f"{CATEGORIES.get(category, category)} {count}"
+                          for category, count in self.counts.items())
+        examples = {category: [(e["id"], e["detail"]) for e in items]
+                    for category, items in self.examples.items()}
+        return (f"格式化问题 {self.total()} 条 ({parts})，"
+                f"示例: {json.dumps(examples, ensure_ascii=False, default=str)}")
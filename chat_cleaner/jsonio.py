@@ -0,0 +1,370 @@
+# -*- coding: utf-8 -*-
+"""
+可插拔的 JSON 解码层。
+
+第一次解码时按速度挑选已安装的后端 (msgspec > orjson > simdjson > 标准库 json)，
+都未安装时回退到标准库。导入本模块时不会导入这些后端 (msgspec 单是导入就要二三十毫秒)，
+只做 txt 清理或只导入格式化函数的进程不必为此付出启动时间。可以用环境变量 CHAT_CLEANER_JSON_BACKEND 强制指定
+(msgspec / orjson / simdjson / json)。
+
+解码期间会暂停循环垃圾回收：解码结果不可能含有引用环，而解码大文件时
+分配的数百万个对象会反复触发 GC 扫描，往往比解码本身还慢。
+
+各后端对 JSON 的容忍度略有不同 (例如标准库接受 NaN 与超长整数)，
+所以快速后端解码失败时会再交给标准库解码一次：能解析的内容与解析结果、
+以及最终抛出的 json.JSONDecodeError 都与只用标准库时完全一致。
+唯一的例外是 orjson 的 loads()：超出 64 位的整数不会解码失败，而是变成 float。
+要排除这种情况得先扫描一遍整个文本，比 orjson 省下的时间还多；loads() 只用于 Gemini 导出，
+格式化只读取其中的字符串，输出不受影响。
+"""
+import codecs
+import gc
+import json
+import os
+from contextlib import contextmanager
+
+from chat_cleaner.records import ChatMessage, compact_message, decode_messages
+
+BACKEND_ENV = 'CHAT_CLEANER_JSON_BACKEND'
+
+
+@contextmanager
+def gc_paused():
+    """暂停循环垃圾回收：一次性创建大量不会成环的对象时使用。"""
+    was_enabled = gc.isenabled()
+    gc.disable()
+    try:
+        yield
+    finally:
+        if was_enabled:
+            gc.enable()
+
+
+class JSONBackend(object):
+    """
+    一个解码后端。
+
+    loads(text) 解码任意 JSON；load_messages(text) 解码 QQ 聊天记录，
+    消息以带 get() 方法的紧凑记录返回 (见 chat_cleaner.records)。
+    """
+
+    def __init__(self, name, loads, load_messages=decode_messages):
+        self.name = name
+        self._loads = loads
+        self._load_messages = load_messages
+
+    def loads(self, text):
+        with gc_paused():
+            if self._loads is not json.loads:
+                try:
+                    return self._loads(text)
+                except Exception:
+                    pass
+            return json.loads(text)
+
+    def load_messages(self, text):
+        with gc_paused():
+            if self._load_messages is not decode_messages:
+                try:
+                    return self._load_messages(text)
+                except Exception:
+                    pass
+            return decode_messages(text)
+
+    def __repr__(self):
+        return f"JSONBackend({self.name!r})"
+
+
+def _stdlib_backend():
+    return JSONBackend('json', json.loads)
+
+
+def _msgspec_backend():
+    import sys
+    from typing import Any, List
+
+    import msgspec
+
+    class MsgspecMessage(msgspec.Struct, gc=False):
+        """msgspec 的消息模式：只解码四个字段，其余字段在解码时直接跳过。"""
+        id: Any = msgspec.UNSET
+        sender: Any = msgspec.UNSET
+        content: Any = msgspec.UNSET
+        timestamp: Any = msgspec.UNSET
+
+        def get(self, key, default=None):
+            value = getattr(self, key, msgspec.UNSET) if key in ChatMessage.__slots__ else msgspec.UNSET
+            return default if value is msgspec.UNSET else value
+
+    typed_decoder = msgspec.json.Decoder(List[MsgspecMessage])
+    generic_decoder = msgspec.json.Decoder()
+    intern = sys.intern
+
+    def load_messages(text):
+        messages = typed_decoder.decode(text)
+        for message in messages:
+            sender = message.sender
+            if type(sender) is str:
+                message.sender = intern(sender)
+        return messages
+
+    return JSONBackend('msgspec', generic_decoder.decode, load_messages)
+
+
+# orjson / simdjson 不能逐个元素解码，只能先解码出完整 dict 再转换成紧凑记录
+# 比标准库边解码边转换更慢也更占内存，所以它们只用于通用 loads()
+def _orjson_backend():
+    import orjson
+    return JSONBackend('orjson', orjson.loads)
+
+
+def _simdjson_backend():
+    import simdjson
+    return JSONBackend('simdjson', simdjson.loads)
+
+
+# 按优先级排列；msgspec 可以按模式解码，既快又省内存
+_FACTORIES = (
+    ('msgspec', _msgspec_backend),
+    ('orjson', _orjson_backend),
+    ('simdjson', _simdjson_backend),
+    ('json', _stdlib_backend),
+)
+
+
+def available_backends():
+    """返回当前环境中所有可用的后端，按优先级排列。"""
+    backends = []
+    for name, factory in _FACTORIES:
+        try:
+            backends.append(factory())
+        except ImportError:
+            continue
+    return backends
+
+
+def select_backend(name=None):
+    """
+    选择解码后端。
+
+    Args:
+        name: 后端名称；为空时使用环境变量 CHAT_CLEANER_JSON_BACKEND，
+              仍为空则选择最快的已安装后端。
+    Returns:
+        JSONBackend 实例。指定的后端未安装时回退到标准库。
+    """
+    name = (name or os.environ.get(BACKEND_ENV, '')).strip().lower()
+    for backend_name, factory in _FACTORIES:
+        if name and backend_name != name:
+            continue
+        try:
+            return factory()
+        except ImportError:
+            if name:
+                print(f"警告：JSON 后端 '{name}' 未安装，回退到标准库 json。")
+                break
+    return _stdlib_backend()
+
+
+def current_backend():
+    """返回当前后端，第一次调用时才选择。也可以直接读写模块属性 jsonio.backend。"""
+    global backend
+    try:
+        return backend
+    except NameError:
+        backend = select_backend()
+        return backend
+
+
+def __getattr__(name):
+    # jsonio.backend 在第一次访问时才选择；赋值后就是普通的模块属性
+    if name == 'backend':
+        return current_backend()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+def loads(text):
+    """用当前后端解码任意 JSON。"""
+    return current_backend().loads(text)
+
+
+def load_messages(text):
+    """用当前后端解码 QQ 聊天记录 JSON。"""
+    return current_backend().load_messages(text)
+
+
+def load_messages_jsonl(data, first_line=1):
+    """
+    解码 JSON Lines 格式的聊天记录 (每行一条消息)，返回消息列表。
+
+    每行单独解码要为每条消息调用一次解码器，这里把换行替换为逗号、整体包成一个数组，
+    交给当前后端一次解码完；有空行或解码失败时再逐行解码，错误信息中给出行号。
+
+    Args:
+        data (bytes | str): JSONL 内容，可以带 UTF-8 BOM。
+        first_line (int): data 第一行在整个文件中的行号 (只解码文件的一部分时)，用于错误信息。
+
+    Raises:
+        json.JSONDecodeError: 某一行不是合法的 JSON，消息中带行号。
+        UnicodeDecodeError: bytes 不是 UTF-8。
+    """
+    if isinstance(data, str):
+        newline, comma, blank, brackets = '\n', ',', '', ('[', ']')
+        data = data.lstrip('\ufeff')
+    else:
+        newline, comma, blank, brackets = b'\n', b',', b'', (b'[', b']')
+        if data.startswith(codecs.BOM_UTF8):
+            data = data[len(codecs.BOM_UTF8):]
+    stripped = data.strip()
+    if not stripped:
+        return []
+    array = brackets[0] + stripped.replace(newline, comma) + brackets[1]
+    try:
+        messages = load_messages(array)
+    except ValueError:
+        messages = None
+    del array
+    if isinstance(messages, list) and len(messages) == stripped.count(newline) + 1:
+        return messages
+    del stripped
+    messages = []
+    for number, line in enumerate(data.split(newline), first_line):
+        if line.strip() == blank:
+            continue
+        try:
+            messages.append(decode_messages(line))
+        except json.JSONDecodeError as e:
+            raise json.JSONDecodeError(f"第 {number} 行: {e.msg}", e.doc, e.pos)
+    return messages
+
+
+_WHITESPACE = ' \t\r\n'
+# 语法错误出现在缓冲区末尾这么多个字符以内时，可能只是元素被读取块截断
+# (写了一半的 true / -Infinity、\uXXXX 转义、数字的小数点或指数部分)，读入更多后再判断
+_TRUNCATION_MARGIN = 16
+
+
+class _ArrayReader(object):
+    """iter_messages 使用的文本缓冲：从二进制流中按需读取并做增量 UTF-8 解码。"""
+
+    def __init__(self, stream, read_size):
+        self.stream = stream
+        self.read_size = read_size
+        self.decoder = codecs.getincrementaldecoder('utf-8-sig')()
+        self.buf = ''
+        self.pos = 0
+        self.eof = False
+        # 已丢弃的文本：buf[0] 在整个文档中的字符偏移、所在行号与该行开头的偏移，用于错误信息
+        self.offset = 0
+        self.line = 1
+        self.line_start = 0
+
+    def fill(self):
+        """读入更多数据；已到末尾时返回 False。"""
+        if self.eof:
+            return False
+        data = self.stream.read(self.read_size)
+        if not data:
+            self.eof = True
+        if self.pos:
+            newlines = self.buf.count('\n', 0, self.pos)
+            if newlines:
+                self.line += newlines
+                self.line_start = self.offset + self.buf.rfind('\n', 0, self.pos) + 1
+            self.offset += self.pos
+        self.buf = self.buf[self.pos:] + self.decoder.decode(data or b'', final=self.eof)
+        self.pos = 0
+        return True
+
+    def may_be_truncated(self, error):
+        """语法错误是否可能只是因为后面的数据还没读入。"""
+        if self.eof:
+            return False
+        # 字符串读到缓冲区末尾还没结束时，错误位置是字符串的开头
+        return error.msg.startswith('Unterminated string') or error.pos >= len(self.buf) - _TRUNCATION_MARGIN
+
+    def error(self, msg, pos):
+        """以整个文档中的位置 (行、列、字符偏移) 构造 JSONDecodeError。"""
+        err = json.JSONDecodeError(msg, self.buf, pos)
+        newlines = self.buf.count('\n', 0, pos)
+        err.pos = self.offset + pos
+        err.lineno = self.line + newlines
+        if newlines:
+            err.colno = pos - self.buf.rfind('\n', 0, pos)
+        else:
+            err.colno = err.pos - self.line_start + 1
+        err.args = (f"{msg}: line {err.lineno} column {err.colno} (char {err.pos})",)
+        return err
+
+    def next_char(self):
+        """跳过空白，返回下一个字符 (不消耗)；到达末尾返回空字符串。"""
+        while True:
+            buf, pos = self.buf, self.pos
+            while pos < len(buf) and buf[pos] in _WHITESPACE:
+                pos += 1
+            self.pos = pos
+            if pos < len(buf):
+                return buf[pos]
+            if not self.fill():
+                return ''
+
+
+def iter_messages(stream, read_size=1024 * 1024):
+    """
+    从二进制流中逐条解码顶层 JSON 数组，边读边产出元素 (消息转换为 ChatMessage)。
+
+    用于上传尚未完成时就开始格式化：流的 read() 可以阻塞等待后续数据。
+    内存中只保留当前读取块与正在解码的一条消息。
+
+    Args:
+        stream: 带 read(n) 方法的二进制流。
+        read_size (int): 每次读取的字节数。
+
+    Returns:
+        生成器，逐个产出数组元素。
+
+    Raises:
+        ValueError: 顶层不是数组。
+        json.JSONDecodeError: JSON 语法错误 (位置为整个文档中的行、列与字符偏移)，包括数组结束后
+            还有空白以外的内容。错误之后的数据不会再读取。
+    """
+    decoder = json.JSONDecoder()
+    reader = _ArrayReader(stream, read_size)
+    if reader.next_char() != '[':
+        raise ValueError("JSON 顶层不是数组")
+    reader.pos += 1
+    if reader.next_char() == ']':
+        _check_end(reader)
+        return
+    while True:
+        if not reader.next_char():
+            raise reader.error("数组未结束", reader.pos)
+        try:
+            item, end = decoder.raw_decode(reader.buf, reader.pos)
+        except json.JSONDecodeError as e:
+            # 错误在缓冲区末尾附近时元素可能被读取块截断，读入更多后重试；
+            # 否则后面的数据改变不了结果，立即报告，不再把剩下的整个流读进内存
+            if reader.may_be_truncated(e) and reader.fill():
+                continue
+            raise reader.error(e.msg, e.pos) from None
+        if end > len(reader.buf) - _TRUNCATION_MARGIN and not reader.eof:
+            # 数字等标量在块边界处可能只解码了一半 (例如 1.5 只读到了 1.)，读入更多后重新解码
+            reader.fill()
+            continue
+        reader.pos = end
+        yield compact_message(item)
+        separator = reader.next_char()
+        if separator == ',':
+            reader.pos += 1
+        elif separator == ']':
+            _check_end(reader)
+            return
+        else:
+            raise reader.error("数组元素之间缺少逗号", reader.pos)
+
+
+def _check_end(reader):
+    """数组结束后只允许空白 (与 json.loads 一致)，否则抛出 Extra data。"""
+    reader.pos += 1
+    if reader.next_char():
+        raise reader.error("Extra data", reader.pos)
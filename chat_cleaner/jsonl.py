@@ -0,0 +1,157 @@
+# -*- coding: utf-8 -*-
+"""
+JSON Lines 聊天记录 (每行一条消息) 的多进程格式化，供本地批量转换 (chat_cleaner.convert) 使用。
+
+    * 文件用 mmap 映射，按约 chunk_size 字节切成若干区间，区间边界对齐到换行，每个区间都是完整的若干行
+    * 每个区间交给一个工作进程：工作进程自己映射文件、只读取自己的区间，解码并格式化后返回 UTF-8 文本，
+      主进程不需要把输入数据发给工作进程
+    * 结果按区间顺序写入输出，与整个文件一次格式化的结果相同；同时在处理的区间数有上限，
+      内存占用只与 chunk_size 和进程数有关，与文件大小无关
+
+匿名化 (pseudonymizer) 与折叠重复消息 (repeats) 需要按顺序看到所有消息，指定了它们时整个文件在当前进程中一次处理。
+"""
+import mmap
+import os
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+from chat_cleaner.diagnostics import FormatDiagnostics
+
+DEFAULT_CHUNK_SIZE = 16 * 1024 * 1024
+# 这些选项带有跨消息的状态，不能拆到多个进程中
+SEQUENTIAL_OPTIONS = ('pseudonymizer', 'repeats')
+
+
+def split_ranges(buf, chunk_size=DEFAULT_CHUNK_SIZE):
+    """
+    把 buf (bytes 或 mmap) 切成约 chunk_size 字节的区间，除最后一个外都在换行之后结束。
+
+    Returns:
+        list: [(start, end), ...]，首尾相接覆盖整个 buf。
+    """
+    ranges = []
+    start, size = 0, len(buf)
+    while start < size:
+        end = start + chunk_size
+        if end >= size:
+            end = size
+        else:
+            newline = buf.find(b'\n', end - 1)
+            end = size if newline < 0 else newline + 1
+        ranges.append((start, end))
+        start = end
+    return ranges
+
+
+def _read_range(path, start, end):
+    with open(path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        return mm[start:end]
+
+
+def format_range(path, start, end, show_timestamp=True, options=None):
+    """
+    解码并格式化文件中的一个区间 (工作进程中执行)。
+
+    Returns:
+        tuple: (UTF-8 文本, 消息数, 格式化问题 (FormatDiagnostics.as_dict())，
+            本区间的清理规则命中次数或 None)。
+
+    Raises:
+        json.JSONDecodeError: 某一行不是合法的 JSON，消息中带整个文件中的行号。
+    """
+    from chat_cleaner import jsonio
+    from chat_cleaner.core import format_chat_log
+    options = options or {}
+    data = _read_range(path, start, end)
+    try:
+        messages = jsonio.load_messages_jsonl(data)
+    except ValueError:
+        # 只在出错时数一遍前面的行，重新解码以给出文件中的行号
+        with open(path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            first_line = mm[:start].count(b'\n') + 1
+        messages = jsonio.load_messages_jsonl(data, first_line)
+    del data
+    diagnostics = FormatDiagnostics()
+    scrubber = options.get('scrubber')
+    before = list(scrubber.hits) if scrubber is not None else None
+    text = format_chat_log(messages, show_timestamp=show_timestamp, diagnostics=diagnostics, **options)
+    hits = [after - count for after, count in zip(scrubber.hits, before)] if scrubber is not None else None
+    return text.encode('utf-8', errors='replace'), len(messages), diagnostics.as_dict(), hits
+
+
+def format_jsonl_file(path, out, workers=1, chunk_size=None, show_timestamp=True,
+                      diagnostics=None, **options):
+    """
+    格式化 JSONL 文件并把结果写入 out，输出与 format_chat_log(所有消息) 相同。
+
+    Args:
+        path (str): JSONL 文件路径。
+        out: 二进制文件对象，结果以 UTF-8 写入。
+        workers (int): 工作进程数；为 1 或文件只有一个区间时在当前进程中处理。
+        chunk_size (int): 每个区间的大致字节数；为 None 时使用 DEFAULT_CHUNK_SIZE。
+        show_timestamp (bool): 是否包含时间戳行。
+        diagnostics (FormatDiagnostics): 收集格式化问题 (合并各进程的结果)。
+        **options: 传给 format_chat_log 的其他选项 (scrubber / target_timezone 等)。
+            清理规则的命中次数会累加回主进程的 scrubber。
+
+    Returns:
+        int: 消息数。
+
+    Raises:
+        json.JSONDecodeError: 某一行不是合法的 JSON (消息中带行号)。
+    """
+    if diagnostics is None:
+        diagnostics = FormatDiagnostics()
+    size = os.path.getsize(path)
+    if size == 0:
+        return 0
+    if any(options.get(name) is not None for name in SEQUENTIAL_OPTIONS):
+        chunk_size = size
+    elif chunk_size is None:
+        chunk_size = DEFAULT_CHUNK_SIZE
+    with open(path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        ranges = split_ranges(mm, chunk_size)
+
+    if workers <= 1 or len(ranges) == 1:
+        results = (format_range(path, start, end, show_timestamp, options) for start, end in ranges)
+        return _write_results(results, out, diagnostics, None)
+
+    with ProcessPoolExecutor(max_workers=min(workers, len(ranges))) as executor:
+        return _write_results(_ordered(executor, path, ranges, show_timestamp, options, workers * 2),
+                              out, diagnostics, options.get('scrubber'))
+
+
+def _ordered(executor, path, ranges, show_timestamp, options, window):
+    """按区间顺序产出结果；同时提交的区间不超过 window 个，已完成但还没轮到写出的结果不会无限堆积。"""
+    pending = deque()
+    remaining = iter(ranges)
+
+    def submit():
+        item = next(remaining, None)
+        if item is not None:
+            pending.append(executor.submit(format_range, path, item[0], item[1], show_timestamp, options))
+
+    for _ in range(window):
+        submit()
+    while pending:
+        result = pending.popleft().result()
+        submit()
+        yield result
+
+
+def _write_results(results, out, diagnostics, scrubber):
+    """按顺序写出各区间的结果；scrubber 为主进程的清理规则 (工作进程中处理时)，累加各区间的命中次数。"""
+    count = 0
+    first = True
+    for body, messages, issues, hits in results:
+        count += messages
+        diagnostics.merge(issues)
+        if hits is not None and scrubber is not None:
+            scrubber.hits = [total + hit for total, hit in zip(scrubber.hits, hits)]
+        if not body:
+            continue
+        if not first:
+            out.write(b'\n\n')
+        out.write(body)
+        first = False
+    return count
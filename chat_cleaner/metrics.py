@@ -0,0 +1,304 @@
+# -*- coding: utf-8 -*-
+"""
+Prometheus 文本格式的服务指标 (/metrics)。
+
+install_metrics(app) 后自动统计:
+    chat_cleaner_requests_total                按路由 / 方法 / 状态码计数
+    chat_cleaner_request_duration_seconds      请求耗时直方图 (到响应体发送完毕为止)
+    chat_cleaner_request_size_bytes            上传大小直方图
+    chat_cleaner_bytes_in_total / _out_total   收发字节数
+    chat_cleaner_in_flight_requests            正在处理的请求数
+    chat_cleaner_messages_formatted_total      已格式化的消息 (行) 数，由视图调用 record_messages()
+    chat_cleaner_parse_errors_total            按异常类型统计的解析错误 (上传内容无法解码)，由视图调用 record_parse_error()
+    chat_cleaner_unexpected_errors_total       按异常类型统计的服务端意外错误 (500)，由视图调用 record_unexpected_error()
+    chat_cleaner_admission_rejected_total 等   准入控制 (chat_cleaner.admission) 的拒绝数与已分配预算
+    process_resident_memory_bytes 等           进程内存
+    chat_cleaner_stage_memory_peak_bytes 等    各阶段 / 请求的内存峰值 (开启 CHAT_CLEANER_TRACE_MEMORY 时，见 chat_cleaner.timing)
+
+计数器按线程分片：每个线程只写自己的 dict，不需要加锁，也不会在高并发时争用；
+抓取 /metrics 时再把所有分片合并。线程结束时它的分片并入一个公共的基础分片，
+werkzeug 这样每个请求一个线程的服务器运行很久之后，分片数也只与同时存活的线程数相当。
+多进程部署 (gunicorn 多 worker) 时每个进程各自统计。
+"""
+import bisect
+import os
+import sys
+import threading
+import time
+import weakref
+
+from flask import Response, g, request
+
+from chat_cleaner.timing import call_after_send
+
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+SIZE_BUCKETS = tuple(1024 * 4 ** i for i in range(10))  # 1 KB ... 256 MB
+MEMORY_BUCKETS = tuple(1024 * 1024 * 2 ** i for i in range(14))  # 1 MB ... 8 GB
+
+# 指标名 -> (类型, 说明)
+METRICS = {
+    'chat_cleaner_requests_total': ('counter', '处理完成的请求数'),
+    'chat_cleaner_request_duration_seconds': ('histogram', '请求耗时 (含响应体传输)'),
+    'chat_cleaner_request_size_bytes': ('histogram', '请求体大小'),
+    'chat_cleaner_bytes_in_total': ('counter', '接收的请求体字节数'),
+    'chat_cleaner_bytes_out_total': ('counter', '发送的响应体字节数'),
+    'chat_cleaner_in_flight_requests': ('gauge', '正在处理的请求数'),
+    'chat_cleaner_messages_formatted_total': ('counter', '已格式化的消息或行数'),
+    'chat_cleaner_parse_errors_total': ('counter', '按异常类型统计的上传解析错误'),
+    'chat_cleaner_unexpected_errors_total': ('counter', '按异常类型统计的服务端意外错误'),
+    'chat_cleaner_admission_rejected_total': ('counter', '内存预算不足被拒绝 (503) 的请求数'),
+    'chat_cleaner_memory_reserved_bytes': ('gauge', '准入控制当前已分配的内存预算'),
+    'chat_cleaner_stage_memory_peak_bytes': ('histogram', '各阶段的 Python 内存峰值 (tracemalloc，相对阶段开始时)'),
+    'chat_cleaner_stage_memory_delta_bytes_total': ('counter', '各阶段结束时保留的 Python 内存净增之和 (可以为负)'),
+    'chat_cleaner_request_memory_peak_bytes': ('histogram', '请求内的 Python 内存峰值 (tracemalloc)'),
+    'chat_cleaner_request_peak_rss_bytes': ('histogram', '请求期间的进程 RSS 峰值'),
+}
+
+
+class _Shard(object):
+    __slots__ = ('values', 'histograms')
+
+    def __init__(self):
+        self.values = {}      # (指标名, 标签元组) -> 数值
+        self.histograms = {}  # (指标名, 标签元组) -> [各桶计数..., +Inf 计数, 总和]
+
+    def merge_into(self, values, histograms):
+        # dict.copy() 在 CPython 中是原子操作，即使所属线程正在写入也安全
+        for key, value in self.values.copy().items():
+            values[key] = values.get(key, 0) + value
+        for key, counts in self.histograms.copy().items():
+            merged = histograms.setdefault(key, [0] * len(counts))
+            for i, count in enumerate(list(counts)):
+                merged[i] += count
+
+
+class _ThreadToken(object):
+    """只存放在线程局部变量中；线程结束时局部变量被清理，它的 finalize 回调把分片并入基础分片。"""
+    __slots__ = ('__weakref__',)
+
+
+class Registry(object):
+    """按线程分片的指标注册表。"""
+
+    def __init__(self):
+        self._local = threading.local()
+        self._shards = []       # 存活线程的分片
+        self._base = _Shard()   # 已结束的线程的计数
+        # 线程第一次写入、线程结束并入分片、抓取时使用。可重入：持有锁时触发的 finalize 回调不会死锁
+        self._lock = threading.RLock()
+        self._buckets = {}
+
+    def _shard(self):
+        try:
+            return self._local.shard
+        except AttributeError:
+            shard = self._local.shard = _Shard()
+            self._local.token = token = _ThreadToken()
+            finalizer = weakref.finalize(token, self._retire, shard)
+            finalizer.atexit = False
+            with self._lock:
+                self._shards.append(shard)
+            return shard
+
+    def _retire(self, shard):
+        """线程已结束：把它的分片并入基础分片。"""
+        with self._lock:
+            self._shards.remove(shard)
+            shard.merge_into(self._base.values, self._base.histograms)
+
+    def inc(self, name, labels=(), value=1):
+        values = self._shard().values
+        key = (name, labels)
+        values[key] = values.get(key, 0) + value
+
+    def observe(self, name, buckets, labels, value):
+        histograms = self._shard().histograms
+        key = (name, labels)
+        counts = histograms.get(key)
+        if counts is None:
+            counts = histograms[key] = [0] * (len(buckets) + 2)
+            self._buckets[name] = buckets
+        counts[bisect.bisect_left(buckets, value)] += 1
+        counts[-1] += value
+
+    def collect(self):
+        """合并所有分片，返回 (数值, 直方图) 两个 dict。"""
+        values, histograms = {}, {}
+        with self._lock:
+            # 分片列表与基础分片要在同一时刻读取，否则刚结束的线程可能被算两次或漏掉
+            shards = list(self._shards)
+            self._base.merge_into(values, histograms)
+        for shard in shards:
+            shard.merge_into(values, histograms)
+        return values, histograms
+
+    def render(self):
+        """输出 Prometheus 文本格式 (0.0.4)。"""
+        values, histograms = self.collect()
+        lines = []
+        for name, (kind, help_text) in METRICS.items():
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {kind}")
+            if kind == 'histogram':
+                buckets = self._buckets.get(name, ())
+                for (metric, labels), counts in sorted(histograms.items()):
+                    if metric != name:
+                        continue
+                    cumulative = 0
+                    for bound, count in zip(buckets + (float('inf'),), counts):
+                        cumulative += count
+                        le = '+Inf' if bound == float('inf') else _number(bound)
+                        lines.append(f"{name}_bucket{_labels(labels + (('le', le),))} {cumulative}")
+                    lines.append(f"{name}_sum{_labels(labels)} {_number(counts[-1])}")
+                    lines.append(f"{name}_count{_labels(labels)} {cumulative}")
+            else:
+                for (metric, labels), value in sorted(values.items()):
+                    if metric == name:
+                        lines.append(f"{name}{_labels(labels)} {_number(value)}")
+        lines.extend(_process_metrics())
+        return "\n".join(lines) + "\n"
+
+
+def _labels(labels):
+    if not labels:
+        return ""
+    escaped = (f'{key}="{str(value).replace(chr(92), chr(92) * 2).replace(chr(34), chr(92) + chr(34))}"'
+               for key, value in labels)
+    return "{" + ",".join(escaped) + "}"
+
+
+def _number(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+# --- 进程内存 ---
+def resident_memory_bytes():
+    """返回 (当前 RSS, 峰值 RSS)，无法获取的项为 None。"""
+    try:
+        current = peak = None
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith('VmRSS:'):
+                    current = int(line.split()[1]) * 1024
+                elif line.startswith('VmHWM:'):
+                    peak = int(line.split()[1]) * 1024
+        return current, peak
+    except OSError:
+        pass
+    try:
+        import psutil
+        info = psutil.Process().memory_info()
+        return info.rss, getattr(info, 'peak_wset', None)
+    except ImportError:
+        pass
+    try:
+        import resource
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return None, peak if sys.platform == 'darwin' else peak * 1024
+    except ImportError:
+        return None, None
+
+
+_STARTED = time.time()
+
+
+def _process_metrics():
+    current, peak = resident_memory_bytes()
+    lines = []
+    if current is not None:
+        lines += ["# HELP process_resident_memory_bytes 当前常驻内存",
+                  "# TYPE process_resident_memory_bytes gauge",
+                  f"process_resident_memory_bytes {current}"]
+    if peak is not None:
+        lines += ["# HELP process_peak_resident_memory_bytes 峰值常驻内存",
+                  "# TYPE process_peak_resident_memory_bytes gauge",
+                  f"process_peak_resident_memory_bytes {peak}"]
+    lines += ["# HELP process_start_time_seconds 进程启动时间",
+              "# TYPE process_start_time_seconds gauge",
+              f"process_start_time_seconds {_STARTED:.3f}",
+              "# HELP process_pid 进程号",
+              "# TYPE process_pid gauge",
+              f"process_pid {os.getpid()}"]
+    return lines
+
+
+registry = Registry()
+
+
+def record_messages(count):
+    """视图格式化完成后调用，累加已格式化的消息 (行) 数。"""
+    registry.inc('chat_cleaner_messages_formatted_total', value=count)
+
+
+def record_parse_error(exc):
+    """在上传解析失败 (JSON 语法、编码错误等客户端数据问题) 的异常处理分支中调用，按异常类型计数。"""
+    registry.inc('chat_cleaner_parse_errors_total', (('type', type(exc).__name__),))
+
+
+def record_unexpected_error(exc):
+    """视图中出现意料之外的异常 (服务端的问题，返回 500) 时调用，与解析错误分开计数。"""
+    registry.inc('chat_cleaner_unexpected_errors_total', (('type', type(exc).__name__),))
+
+
+def record_memory(route, report):
+    """汇总一个请求的内存统计 (StageTimer.finish_memory() 的结果)。"""
+    for stage, values in report['stages'].items():
+        labels = (('route', route), ('stage', stage))
+        registry.observe('chat_cleaner_stage_memory_peak_bytes', MEMORY_BUCKETS, labels, values['peak'])
+        registry.inc('chat_cleaner_stage_memory_delta_bytes_total', labels, values['delta'])
+    labels = (('route', route),)
+    registry.observe('chat_cleaner_request_memory_peak_bytes', MEMORY_BUCKETS, labels, report['peak'])
+    if report['peak_rss'] is not None:
+        registry.observe('chat_cleaner_request_peak_rss_bytes', MEMORY_BUCKETS, labels, report['peak_rss'])
+
+
+def install_metrics(app, path='/metrics'):
+    """为 Flask app 注册 /metrics 路由与请求统计。"""
+
+    @app.before_request
+    def _metrics_start():
+        g.metrics_started = time.perf_counter()
+        registry.inc('chat_cleaner_in_flight_requests', value=1)
+
+    @app.after_request
+    def _metrics_finish(response):
+        started = g.pop('metrics_started', None)
+        if started is None:
+            return response
+        route = request.url_rule.rule if request.url_rule is not None else 'other'
+        labels = (('route', route),)
+        size_in = request.content_length or 0
+        size_out = response.content_length
+        status = str(response.status_code)
+        method = request.method
+        timer = g.get('stage_timer')  # 内存统计结果在 install_timing 的 after_request 中生成，发送完毕时已就绪
+
+        def _done():
+            registry.inc('chat_cleaner_in_flight_requests', value=-1)
+            registry.inc('chat_cleaner_requests_total', (('method', method), ('route', route), ('status', status)))
+            registry.observe('chat_cleaner_request_duration_seconds', DURATION_BUCKETS, labels,
+                             time.perf_counter() - started)
+            registry.observe('chat_cleaner_request_size_bytes', SIZE_BUCKETS, labels, size_in)
+            registry.inc('chat_cleaner_bytes_in_total', labels, size_in)
+            if size_out is not None:
+                registry.inc('chat_cleaner_bytes_out_total', labels, size_out)
+            memory = getattr(timer, 'memory_report', None)
+            if memory is not None:
+                record_memory(route, memory)
+
+        call_after_send(response, _done)
+        return response
+
+    @app.teardown_request
+    def _metrics_teardown(exc):
+        # 视图抛出未处理异常时 after_request 不会执行，这里补上计数
+        if g.pop('metrics_started', None) is not None:
+            registry.inc('chat_cleaner_in_flight_requests', value=-1)
+            route = request.url_rule.rule if request.url_rule is not None else 'other'
+            registry.inc('chat_cleaner_requests_total', (('method', request.method), ('route', route), ('status', '500')))
+
+    def metrics():
+        return Response(registry.render(), mimetype='text/plain; version=0.0.4; charset=utf-8')
+
+    app.add_url_rule(path, 'metrics', metrics)
+    return app
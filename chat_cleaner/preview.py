@@ -0,0 +1,73 @@
+# -*- coding: utf-8 -*-
+"""
+只看文件开头的快速预览。
+
+网页只上传文件开头的一段 (head) 和从文件中间均匀取出的几个小片段 (samples)，
+不需要上传整个文件:
+
+    * head 用 jsonio.iter_messages 增量解码，取前 N 条消息交给格式化函数，
+      用户在正式转换前就能看到开关效果
+    * 总消息数按抽样估算：先在 head 里统计每条消息平均出现几次 "timestamp" 键，
+      再用 head + samples 中该键的出现密度乘以文件总大小
+"""
+import io
+import json
+
+from chat_cleaner import jsonio
+
+# 用于估算的键，按顺序选择 head 中出现过的第一个
+_COUNT_KEYS = (b'"timestamp"', b'"sender"', b'"content"')
+
+
+def sample_head(head, limit):
+    """
+    解码文件开头，返回 (前 limit 条消息, head 中完整消息的条数, head 是否已包含整个数组)。
+
+    head 通常在某条消息中间被截断，截断处之前的消息都会被计数。
+
+    Raises:
+        ValueError: 顶层不是数组，或 head 中连一条完整的消息都没有。
+    """
+    messages = []
+    count = 0
+    complete = False
+    try:
+        for message in jsonio.iter_messages(io.BytesIO(head), read_size=64 * 1024):
+            if count < limit:
+                messages.append(message)
+            count += 1
+        complete = True
+    except (json.JSONDecodeError, UnicodeDecodeError):
+        # head 在消息或多字节字符中间被截断
+        if not count:
+            raise ValueError("文件开头无法解析为 JSON 消息列表")
+    return messages, count, complete
+
+
+def estimate_total(count, head, samples, total_size, complete):
+    """
+    估算整个文件的消息条数。
+
+    Args:
+        count (int): head 中完整消息的条数 (sample_head 的返回值)。
+        head (bytes): 文件开头。
+        samples (list): 从文件其他位置截取的片段 (bytes)。
+        total_size (int): 文件总字节数。
+        complete (bool): head 是否已包含整个数组，为 True 时 count 就是准确值。
+
+    Returns:
+        (估计条数, 是否准确)
+    """
+    if complete or not count:
+        return count, complete
+    for key in _COUNT_KEYS:
+        in_head = head.count(key)
+        if in_head:
+            break
+    else:
+        # 没有可用于统计的键，只能按 head 的平均消息大小推算
+        return round(count * total_size / len(head)), False
+    per_message = in_head / count
+    occurrences = in_head + sum(sample.count(key) for sample in samples)
+    sampled_bytes = len(head) + sum(len(sample) for sample in samples)
+    return max(count, round(occurrences / sampled_bytes * total_size / per_message)), False
@@ -0,0 +1,134 @@
+# -*- coding: utf-8 -*-
+"""
+紧凑的聊天消息记录。
+
+QQ Chat Exporter 导出的每条消息都带有 id、elements、原始路径等大量字段，
+而 format_chat_log 只会读取 sender / content / timestamp / id 四个字段。
+json.loads 默认会为每条消息保留一个完整的 dict，两百万条消息时仅这些 dict
+就要占用数 GB 内存。这里在解码阶段 (object_hook) 就把消息转换成 __slots__
+记录，只保留需要的字段，其余字段随即被释放。
+
+只转换顶层元素：content 等字段里嵌套的对象 (例如 [{"type": "text", "content": "..."}])
+即使带有 content 字段也原样保留，与 json.loads 的结果一致。
+"""
+import json
+import sys
+
+# format_chat_log 实际读取的字段
+MESSAGE_FIELDS = ('id', 'sender', 'content', 'timestamp')
+
+
+class ChatMessage(object):
+    """
+    只保留格式化所需字段的消息记录。
+
+    未出现在原始 JSON 中的字段不会被赋值，因此 get() 的行为与 dict.get 完全一致
+    (字段存在但值为 null 时返回 None，字段不存在时返回 default)。
+    """
+    __slots__ = MESSAGE_FIELDS
+
+    def get(self, key, default=None):
+        if key in MESSAGE_FIELDS:
+            return getattr(self, key, default)
+        return default
+
+    def __contains__(self, key):
+        return key in MESSAGE_FIELDS and hasattr(self, key)
+
+    def to_dict(self):
+        return {key: getattr(self, key) for key in MESSAGE_FIELDS if hasattr(self, key)}
+
+    def __eq__(self, other):
+        if isinstance(other, ChatMessage):
+            return self.to_dict() == other.to_dict()
+        return NotImplemented
+
+    def __repr__(self):
+        return f"ChatMessage({self.to_dict()!r})"
+
+    @classmethod
+    def from_dict(cls, obj):
+        """从解码得到的 dict 构建记录，发送者名称会被 intern 以便重复名称共享同一对象。"""
+        record = cls()
+        if 'id' in obj:
+            record.id = obj['id']
+        if 'sender' in obj:
+            sender = obj['sender']
+            record.sender = sys.intern(sender) if type(sender) is str else sender
+        if 'content' in obj:
+            record.content = obj['content']
+        if 'timestamp' in obj:
+            record.timestamp = obj['timestamp']
+        return record
+
+
+def compact_message(obj):
+    """
+    把解码得到的一条顶层消息转换为 ChatMessage：看起来像消息的对象 (含 sender / content / timestamp 之一)
+    转换，其他值原样返回。
+
+    不能用作 object_hook：object_hook 对嵌套的对象同样生效，会把 content 里的对象也转换掉。
+    """
+    if type(obj) is dict and ('sender' in obj or 'content' in obj or 'timestamp' in obj):
+        return ChatMessage.from_dict(obj)
+    return obj
+
+
+def compact_messages(data):
+    """把 json.loads 的结果中的顶层消息转换为 ChatMessage (顶层是数组时转换每个元素)。"""
+    if type(data) is list:
+        return [compact_message(item) for item in data]
+    return compact_message(data)
+
+
+def _compact_hook(obj):
+    # 解码期间的 object_hook：嵌套的 elements 等对象在消息转换后立即被释放。
+    # 它同样会转换嵌套在 content 里的对象，decode_messages 事后检查并在需要时重新解码
+    if 'sender' in obj or 'content' in obj or 'timestamp' in obj:
+        return ChatMessage.from_dict(obj)
+    return obj
+
+
+def _contains_record(value):
+    """list / dict 中 (任意深度) 是否有被 _compact_hook 转换的对象。"""
+    stack = [value]
+    while stack:
+        value = stack.pop()
+        for item in (value.values() if type(value) is dict else value):
+            kind = type(item)
+            if kind is ChatMessage:
+                return True
+            if kind is list or kind is dict:
+                stack.append(item)
+    return False
+
+
+def _converted_nested(data):
+    """_compact_hook 是否转换了顶层消息以外的对象。"""
+    for item in (data if type(data) is list else (data,)):
+        kind = type(item)
+        if kind is ChatMessage:
+            for key in MESSAGE_FIELDS:
+                value = getattr(item, key, None)
+                kind = type(value)
+                if kind is ChatMessage or ((kind is list or kind is dict) and _contains_record(value)):
+                    return True
+        elif (kind is list or kind is dict) and _contains_record(item):
+            return True
+    return False
+
+
+def decode_messages(text):
+    """
+    解码 QQ 聊天记录 JSON，顶层的消息以 ChatMessage 形式返回。结果与异常都与
+    compact_messages(json.loads(text)) 相同。
+
+    解码时就用 object_hook 转换消息，完整的 dict 不会同时留在内存中。
+    content 等字段里嵌套了像消息的对象时 (很少见)，object_hook 也会转换它们，
+    这时改为先完整解码、再只转换顶层元素。
+    """
+    data = json.loads(text, object_hook=_compact_hook)
+    if _converted_nested(data):
+        del data
+        return compact_messages(json.loads(text))
+    return data
@@ -0,0 +1,169 @@
+# -*- coding: utf-8 -*-
+"""
+从磁盘直接发送格式化结果 (零拷贝下载、断点续传、条件请求)。
+
+结果文件已经在磁盘上时 (监视进程的输出目录、批量转换的结果)，没有必要读进 Python 内存再发出去。
+install_results(app) 注册 GET /results/<文件名>，发送 CHAT_CLEANER_RESULTS_DIR 目录下的文件:
+
+    * 响应体是 wsgi.file_wrapper 包装的文件对象：gunicorn 用 sendfile() 由内核直接把文件发到 socket，
+      waitress 由自己的发送线程分块读取，视图线程立即返回，不经过 Python 的读写循环
+    * Range: bytes=N- (浏览器、下载工具续传) 从第 N 字节开始发送到文件末尾，同样零拷贝；
+      中间的一段 (bytes=N-M) 在 gunicorn / waitress 上也零拷贝 (两者都只发送 Content-Length 字节)，
+      其他服务器上按块读取，只读这一段。多个区间的请求按整个文件返回 200，超出文件大小返回 416
+    * ETag 由 inode、大小与修改时间 (纳秒) 组成，Last-Modified 为修改时间：
+      If-None-Match / If-Modified-Since 未变化时返回 304，If-Range 不匹配时忽略 Range 返回整个文件。
+      结果总是写临时文件再原子改名，内容变化时 inode 必然变化，不需要读文件计算摘要
+
+文件名只能是目录中的普通文件 (不含子目录、不以 . 开头，正在写入的临时文件不会被发送)。
+没有设置 CHAT_CLEANER_RESULTS_DIR 时不注册路由。
+"""
+import mimetypes
+import os
+import stat
+from urllib.parse import quote
+
+from flask import Response, abort, request
+from werkzeug.http import http_date
+from werkzeug.wsgi import wrap_file
+
+DIR_ENV = 'CHAT_CLEANER_RESULTS_DIR'
+CACHE_CONTROL = 'private, no-cache'
+READ_BLOCK = 256 * 1024
+# 这些服务器的 wsgi.file_wrapper 只发送 Content-Length 字节，可以直接用于文件中间的一段
+_BOUNDED_FILE_WRAPPER_SERVERS = ('gunicorn', 'waitress')
+
+
+def file_etag(st):
+    """由 os.stat 结果生成强 ETag。"""
+    return f'"{st.st_ino:x}-{st.st_size:x}-{st.st_mtime_ns:x}"'
+
+
+def _not_modified(etag, mtime):
+    """按 If-None-Match / If-Modified-Since 判断客户端的副本是否仍然有效。"""
+    if request.if_none_match:
+        return request.if_none_match.contains_weak(etag.strip('"'))
+    since = request.if_modified_since
+    return since is not None and int(mtime) <= since.timestamp()
+
+
+def _range_applies(etag, mtime):
+    """If-Range 不匹配 (文件已经变了) 时忽略 Range，返回整个文件。"""
+    if_range = request.if_range
+    if if_range.etag is not None:
+        return if_range.etag == etag.strip('"')
+    if if_range.date is not None:
+        return int(mtime) <= if_range.date.timestamp()
+    return True
+
+
+class _FileRange(object):
+    """按块读取文件中的一段 (服务器的 file_wrapper 会读到文件末尾时使用)。"""
+
+    def __init__(self, f, length):
+        self.file = f
+        self.remaining = length
+
+    def __iter__(self):
+        while self.remaining > 0:
+            block = self.file.read(min(READ_BLOCK, self.remaining))
+            if not block:
+                break
+            self.remaining -= len(block)
+            yield block
+
+    def close(self):
+        self.file.close()
+
+
+def _body(f, start, end, size):
+    """从 start 开始发送到 end (不含) 的响应体；尽量交给服务器的 file_wrapper 零拷贝发送。"""
+    f.seek(start)
+    software = request.environ.get('SERVER_SOFTWARE', '').lower()
+    if end == size or software.startswith(_BOUNDED_FILE_WRAPPER_SERVERS):
+        return wrap_file(request.environ, f, READ_BLOCK)
+    return _FileRange(f, end - start)
+
+
+def file_response(path, download_name=None, mimetype=None):
+    """
+    以下载方式发送磁盘上的文件，支持 Range 与条件请求。
+
+    Args:
+        path (str): 文件路径。
+        download_name (str): 下载文件名；为 None 时使用文件本身的名称。
+        mimetype (str): 为 None 时按扩展名猜测，.txt 为 text/plain; charset=utf-8。
+
+    Returns:
+        Response: 200、206、304 或 416。
+
+    Raises:
+        NotFound: 文件不存在或不是普通文件。
+    """
+    try:
+        f = open(path, 'rb')
+    except OSError:
+        abort(404)
+    try:
+        st = os.fstat(f.fileno())
+        if not stat.S_ISREG(st.st_mode):
+            abort(404)
+        size, mtime = st.st_size, st.st_mtime
+        etag = file_etag(st)
+        download_name = download_name or os.path.basename(path)
+        if mimetype is None:
+            mimetype = mimetypes.guess_type(download_name)[0] or 'application/octet-stream'
+            if mimetype.startswith('text/'):
+                mimetype += '; charset=utf-8'
+        headers = {'ETag': etag, 'Last-Modified': http_date(mtime), 'Cache-Control': CACHE_CONTROL,
+                   'Accept-Ranges': 'bytes'}
+        if _not_modified(etag, mtime):
+            f.close()
+            return Response(status=304, headers=headers)
+
+        start, end, status = 0, size, 200
+        ranges = request.range
+        if ranges is not None and ranges.units == 'bytes' and len(ranges.ranges) == 1 and _range_applies(etag, mtime):
+            bounds = ranges.range_for_length(size)
+            if bounds is None:
+                f.close()
+                headers['Content-Range'] = f'bytes */{size}'
+                return Response(status=416, headers=headers)
+            (start, end), status = bounds, 206
+            headers['Content-Range'] = f'bytes {start}-{end - 1}/{size}'
+        headers['Content-Length'] = str(end - start)
+        # filename 给不支持 filename* 的旧客户端，非 ASCII 字符替换为 _
+        ascii_name = download_name.encode('ascii', 'replace').decode('ascii').replace('?', '_').replace('"', '_')
+        headers['Content-Disposition'] = f"attachment; filename=\"{ascii_name}\"; filename*=UTF-8''{quote(download_name)}"
+        if request.method == 'HEAD':
+            f.close()
+            return Response(status=status, headers=headers, content_type=mimetype)
+        return Response(_body(f, start, end, size), status=status, headers=headers, content_type=mimetype,
+                        direct_passthrough=True)
+    except BaseException:
+        f.close()
+        raise
+
+
+def install_results(app, directory=None):
+    """
+    注册 GET /results/<文件名>，发送 directory 中的结果文件。
+
+    Args:
+        app: Flask 应用。
+        directory (str): 结果目录；为空时读取环境变量 CHAT_CLEANER_RESULTS_DIR，仍为空则不注册路由。
+
+    Returns:
+        str: 结果目录的绝对路径，未注册时为 None。
+    """
+    directory = directory or os.environ.get(DIR_ENV)
+    if not directory:
+        return None
+    directory = os.path.abspath(directory)
+
+    @app.route('/results/<name>', methods=['GET'])
+    def download_result(name):
+        if name.startswith('.') or os.path.basename(name) != name:
+            abort(404)
+        return file_response(os.path.join(directory, name))
+
+    return directory
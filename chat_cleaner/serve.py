@@ -0,0 +1,161 @@
+# -*- coding: utf-8 -*-
+"""
+生产环境启动方式。
+
+各脚本末尾的 app.run() 只适合本机自用 (Flask 开发服务器，单进程)。
+共享部署时用本模块以多进程 + 多线程方式运行同一个 app:
+
+    python -m chat_cleaner.serve --app turbo --workers 4 --threads 8 --timeout 300 --max-content-length 64M
+
+服务器选择 (--server auto):
+    gunicorn   Linux / macOS 上已安装时使用，gthread worker，多进程 + 多线程
+    waitress   Windows 或未安装 gunicorn 时使用，单进程多线程 (--workers 被忽略)
+    werkzeug   两者都没有时回退到 Werkzeug 多线程服务器，仅用于应急
+    uvicorn    需要显式指定 (--server uvicorn)，asyncio 方式运行 (见 chat_cleaner.asgi)，
+               慢速上传不占用线程，--threads 是执行格式化的线程池大小
+
+所有参数也可以用环境变量设置，例如 CHAT_CLEANER_WORKERS=4。调试模式始终关闭。
+"""
+import argparse
+import os
+import sys
+
+from chat_cleaner.apps import SCRIPTS, load_app
+
+DEFAULTS = {
+    'app': 'turbo',
+    'host': '0.0.0.0',
+    'port': '5000',
+    'server': 'auto',
+    'workers': str(min(8, (os.cpu_count() or 1) * 2)),
+    'threads': '8',
+    'timeout': '300',
+    'max_content_length': '',
+}
+
+
+def parse_size(value):
+    """把 '64M'、'512K'、'1G' 或纯数字转换为字节数；空值返回 None (保持脚本自己的设置)。"""
+    value = str(value).strip().upper()
+    if not value:
+        return None
+    units = {'K': 1024, 'M': 1024 ** 2, 'G': 1024 ** 3}
+    if value.endswith('B'):
+        value = value[:-1]
+    if value and value[-1] in units:
+        return int(float(value[:-1]) * units[value[-1]])
+    return int(value)
+
+
+def _env(name):
+    return os.environ.get(f"CHAT_CLEANER_{name.upper()}", DEFAULTS[name])
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog='python -m chat_cleaner.serve', description='以生产模式运行聊天记录清理 WebUI')
+    parser.add_argument('--app', default=_env('app'), choices=sorted(SCRIPTS), help='要运行的版本 (默认 turbo)')
+    parser.add_argument('--host', default=_env('host'))
+    parser.add_argument('--port', type=int, default=int(_env('port')))
+    parser.add_argument('--server', default=_env('server'), choices=('auto', 'gunicorn', 'waitress', 'werkzeug', 'uvicorn'))
+    parser.add_argument('--workers', type=int, default=int(_env('workers')), help='进程数 (仅 gunicorn / uvicorn)')
+    parser.add_argument('--threads', type=int, default=int(_env('threads')), help='每个进程的线程数')
+    parser.add_argument('--timeout', type=int, default=int(_env('timeout')),
+                        help='worker 无响应 / 连接空闲的超时时间 (秒)，上传大文件时需要足够长')
+    parser.add_argument('--max-content-length', default=_env('max_content_length'),
+                        help='覆盖上传大小限制，例如 64M；不指定时使用脚本内的设置')
+    return parser
+
+
+def choose_server(name):
+    if name != 'auto':
+        return name
+    if os.name != 'nt':
+        try:
+            import gunicorn  # noqa: F401
+            return 'gunicorn'
+        except ImportError:
+            pass
+    try:
+        import waitress  # noqa: F401
+        return 'waitress'
+    except ImportError:
+        return 'werkzeug'
+
+
+def prepare_app(name, max_content_length=None):
+    app = load_app(name)
+    app.debug = False
+    if max_content_length is not None:
+        app.config['MAX_CONTENT_LENGTH'] = max_content_length
+    return app
+
+
+def run_gunicorn(options, max_content_length):
+    from gunicorn.app.base import BaseApplication
+
+    class ChatCleanerApplication(BaseApplication):
+        def load_config(self):
+            self.cfg.set('bind', f"{options.host}:{options.port}")
+            self.cfg.set('workers', options.workers)
+            self.cfg.set('threads', options.threads)
+            self.cfg.set('worker_class', 'gthread')
+            self.cfg.set('timeout', options.timeout)
+            self.cfg.set('graceful_timeout', 30)
+            self.cfg.set('keepalive', 5)
+            self.cfg.set('accesslog', '-')
+
+        def load(self):
+            # 每个 worker 进程各自导入 app (不预加载)，worker 之间互不共享状态
+            return prepare_app(options.app, max_content_length)
+
+    ChatCleanerApplication().run()
+
+
+def run_waitress(options, max_content_length):
+    import waitress
+    app = prepare_app(options.app, max_content_length)
+    if options.workers > 1:
+        print(f"提示：waitress 只支持单进程，--workers {options.workers} 被忽略，使用 {options.threads} 个线程。")
+    limit = app.config.get('MAX_CONTENT_LENGTH') or 1024 ** 3
+    waitress.serve(app, host=options.host, port=options.port, threads=options.threads,
+                   channel_timeout=options.timeout, max_request_body_size=limit)
+
+
+def run_werkzeug(options, max_content_length):
+    from werkzeug.serving import run_simple
+    app = prepare_app(options.app, max_content_length)
+    print("警告：未安装 gunicorn 或 waitress，使用 Werkzeug 多线程服务器 (pip install waitress 以获得更好的并发能力)。")
+    run_simple(options.host, options.port, app, threaded=True, use_reloader=False, use_debugger=False)
+
+
+def run_uvicorn(options, max_content_length):
+    import uvicorn
+    # 多进程时每个 worker 通过工厂函数各自加载 app，参数经环境变量传入
+    os.environ['CHAT_CLEANER_APP'] = options.app
+    os.environ['CHAT_CLEANER_THREADS'] = str(options.threads)
+    if max_content_length is not None:
+        os.environ['CHAT_CLEANER_MAX_CONTENT_LENGTH'] = str(max_content_length)
+    uvicorn.run('chat_cleaner.asgi:create_app', factory=True, host=options.host, port=options.port,
+                workers=options.workers, timeout_keep_alive=5, log_level='info')
+
+
+def main(argv=None):
+    options = build_parser().parse_args(argv)
+    max_content_length = parse_size(options.max_content_length)
+    server = choose_server(options.server)
+    workers = options.workers if server in ('gunicorn', 'uvicorn') else 1
+    # worker 进程据此平分默认的内存预算 (见 chat_cleaner.admission)
+    os.environ['CHAT_CLEANER_WORKERS'] = str(workers)
+    print("---------------------------------------------")
+    print(f"生产模式启动: 版本 {options.app}，服务器 {server}，地址 http://{options.host}:{options.port}")
+    print(f"进程 {workers}，每进程线程 {options.threads}，"
+          f"请求超时 {options.timeout} 秒，上传限制 "
+          f"{'脚本默认' if max_content_length is None else f'{max_content_length / 1048576:.1f} MB'}")
+    print("---------------------------------------------")
+    runner = {'gunicorn': run_gunicorn, 'waitress': run_waitress, 'werkzeug': run_werkzeug,
+              'uvicorn': run_uvicorn}[server]
+    runner(options, max_content_length)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,110 @@
+# -*- coding: utf-8 -*-
+"""
+预渲染、预压缩的首页。
+
+各版本的首页是一大段内嵌 HTML/CSS/JS，内容在运行期间不会变化。
+以前每次 GET / 都要重新渲染 Jinja 模板 (0.9、GeminiNext) 或原样发送几十 KB 的未压缩文本 (1.x)，
+也没有缓存头。StaticPage 在第一次请求时只做一次 (brotli 最高压缩级别需要几十毫秒，
+放在导入时会拖慢每个只想调用格式化函数的进程):
+
+    * 编码为 UTF-8，并生成 gzip 和 brotli (已安装 brotli 时) 两个压缩版本
+    * 按内容计算强 ETag，每个压缩版本各有自己的 ETag
+    * Cache-Control: no-cache —— 浏览器每次都会带 If-None-Match 来验证，内容没变就返回 304，
+      发布新版本后也能立即生效
+
+带 flash 消息的页面 (0.9、GeminiNext 出错重定向回首页时) 仍需动态渲染，见 render_flash_aware()。
+"""
+import gzip
+import hashlib
+import threading
+
+from flask import Response, render_template_string, request, session
+
+try:
+    import brotli
+except ImportError:
+    try:
+        import brotlicffi as brotli
+    except ImportError:
+        brotli = None
+
+CACHE_CONTROL = 'no-cache'
+
+
+class StaticPage(object):
+    """
+    一个在内存中预先压缩好的 HTML 页面。
+
+    Args:
+        html (str | callable): 完整的页面内容，或返回页面内容的函数 (第一次请求时才调用)。
+    """
+
+    def __init__(self, html):
+        self._html = html
+        self._variants = None
+        self._lock = threading.Lock()
+
+    @property
+    def variants(self):
+        """编码名 -> (内容, ETag)；第一次访问时生成。"""
+        if self._variants is None:
+            with self._lock:
+                if self._variants is None:
+                    self._build()
+        return self._variants
+
+    def _build(self):
+        html = self._html() if callable(self._html) else self._html
+        body = html.encode('utf-8')
+        digest = hashlib.sha256(body).hexdigest()[:20]
+        # 同一内容的不同压缩版本必须使用不同的强 ETag
+        variants = {'identity': (body, f'"{digest}"'),
+                    'gzip': (gzip.compress(body, 9, mtime=0), f'"{digest}-gz"')}
+        if brotli is not None:
+            variants['br'] = (brotli.compress(body, quality=11), f'"{digest}-br"')
+        self._variants = variants
+
+    def choose_encoding(self, accept_encodings):
+        """按客户端 Accept-Encoding 选择压缩方式，优先 br，其次 gzip。"""
+        best, best_quality = 'identity', 0
+        for encoding in ('br', 'gzip'):
+            quality = accept_encodings[encoding]
+            if encoding in self.variants and quality > best_quality:
+                best, best_quality = encoding, quality
+        return best
+
+    def response(self):
+        """返回当前请求对应的响应 (200 或 304)。"""
+        variants = self.variants
+        encoding = self.choose_encoding(request.accept_encodings)
+        body, etag = variants[encoding]
+        headers = {'ETag': etag, 'Cache-Control': CACHE_CONTROL, 'Vary': 'Accept-Encoding'}
+        # 只与本次选中的版本比较：客户端缓存的是 gzip 版本、现在要的是 br 时必须返回新内容
+        if request.if_none_match.contains_weak(etag.strip('"')):
+            return Response(status=304, headers=headers)
+        if encoding != 'identity':
+            headers['Content-Encoding'] = encoding
+        return Response(body, mimetype='text/html', headers=headers)
+
+
+def prerender(app, template):
+    """返回 StaticPage，第一次请求时在没有 flash 消息的请求上下文中渲染一次 Jinja 模板。"""
+    def render():
+        with app.test_request_context('/'):
+            return render_template_string(template)
+    return StaticPage(render)
+
+
+def render_flash_aware(page, template):
+    """
+    session 中有待显示的 flash 消息时动态渲染模板 (且不允许缓存)，否则返回预渲染页面。
+
+    Args:
+        page (StaticPage): prerender() 的结果。
+        template (str): 原始模板，用于动态渲染。
+    """
+    if '_flashes' in session:
+        response = Response(render_template_string(template), mimetype='text/html')
+        response.headers['Cache-Control'] = 'no-store'
+        return response
+    return page.response()
@@ -0,0 +1,357 @@
+# -*- coding: utf-8 -*-
+"""
+格式化结果的本地保留存储：短链接重新下载，同样的上传不再重复转换。
+
+以前格式化结果只存在于一次 send_file 响应里，浏览器 response.blob() 失败或用户需要再下载一次时，
+只能重新上传、重新转换。ResultStore 把结果保存在一个目录中:
+
+    <id>.txt          结果文件 (先写 .<id>.tmp 再原子改名，/results 与这里都不会发送写了一半的文件)
+    index.sqlite3     索引：id、输入摘要 (key)、下载文件名、大小、创建 / 访问 / 过期时间。
+                      SQLite 自带跨进程锁，gunicorn 多个 worker 共用同一个目录没有问题
+
+    * 每个结果有一个随机 id (22 个字符，无法猜测)，GET /r/<id> 直接从磁盘发送 (见 chat_cleaner.results，支持 Range 续传)，
+      响应头 X-Result-Link 给出这个链接。链接本身就是下载凭证，只返回给上传者
+    * 结果是私人聊天记录：目录权限为 0700、文件为 0600，只有运行服务的用户可以读取
+    * 开启 dedup 时 key 为输入内容与选项的 SHA-256，同一个文件用同样的选项再次上传时直接返回已保存的结果，
+      不再解析和格式化。任何上传了同一个文件的人都会拿到同一个链接，因此默认关闭，只适合单用户部署
+    * 结果保留 ttl 秒 (默认 24 小时)。后台清理线程每分钟删除过期的结果；总大小超过 quota 时
+      按最近访问时间从旧到新删除，直到低于上限。写入新结果后超出上限时也会立即清理一次
+
+默认不保存结果。设置 CHAT_CLEANER_STORE_DIR (结果目录) 或 CHAT_CLEANER_STORE_TTL (秒，0 表示不保存) 时开启，
+只设置 TTL 时目录为系统临时目录下的 chat_cleaner_results-<uid>。
+CHAT_CLEANER_STORE_QUOTA (例如 2G，默认 1G) 为总大小上限，CHAT_CLEANER_STORE_DEDUP=1 开启按内容复用结果。
+"""
+import hashlib
+import os
+import re
+import secrets
+import sqlite3
+import tempfile
+import threading
+import time
+
+DIR_ENV = 'CHAT_CLEANER_STORE_DIR'
+TTL_ENV = 'CHAT_CLEANER_STORE_TTL'
+QUOTA_ENV = 'CHAT_CLEANER_STORE_QUOTA'
+DEDUP_ENV = 'CHAT_CLEANER_STORE_DEDUP'
+
+DEFAULT_TTL = 24 * 3600
+DEFAULT_QUOTA = 1024 ** 3
+SWEEP_INTERVAL = 60
+# 格式化规则变化、旧结果不应再命中时加一
+KEY_VERSION = 1
+# 结果目录与文件只允许运行服务的用户访问
+DIR_MODE = 0o700
+FILE_MODE = 0o600
+
+_ID_RE = re.compile(r'^[A-Za-z0-9_-]{8,32}$')
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS results (
+    id TEXT PRIMARY KEY,
+    key TEXT,
+    filename TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    messages INTEGER,
+    created REAL NOT NULL,
+    accessed REAL NOT NULL,
+    expires REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS results_key ON results (key);
+CREATE INDEX IF NOT EXISTS results_expires ON results (expires);
+"""
+_COLUMNS = ('id', 'key', 'filename', 'size', 'messages', 'created', 'accessed', 'expires')
+
+
+def result_key(data, **options):
+    """输入内容 (bytes) 与影响输出的选项的摘要，用于查找已保存的结果。"""
+    digest = hashlib.sha256(f"v{KEY_VERSION};{sorted(options.items())!r};".encode('utf-8'))
+    digest.update(data)
+    return digest.hexdigest()
+
+
+class ResultStore(object):
+    """
+    一个结果目录及其索引。
+
+    Args:
+        directory (str): 结果目录，不存在时创建。
+        ttl (float): 结果保留的秒数。
+        quota (int): 所有结果的总字节数上限。
+        dedup (bool): 是否按输入摘要复用已保存的结果 (lookup)。为 False 时不记录摘要，lookup 总是返回 None。
+    """
+
+    def __init__(self, directory, ttl=DEFAULT_TTL, quota=DEFAULT_QUOTA, dedup=False):
+        self.directory = os.path.abspath(directory)
+        self.ttl = ttl
+        self.quota = quota
+        self.dedup = dedup
+        os.makedirs(self.directory, mode=DIR_MODE, exist_ok=True)
+        check_private(self.directory)
+        self.index_path = os.path.join(self.directory, 'index.sqlite3')
+        # 先以 0600 创建索引，SQLite 的 -wal / -shm 文件沿用索引文件的权限
+        os.close(os.open(self.index_path, os.O_WRONLY | os.O_CREAT, FILE_MODE))
+        self._local = threading.local()  # sqlite3 连接不能跨线程使用，每个线程一个
+        self._sweep_lock = threading.Lock()
+        self._db().executescript(_SCHEMA)
+
+    def _db(self):
+        db = getattr(self._local, 'db', None)
+        if db is None:
+            db = sqlite3.connect(self.index_path, timeout=30, isolation_level=None)
+            db.execute('PRAGMA journal_mode=WAL')  # 读写互不阻塞
+            self._local.db = db
+        return db
+
+    def path(self, result_id):
+        return os.path.join(self.directory, f"{result_id}.txt")
+
+    def _fetch(self, column, value):
+        now = time.time()
+        row = self._db().execute(
+            f"SELECT {', '.join(_COLUMNS)} FROM results WHERE {column} = ? AND expires > ? "
+            f"ORDER BY created DESC LIMIT 1", (value, now)).fetchone()
+        if row is None:
+            return None
+        entry = dict(zip(_COLUMNS, row))
+        if not os.path.exists(self.path(entry['id'])):
+            return None
+        self._db().execute("UPDATE results SET accessed = ? WHERE id = ?", (now, entry['id']))
+        return entry
+
+    def get(self, result_id):
+        """
+        按 id 查找未过期的结果。
+
+        Returns:
+            dict: 索引中的一行 (id、filename、size、expires 等)，不存在或已过期时为 None。
+        """
+        if not _ID_RE.match(result_id or ''):
+            return None
+        return self._fetch('id', result_id)
+
+    def lookup(self, key):
+        """按输入摘要 (result_key) 查找未过期的结果，找不到或没有开启 dedup 时返回 None。"""
+        if not self.dedup or key is None:
+            return None
+        return self._fetch('key', key)
+
+    def writer(self, filename, key=None):
+        """返回 ResultWriter，可以边生成边写入 (流式输出的结果)。"""
+        return ResultWriter(self, filename, key)
+
+    def put(self, body, filename, key=None, messages=None):
+        """
+        保存一份完整的结果。
+
+        Args:
+            body (bytes): 结果内容。
+            filename (str): 下载文件名。
+            key (str): 输入摘要 (result_key)，为 None 时不参与重复上传的查找。
+            messages (int): 消息数，只用于记录。
+
+        Returns:
+            dict: 索引中的一行；结果本身超过 quota 时不保存，返回 None。
+        """
+        writer = self.writer(filename, key)
+        writer.write(body)
+        return writer.commit(messages)
+
+    def _insert(self, entry):
+        self._db().execute(f"INSERT INTO results ({', '.join(_COLUMNS)}) VALUES ({', '.join('?' * len(_COLUMNS))})",
+                           tuple(entry[column] for column in _COLUMNS))
+
+    def usage(self):
+        """(结果数, 总字节数)。"""
+        count, total = self._db().execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM results").fetchone()
+        return count, total
+
+    def _remove(self, result_id):
+        self._db().execute("DELETE FROM results WHERE id = ?", (result_id,))
+        try:
+            os.remove(self.path(result_id))
+        except OSError:
+            pass
+
+    def sweep(self):
+        """
+        删除过期的结果；总大小超过 quota 时按最近访问时间从旧到新删除。
+
+        Returns:
+            tuple: (删除的结果数, 释放的字节数)。
+        """
+        with self._sweep_lock:
+            db = self._db()
+            now = time.time()
+            removed = db.execute("SELECT id, size FROM results WHERE expires <= ?", (now,)).fetchall()
+            _, total = self.usage()
+            total -= sum(size for _, size in removed)
+            if total > self.quota:
+                for result_id, size in db.execute("SELECT id, size FROM results WHERE expires > ? "
+                                                  "ORDER BY accessed", (now,)):
+                    removed.append((result_id, size))
+                    total -= size
+                    if total <= self.quota:
+                        break
+            for result_id, _ in removed:
+                self._remove(result_id)
+            self._remove_orphans(now)
+        return len(removed), sum(size for _, size in removed)
+
+    def _remove_orphans(self, now):
+        """删除没有索引记录的结果文件与中断写入留下的临时文件 (超过 ttl 没有修改的)。"""
+        known = {row[0] for row in self._db().execute("SELECT id FROM results")}
+        for name in os.listdir(self.directory):
+            if name.startswith('index.sqlite3'):
+                continue
+            if name.endswith('.txt') and name[:-len('.txt')] in known:
+                continue
+            path = os.path.join(self.directory, name)
+            try:
+                if now - os.path.getmtime(path) > self.ttl:
+                    os.remove(path)
+            except OSError:
+                pass
+
+    def start_sweeper(self, interval=SWEEP_INTERVAL):
+        """启动后台清理线程 (守护线程，随进程退出)。"""
+        def _run():
+            while True:
+                time.sleep(interval)
+                try:
+                    count, size = self.sweep()
+                except Exception as e:  # 清理失败不能让线程退出
+                    print(f"[store] 清理结果目录失败: {type(e).__name__}: {e}")
+                    continue
+                if count:
+                    print(f"[store] 清理 {count} 个结果，释放 {size / 1048576:.1f} MB")
+
+        thread = threading.Thread(target=_run, name='chat-cleaner-store-sweeper', daemon=True)
+        thread.start()
+        return thread
+
+
+def check_private(directory):
+    """
+    确认目录属于当前用户且其他用户不能访问 (已存在的目录权限过宽时改为 0700)。
+    结果目录与分块上传的暂存目录 (chat_cleaner.uploads) 都存放私人聊天记录。
+
+    Raises:
+        PermissionError: 目录属于其他用户 (例如共享临时目录中被别人抢先创建)。
+    """
+    if not hasattr(os, 'getuid'):  # Windows 没有 POSIX 权限位
+        return
+    st = os.stat(directory)
+    if st.st_uid != os.getuid():
+        raise PermissionError(f"目录 {directory} 不属于当前用户，拒绝使用")
+    if st.st_mode & 0o077:
+        os.chmod(directory, DIR_MODE)
+
+
+class ResultWriter(object):
+    """
+    写入中的一份结果。id 在开始写入时就已确定 (流式响应可以先发出链接)，commit() 之后才能下载。
+
+    Args:
+        store (ResultStore): 所属的存储。
+        filename (str): 下载文件名。
+        key (str): 输入摘要，可以为 None；存储没有开启 dedup 时不记录。
+    """
+
+    def __init__(self, store, filename, key=None):
+        self.store = store
+        self.filename = filename
+        self.key = key if store.dedup else None
+        self.id = secrets.token_urlsafe(16)
+        self.size = 0
+        self._tmp = os.path.join(store.directory, f".{self.id}.tmp")
+        self._file = os.fdopen(os.open(self._tmp, os.O_WRONLY | os.O_CREAT | os.O_EXCL, FILE_MODE), 'wb')
+
+    def write(self, data):
+        self._file.write(data)
+        self.size += len(data)
+
+    def commit(self, messages=None):
+        """
+        完成写入并加入索引。
+
+        Returns:
+            dict: 索引中的一行；结果超过 quota 时丢弃，返回 None。
+        """
+        self._file.close()
+        store = self.store
+        if self.size > store.quota:
+            self.abort()
+            return None
+        os.replace(self._tmp, store.path(self.id))
+        now = time.time()
+        entry = {"id": self.id, "key": self.key, "filename": self.filename, "size": self.size,
+                 "messages": messages, "created": now, "accessed": now, "expires": now + store.ttl}
+        store._insert(entry)
+        if store.usage()[1] > store.quota:
+            store.sweep()
+        return entry
+
+    def abort(self):
+        """放弃写入 (转换出错时)，删除临时文件。"""
+        self._file.close()
+        try:
+            os.remove(self._tmp)
+        except OSError:
+            pass
+
+
+def result_response(store, entry, download_name=None):
+    """从磁盘发送保存的结果，附带 X-Result-Link (短链接) 与 X-Result-Expires 响应头。"""
+    from werkzeug.http import http_date
+    from chat_cleaner.results import file_response
+    response = file_response(store.path(entry['id']), download_name or entry['filename'])
+    response.headers['X-Result-Link'] = f"/r/{entry['id']}"
+    response.headers['X-Result-Expires'] = http_date(entry['expires'])
+    return response
+
+
+def owner_id():
+    """当前用户的标识，用于系统临时目录下按用户区分的默认目录名。"""
+    return os.getuid() if hasattr(os, 'getuid') else os.environ.get('USERNAME', 'user')
+
+
+def install_store(app, directory=None, ttl=None, quota=None, dedup=None):
+    """
+    创建结果存储，注册 GET /r/<id> 短链接，并启动后台清理线程。
+    默认不保存结果：directory / ttl 与对应的环境变量都没有设置时直接返回 None。
+
+    Args:
+        app: Flask 应用。
+        directory (str): 结果目录；为空时读取 CHAT_CLEANER_STORE_DIR，只设置了 TTL 时为系统临时目录下的
+            chat_cleaner_results-<uid>。
+        ttl (float): 保留秒数；为空时读取 CHAT_CLEANER_STORE_TTL，默认 24 小时。为 0 时不保存结果。
+        quota (int): 总大小上限 (字节)；为空时读取 CHAT_CLEANER_STORE_QUOTA，默认 1 GB。
+        dedup (bool): 是否按内容复用结果；为空时读取 CHAT_CLEANER_STORE_DEDUP，默认关闭。
+
+    Returns:
+        ResultStore: 不保存结果时为 None。
+    """
+    from flask import jsonify
+    from chat_cleaner.serve import parse_size
+    directory = directory or os.environ.get(DIR_ENV)
+    if ttl is None and os.environ.get(TTL_ENV):
+        ttl = float(os.environ[TTL_ENV])
+    if not directory and ttl is None:
+        return None
+    ttl = DEFAULT_TTL if ttl is None else ttl
+    if ttl <= 0:
+        return None
+    directory = directory or os.path.join(tempfile.gettempdir(), f'chat_cleaner_results-{owner_id()}')
+    quota = quota or parse_size(os.environ.get(QUOTA_ENV, '')) or DEFAULT_QUOTA
+    dedup = os.environ.get(DEDUP_ENV) == '1' if dedup is None else dedup
+    store = ResultStore(directory, ttl, quota, dedup)
+    store.start_sweeper()
+
+    @app.route('/r/<result_id>', methods=['GET'])
+    def stored_result(result_id):
+        entry = store.get(result_id)
+        if entry is None:
+            return jsonify({"error": "结果不存在或已过期，请重新上传"}), 404
+        return result_response(store, entry)
+
+    return store
@@ -0,0 +1,300 @@
+# -*- coding: utf-8 -*-
+"""
+请求的分阶段计时与按需性能剖析。
+
+install_timing(app) 之后，每个请求都有一个 StageTimer (current_timer())，
+视图里用 `with current_timer().stage('parse'):` 包住各个阶段。请求结束时:
+    * 各阶段耗时写入 Server-Timing 响应头 (浏览器开发者工具可直接查看)
+    * 响应发送完毕后输出一行结构化日志 (含响应体传输耗时)，例如
+      [timing] {"method": "POST", "route": "/format", "status": 200, "total_ms": 812.4, "stages": {...}}
+
+设置环境变量 CHAT_CLEANER_PROFILE_DIR 后，每个请求都会在 cProfile 下运行，
+只保留最慢的 CHAT_CLEANER_PROFILE_KEEP 个 (默认 10) .prof 文件，
+可以用 `python -m pstats 文件` 或 snakeviz 查看。
+
+设置 CHAT_CLEANER_TRACE_MEMORY=1 后用 tracemalloc 统计每个阶段的内存:
+    * 阶段开始时记下当前已分配的字节数并重置峰值，结束时得到本阶段的净增 (delta，可以为负，
+      例如 decode 阶段释放了原始 bytes) 与相对阶段开始时的峰值 (peak)
+    * 整个请求的 Python 内存峰值 (相对请求开始时) 与进程 RSS；Linux 上每个请求开始时
+      重置 VmHWM (/proc/self/clear_refs)，peak_rss 就是这个请求期间的 RSS 峰值
+    * 写入 X-Memory-Usage 响应头 (格式与 Server-Timing 相同，单位字节) 和一行 [memory] {...} 日志，
+      并汇总到 /metrics 的 chat_cleaner_stage_memory_peak_bytes 等直方图中，用于估算容器内存、验证内存优化
+tracemalloc 会让格式化慢 2–3 倍，峰值统计是进程全局的，有并发请求时各请求的数字会互相混入，
+只在单线程 (--threads 1) 压测时开启。阶段不能嵌套。
+"""
+import cProfile
+import heapq
+import json
+import os
+import re
+import threading
+import time
+import tracemalloc
+
+from flask import g, request
+
+PROFILE_DIR_ENV = 'CHAT_CLEANER_PROFILE_DIR'
+PROFILE_KEEP_ENV = 'CHAT_CLEANER_PROFILE_KEEP'
+TRACE_MEMORY_ENV = 'CHAT_CLEANER_TRACE_MEMORY'
+
+
+class StageTimer(object):
+    """
+    记录一个请求内各阶段的耗时 (秒)。同名阶段会累加。
+
+    Args:
+        trace_memory (bool): 同时记录各阶段的内存 (需要 tracemalloc 已经开始跟踪)。
+    """
+
+    def __init__(self, trace_memory=False):
+        self.started = time.perf_counter()
+        self.stages = {}
+        self.fields = {}
+        self.memory = None  # 阶段名 -> [净增字节, 峰值字节]，未开启内存统计时为 None
+        self.memory_report = None  # finish_memory() 的结果
+        if trace_memory and tracemalloc.is_tracing():
+            self.memory = {}
+            self.memory_base = tracemalloc.get_traced_memory()[0]
+            self.memory_peak = 0  # 相对请求开始时的峰值
+
+    def stage(self, name):
+        return _Stage(self, name)
+
+    def add(self, name, seconds):
+        self.stages[name] = self.stages.get(name, 0.0) + seconds
+
+    def note(self, **fields):
+        """附加到日志行中的额外字段，例如文件大小、消息条数。"""
+        self.fields.update(fields)
+
+    def elapsed(self):
+        return time.perf_counter() - self.started
+
+    def server_timing(self):
+        parts = [f"{name};dur={seconds * 1000:.2f}" for name, seconds in self.stages.items()]
+        parts.append(f"total;dur={self.elapsed() * 1000:.2f}")
+        return ", ".join(parts)
+
+    def as_dict(self):
+        return {name: round(seconds * 1000, 2) for name, seconds in self.stages.items()}
+
+    def add_memory(self, name, delta, peak):
+        record = self.memory.get(name)
+        if record is None:
+            self.memory[name] = [delta, peak]
+        else:
+            record[0] += delta
+            record[1] = max(record[1], peak)
+
+    def finish_memory(self):
+        """
+        结束内存统计 (视图返回后调用)。
+
+        Returns:
+            dict: {"stages": {阶段: {"delta", "peak"}}, "peak": 请求内 Python 内存峰值, "rss", "peak_rss"}，
+                未开启内存统计时为 None。
+        """
+        if self.memory is None:
+            return None
+        current, peak = tracemalloc.get_traced_memory()
+        self.memory_peak = max(self.memory_peak, peak - self.memory_base)
+        from chat_cleaner.metrics import resident_memory_bytes  # metrics 导入了本模块，这里延迟导入
+        rss, peak_rss = resident_memory_bytes()
+        self.memory_report = {
+            "stages": {name: {"delta": delta, "peak": stage_peak} for name, (delta, stage_peak) in self.memory.items()},
+            "delta": current - self.memory_base, "peak": self.memory_peak, "rss": rss, "peak_rss": peak_rss}
+        return self.memory_report
+
+    def memory_header(self):
+        """X-Memory-Usage 响应头，格式与 Server-Timing 相同。"""
+        report = self.memory_report
+        parts = [f"{name};delta={stage['delta']};peak={stage['peak']}" for name, stage in report['stages'].items()]
+        parts.append(f"request;delta={report['delta']};peak={report['peak']}")
+        if report['peak_rss'] is not None:
+            parts.append(f"rss;current={report['rss']};peak={report['peak_rss']}")
+        return ", ".join(parts)
+
+
+class _Stage(object):
+    __slots__ = ('timer', 'name', 'started', 'allocated')
+
+    def __init__(self, timer, name):
+        self.timer = timer
+        self.name = name
+
+    def __enter__(self):
+        if self.timer.memory is not None:
+            self.allocated = tracemalloc.get_traced_memory()[0]
+            tracemalloc.reset_peak()
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        timer = self.timer
+        timer.add(self.name, time.perf_counter() - self.started)
+        if timer.memory is not None:
+            current, peak = tracemalloc.get_traced_memory()
+            timer.add_memory(self.name, current - self.allocated, peak - self.allocated)
+            timer.memory_peak = max(timer.memory_peak, peak - timer.memory_base)
+        return False
+
+
+class _NullTimer(StageTimer):
+    """请求上下文之外 (或未安装计时) 时使用，调用方无需判断。"""
+
+    def add(self, name, seconds):
+        pass
+
+
+def current_timer():
+    """返回当前请求的 StageTimer；不在请求中时返回一个丢弃数据的计时器。"""
+    try:
+        return g.stage_timer
+    except (AttributeError, RuntimeError):
+        return _NullTimer()
+
+
+class SlowestProfiles(object):
+    """只在磁盘上保留耗时最长的 N 份 cProfile 结果。"""
+
+    def __init__(self, directory, keep=10):
+        self.directory = directory
+        self.keep = max(1, keep)
+        self._heap = []  # (耗时, 文件路径)，堆顶是已保留中最快的一份
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+
+    def offer(self, seconds, profile, label):
+        with self._lock:
+            if len(self._heap) >= self.keep and seconds <= self._heap[0][0]:
+                return None
+            safe_label = re.sub(r'[^A-Za-z0-9_.-]+', '_', label).strip('_') or 'request'
+            path = os.path.join(self.directory,
+                                f"{seconds * 1000:010.1f}ms-{time.strftime('%Y%m%d-%H%M%S')}-{safe_label}.prof")
+            profile.dump_stats(path)
+            heapq.heappush(self._heap, (seconds, path))
+            if len(self._heap) > self.keep:
+                _, evicted = heapq.heappop(self._heap)
+                try:
+                    os.remove(evicted)
+                except OSError:
+                    pass
+            return path
+
+
+def call_after_send(response, callback):
+    """
+    响应体发送完毕 (WSGI 服务器关闭响应迭代器) 后调用 callback。
+
+    send_file 返回的是 direct_passthrough 响应，Werkzeug 不会为它执行
+    call_on_close 注册的回调；这里改为挂到文件包装对象自身的 close() 上，
+    不替换迭代器对象，服务器仍能识别 wsgi.file_wrapper 走零拷贝发送。
+    """
+    if not response.direct_passthrough:
+        response.call_on_close(callback)
+        return
+    body = response.response
+    original_close = getattr(body, 'close', None)
+    if original_close is None:
+        callback()
+        return
+
+    def close():
+        try:
+            original_close()
+        finally:
+            callback()
+
+    body.close = close
+
+
+def reset_peak_rss():
+    """把进程的 RSS 峰值 (VmHWM) 重置为当前 RSS，只在 Linux 上有效；成功时返回 True。"""
+    try:
+        with open('/proc/self/clear_refs', 'w') as f:
+            f.write('5')
+        return True
+    except OSError:
+        return False
+
+
+def install_timing(app, profile_dir=None, profile_keep=None, trace_memory=None):
+    """
+    为 Flask app 启用分阶段计时 (以及可选的性能剖析、内存统计)。
+
+    Args:
+        app: Flask 应用。
+        profile_dir: 保存 .prof 文件的目录；为空时读取环境变量 CHAT_CLEANER_PROFILE_DIR，
+                     仍为空则不做剖析。
+        profile_keep: 保留最慢请求的数量；为空时读取 CHAT_CLEANER_PROFILE_KEEP，默认 10。
+        trace_memory: 是否用 tracemalloc 统计各阶段内存；为 None 时读取 CHAT_CLEANER_TRACE_MEMORY (1 为开启)。
+    """
+    profile_dir = profile_dir or os.environ.get(PROFILE_DIR_ENV)
+    profiles = None
+    if profile_dir:
+        keep = profile_keep or int(os.environ.get(PROFILE_KEEP_ENV, '10'))
+        profiles = SlowestProfiles(profile_dir, keep)
+        print(f"性能剖析已开启：最慢的 {profiles.keep} 个请求保存到 {os.path.abspath(profile_dir)}")
+    if trace_memory is None:
+        trace_memory = os.environ.get(TRACE_MEMORY_ENV) == '1'
+    if trace_memory:
+        if not tracemalloc.is_tracing():
+            tracemalloc.start()
+        print("内存统计已开启 (tracemalloc)：各阶段内存写入 X-Memory-Usage 响应头与 [memory] 日志，格式化会明显变慢")
+
+    @app.before_request
+    def _start_timer():
+        if trace_memory:
+            reset_peak_rss()
+        g.stage_timer = StageTimer(trace_memory)
+        if profiles is not None:
+            profile = cProfile.Profile()
+            try:
+                profile.enable()
+            except ValueError:
+                # 同一时刻只能有一个剖析器在运行 (并发请求时)，这个请求就不剖析了
+                return
+            g.stage_profile = profile
+
+    @app.after_request
+    def _finish_timer(response):
+        timer = g.pop('stage_timer', None)
+        if timer is None:
+            return response
+        profile = g.pop('stage_profile', None)
+        if profile is not None:
+            profile.disable()
+        response.headers['Server-Timing'] = timer.server_timing()
+        memory = timer.finish_memory()
+        if memory is not None:
+            response.headers['X-Memory-Usage'] = timer.memory_header()
+        view_seconds = timer.elapsed()
+        method, route, status = request.method, request.path, response.status_code
+
+        def _log():
+            # 响应体发送完毕后才会调用，此时能统计到传输耗时
+            total = timer.elapsed()
+            stages = timer.as_dict()
+            stages['transfer'] = round((total - view_seconds) * 1000, 2)
+            line = {"method": method, "route": route, "status": status,
+                    "total_ms": round(total * 1000, 2), "stages": stages}
+            line.update(timer.fields)
+            print(f"[timing] {json.dumps(line, ensure_ascii=False)}", flush=True)
+            if memory is not None:
+                line = {"method": method, "route": route, "status": status}
+                line.update(memory)
+                print(f"[memory] {json.dumps(line)}", flush=True)
+            if profile is not None:
+                profiles.offer(total, profile, f"{method}{route}")
+
+        call_after_send(response, _log)
+        return response
+
+    @app.teardown_request
+    def _stop_profile(exc):
+        # 视图抛出未处理异常时 after_request 不会执行，这里保证剖析器被关闭
+        profile = g.pop('stage_profile', None)
+        if profile is not None:
+            profile.disable()
+
+    return app
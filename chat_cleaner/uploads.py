@@ -0,0 +1,387 @@
+# -*- coding: utf-8 -*-
+"""
+可续传的分块上传。
+
+一次性 multipart 上传几百 MB 的导出文件时，网络在 90% 处断开就得从头再来，
+MAX_CONTENT_LENGTH 也不得不设得很大。分块上传协议:
+
+    POST   /uploads                 {"filename": "...", "size": 字节数}
+                                    -> {"id", "chunkSize", "chunks", "received": []}
+    PUT    /uploads/<id>/<序号>     请求体为第 n 块原始数据，X-Chunk-CRC32 头为该块的 CRC32 (十六进制)
+    GET    /uploads/<id>            续传查询：已收到哪些块
+    GET    /uploads/<id>/result     格式化结果 (流式)；可以在上传开始时就请求，
+                                    服务端按顺序读取已到达的块，边收边解析边输出。
+                                    输出开始后才发现的错误 (后面的数据损坏、等待超时) 只能写在 200 响应的末尾：
+                                    最后一行为 STREAM_ERROR_MARKER + 错误信息 + "]"，客户端检查到它时应按失败处理
+    DELETE /uploads/<id>            下载完成后删除临时文件
+
+每块固定大小 (最后一块除外)，按偏移写入磁盘上预先分配好的临时文件；
+每块是否已收到记录在同目录的 .chunks 文件中 (每块一个字节)。状态全部在磁盘上，
+gunicorn 多 worker 时不同的块落在不同进程也没有问题。
+超过 CHAT_CLEANER_UPLOAD_TTL 秒 (默认 6 小时) 没有动静的上传会在创建新上传时被清理。
+暂存的是私人聊天记录：目录权限为 0700、文件为 0600，与结果存储 (chat_cleaner.store) 相同。
+"""
+import json
+import os
+import re
+import secrets
+import tempfile
+import time
+import zlib
+
+from flask import Response, jsonify, request, stream_with_context
+from werkzeug.utils import secure_filename
+
+from chat_cleaner import jsonio
+from chat_cleaner.diagnostics import FormatDiagnostics
+from chat_cleaner.metrics import record_messages, record_parse_error
+from chat_cleaner.store import DIR_MODE, FILE_MODE, check_private, owner_id
+from chat_cleaner.timing import current_timer
+
+DIR_ENV = 'CHAT_CLEANER_UPLOAD_DIR'
+MAX_SIZE_ENV = 'CHAT_CLEANER_UPLOAD_MAX_SIZE'
+TTL_ENV = 'CHAT_CLEANER_UPLOAD_TTL'
+
+DEFAULT_CHUNK_SIZE = 4 * 1024 * 1024
+MIN_CHUNK_SIZE = 64 * 1024
+MAX_CHUNK_SIZE = 32 * 1024 * 1024
+# 结果流等待下一块数据的最长时间，超时后结束输出 (客户端续传后重新请求结果即可)
+RESULT_IDLE_TIMEOUT = 120
+POLL_INTERVAL = 0.1
+OUTPUT_BATCH = 64 * 1024
+# 结果流中途出错时输出末尾的标记 (以 NUL 开头，正常的格式化结果不会出现)，网页据此显示失败
+STREAM_ERROR_MARKER = '\x00[错误：'
+
+_ID_RE = re.compile(r'^[A-Za-z0-9_-]{16,64}$')
+
+
+def _create(path, mode='wb', **kwargs):
+    """新建只有当前用户可读写 (0600) 的文件。"""
+    return os.fdopen(os.open(path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, FILE_MODE), mode, **kwargs)
+
+
+class UploadError(Exception):
+    """上传请求无效，status 为返回给客户端的 HTTP 状态码。"""
+
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.status = status
+
+
+class ChunkedUpload(object):
+    """
+    磁盘上的一个分块上传：<id>.json (元数据)、<id>.part (数据)、<id>.chunks (已收到的块)。
+
+    Args:
+        directory (str): 临时文件目录。
+        upload_id (str): 上传 id。
+    """
+
+    def __init__(self, directory, upload_id):
+        if not _ID_RE.match(upload_id or ''):
+            raise UploadError("无效的上传 id", 404)
+        self.id = upload_id
+        base = os.path.join(directory, upload_id)
+        self.meta_path = base + '.json'
+        self.data_path = base + '.part'
+        self.marks_path = base + '.chunks'
+        try:
+            with open(self.meta_path, encoding='utf-8') as f:
+                meta = json.load(f)
+        except (OSError, ValueError):
+            raise UploadError("上传不存在或已过期", 404)
+        self.filename = meta['filename']
+        self.size = meta['size']
+        self.chunk_size = meta['chunkSize']
+        self.chunks = max(1, -(-self.size // self.chunk_size))
+
+    @classmethod
+    def create(cls, directory, filename, size, chunk_size):
+        upload_id = secrets.token_urlsafe(16)
+        base = os.path.join(directory, upload_id)
+        with _create(base + '.part') as f:
+            f.truncate(size)
+        chunks = max(1, -(-size // chunk_size))
+        with _create(base + '.chunks') as f:
+            f.write(b'\0' * chunks)
+        # 元数据最后写入：它存在就说明其他文件都已就绪
+        with _create(base + '.json', 'w', encoding='utf-8') as f:
+            json.dump({"filename": filename, "size": size, "chunkSize": chunk_size}, f)
+        return cls(directory, upload_id)
+
+    def chunk_length(self, index):
+        return min(self.chunk_size, self.size - index * self.chunk_size)
+
+    def marks(self):
+        try:
+            with open(self.marks_path, 'rb') as f:
+                return f.read()
+        except OSError:
+            raise UploadError("上传不存在或已过期", 404)
+
+    def received(self):
+        return [i for i, mark in enumerate(self.marks()) if mark]
+
+    def write_chunk(self, index, data, crc32=None):
+        """校验并写入第 index 块。重复上传同一块是允许的 (续传时可能发生)。"""
+        if not 0 <= index < self.chunks:
+            raise UploadError(f"块序号超出范围 (共 {self.chunks} 块)")
+        expected = self.chunk_length(index)
+        if len(data) != expected:
+            raise UploadError(f"第 {index} 块大小应为 {expected} 字节，实际 {len(data)} 字节")
+        if crc32 is not None:
+            actual = zlib.crc32(data) & 0xffffffff
+            if actual != crc32:
+                # 422：客户端应重新发送这一块
+                raise UploadError(f"第 {index} 块校验失败", 422)
+        with open(self.data_path, 'r+b') as f:
+            f.seek(index * self.chunk_size)
+            f.write(data)
+        # 数据写完后才标记，读取方看到标记时数据一定已在文件中
+        with open(self.marks_path, 'r+b') as f:
+            f.seek(index)
+            f.write(b'\1')
+
+    def status(self):
+        received = self.received()
+        return {"id": self.id, "filename": self.filename, "size": self.size, "chunkSize": self.chunk_size,
+                "chunks": self.chunks, "received": received, "complete": len(received) == self.chunks}
+
+    def reader(self, idle_timeout=RESULT_IDLE_TIMEOUT):
+        return _SequentialReader(self, idle_timeout)
+
+    def delete(self):
+        for path in (self.meta_path, self.marks_path, self.data_path):
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+
+class _SequentialReader(object):
+    """按顺序读取上传数据；后续块还没到时阻塞等待 (轮询 .chunks 文件)。"""
+
+    def __init__(self, upload, idle_timeout):
+        self.upload = upload
+        self.idle_timeout = idle_timeout
+        self.position = 0
+        self.available = 0  # 从文件开头起连续可读的字节数
+        self.file = open(upload.data_path, 'rb')
+
+    def _wait_for(self, end):
+        upload = self.upload
+        deadline = time.monotonic() + self.idle_timeout
+        while self.available < end:
+            marks = upload.marks()
+            index = self.available // upload.chunk_size
+            while index < upload.chunks and marks[index]:
+                index += 1
+            available = min(upload.size, index * upload.chunk_size)
+            if available > self.available:
+                self.available = available
+                deadline = time.monotonic() + self.idle_timeout
+                continue
+            if time.monotonic() > deadline:
+                raise TimeoutError(f"等待第 {index} 块超时")
+            time.sleep(POLL_INTERVAL)
+
+    def read(self, size=-1):
+        if self.position >= self.upload.size:
+            return b''
+        end = self.upload.size if size is None or size < 0 else min(self.upload.size, self.position + size)
+        # 至少等到下一个字节可读，能读多少先返回多少
+        self._wait_for(self.position + 1)
+        end = min(end, self.available)
+        self.file.seek(self.position)
+        data = self.file.read(end - self.position)
+        self.position += len(data)
+        return data
+
+    def close(self):
+        self.file.close()
+
+
+def _sweep(directory, ttl):
+    """删除超过 ttl 秒没有更新的上传。"""
+    now = time.time()
+    try:
+        names = os.listdir(directory)
+    except OSError:
+        return
+    for name in names:
+        if not name.endswith('.chunks'):
+            continue
+        path = os.path.join(directory, name)
+        try:
+            if now - os.path.getmtime(path) > ttl:
+                ChunkedUpload(directory, name[:-len('.chunks')]).delete()
+        except (OSError, UploadError):
+            pass
+
+
+def _encode_batches(pieces):
+    """把格式化产出的文本片段合并为约 OUTPUT_BATCH 字节的 UTF-8 块。"""
+    batch, size = [], 0
+    for piece in pieces:
+        batch.append(piece)
+        size += len(piece)
+        if size >= OUTPUT_BATCH:
+            yield ''.join(batch).encode('utf-8', errors='replace')
+            batch, size = [], 0
+    if batch:
+        yield ''.join(batch).encode('utf-8', errors='replace')
+
+
+def install_uploads(app, format_stream, suffix='_formatted.txt', directory=None, chunk_size=DEFAULT_CHUNK_SIZE,
+                    store=None):
+    """
+    为 Flask app 注册分块上传路由。
+
+    Args:
+        app: Flask 应用。
+        format_stream: format_stream(messages, show_timestamp, diagnostics) -> 产出文本片段的生成器，
+                       messages 是逐条解码出的消息迭代器。
+        suffix (str): 下载文件名后缀，接在原文件名 (去掉扩展名) 之后。
+        directory (str): 临时文件目录；为空时读取 CHAT_CLEANER_UPLOAD_DIR，默认系统临时目录下的
+            chat_cleaner_uploads-<uid>。目录属于其他用户时抛出 PermissionError。
+        chunk_size (int): 建议的分块大小。
+        store (ResultStore): 结果同时写入这个存储 (见 chat_cleaner.store)，响应头 X-Result-Link 为重新下载的短链接；
+                             为 None 时不保存。
+    """
+    directory = (directory or os.environ.get(DIR_ENV)
+                 or os.path.join(tempfile.gettempdir(), f'chat_cleaner_uploads-{owner_id()}'))
+    os.makedirs(directory, mode=DIR_MODE, exist_ok=True)
+    check_private(directory)
+    # 结果流会等待后续的块，ASGI 方式运行时不能占用格式化线程池 (见 chat_cleaner.asgi)
+    app.config.setdefault('LONG_POLL_PATHS', []).append(r'^/uploads/[^/]+/result$')
+    from chat_cleaner.serve import parse_size
+    max_size = parse_size(os.environ.get(MAX_SIZE_ENV, '')) or 1024 ** 3
+    ttl = int(os.environ.get(TTL_ENV, str(6 * 3600)))
+
+    @app.errorhandler(UploadError)
+    def _upload_error(e):
+        return jsonify({"error": str(e)}), e.status
+
+    @app.route('/uploads', methods=['POST'])
+    def create_upload():
+        info = request.get_json(silent=True) or {}
+        filename = secure_filename(str(info.get('filename', ''))) or 'upload.json'
+        try:
+            size = int(info.get('size'))
+            size_ok = 0 < size <= max_size
+        except (TypeError, ValueError):
+            size_ok = False
+        if not size_ok:
+            return jsonify({"error": f"文件大小无效或超过上限 ({max_size / 1048576:.0f} MB)"}), 400
+        try:
+            requested = int(info.get('chunkSize') or chunk_size)
+        except (TypeError, ValueError):
+            return jsonify({"error": "分块大小 (chunkSize) 无效"}), 400
+        _sweep(directory, ttl)
+        upload = ChunkedUpload.create(directory, filename, size,
+                                      max(MIN_CHUNK_SIZE, min(MAX_CHUNK_SIZE, requested)))
+        return jsonify(upload.status()), 201
+
+    @app.route('/uploads/<upload_id>', methods=['GET'])
+    def upload_status(upload_id):
+        return jsonify(ChunkedUpload(directory, upload_id).status())
+
+    @app.route('/uploads/<upload_id>', methods=['DELETE'])
+    def delete_upload(upload_id):
+        ChunkedUpload(directory, upload_id).delete()
+        return '', 204
+
+    @app.route('/uploads/<upload_id>/<int:index>', methods=['PUT'])
+    def upload_chunk(upload_id, index):
+        upload = ChunkedUpload(directory, upload_id)
+        crc_header = request.headers.get('X-Chunk-CRC32')
+        try:
+            crc32 = int(crc_header, 16) if crc_header else None
+        except ValueError:
+            raise UploadError("X-Chunk-CRC32 头格式无效")
+        upload.write_chunk(index, request.get_data(cache=False), crc32)
+        return jsonify({"index": index, "received": len(upload.received()), "chunks": upload.chunks})
+
+    @app.route('/uploads/<upload_id>/result', methods=['GET'])
+    def upload_result(upload_id):
+        upload = ChunkedUpload(directory, upload_id)
+        show_timestamp = request.args.get('showTimestamp', 'true').lower() == 'true'
+        timer = current_timer()
+        timer.note(file=upload.filename, show_timestamp=show_timestamp, bytes_in=upload.size, chunked=True)
+        reader = upload.reader()
+        messages = jsonio.iter_messages(reader)
+        # 先解码出第一条消息再开始响应：顶层不是数组、开头就损坏等常见错误仍能返回 400
+        try:
+            first = next(messages, None)
+        except (ValueError, TimeoutError) as e:
+            reader.close()
+            record_parse_error(e)
+            return jsonify({"error": f"无效的 JSON 文件: {e}"}), 400
+        except UploadError:
+            reader.close()  # 等待期间上传被删除或清理：交给 _upload_error 返回 404
+            raise
+
+        def _messages():
+            if first is not None:
+                yield first
+            yield from messages
+
+        def _generate():
+            nonlocal writer
+            diagnostics = FormatDiagnostics()
+            count = 0
+
+            def _counted():
+                nonlocal count
+                for message in _messages():
+                    count += 1
+                    yield message
+
+            try:
+                with timer.stage('stream'):
+                    for batch in _encode_batches(format_stream(_counted(), show_timestamp, diagnostics)):
+                        if writer is not None:
+                            writer.write(batch)
+                        yield batch
+                if writer is not None:
+                    writer.commit(count)
+                    writer = None
+            except (ValueError, TimeoutError, UploadError) as e:
+                # 响应头已经发出，只能把错误写在输出末尾，客户端按 STREAM_ERROR_MARKER 识别。
+                # UploadError：等待后续的块时上传被删除或过期清理，不是解析错误
+                if not isinstance(e, UploadError):
+                    record_parse_error(e)
+                print(f"[{upload.filename}] 分块上传结果流中断: {e}")
+                yield f"\n\n{STREAM_ERROR_MARKER}{str(e)[:500]}]\n".encode('utf-8')
+            finally:
+                _release()
+                record_messages(count)
+                timer.note(messages=count)
+                if diagnostics:
+                    print(f"[{upload.filename}] {diagnostics.summary()}")
+                    timer.note(format_issues=diagnostics.counts)
+
+        def _release():
+            nonlocal writer
+            if writer is not None:
+                # 出错、客户端中途断开或响应体根本没有被读取：不完整的结果不保存
+                writer.abort()
+                writer = None
+            reader.close()
+
+        base_name = upload.filename.rsplit('.', 1)[0] if '.' in upload.filename else upload.filename
+        download_name = f"{base_name}{suffix}"
+        writer = store.writer(download_name) if store is not None else None
+        response = Response(stream_with_context(_generate()), mimetype='text/plain; charset=utf-8')
+        # 生成器没有开始执行时它的 finally 不会运行，响应关闭时再释放一次
+        response.call_on_close(_release)
+        if writer is not None:
+            # 结果流完整结束后链接才可用
+            response.headers['X-Result-Link'] = f"/r/{writer.id}"
+        from urllib.parse import quote
+        response.headers['Content-Disposition'] = (f"attachment; filename=\"{download_name}\"; "
+                                                   f"filename*=UTF-8''{quote(download_name)}")
+        response.headers['X-Accel-Buffering'] = 'no'  # 反向代理 (nginx) 不要缓冲，边生成边发送
+        return response
+
+    return app
@@ -0,0 +1,480 @@
+# -*- coding: utf-8 -*-
+"""
+监视文件夹，自动转换新放入的导出文件。
+
+    python -m chat_cleaner.watch 共享目录 [--output 输出目录] [--workers 4] [--recursive]
+
+    *.json  QQ Chat Exporter 导出，用 chat_cleaner.core.format_chat_log (与 Turbo 相同) 转换为 <名称>_formatted.txt
+    *.jsonl 每行一条消息的 QQ 记录，输出与 .json 相同 (每个文件在一个工作进程中处理)
+    *.txt   0.9 版的文本记录，用 chat_cleaner.core.clean_text_content 清理为 cleaned_<名称>.txt
+
+变化检测:
+    inotify    Linux 上通过 ctypes 直接调用，不需要额外依赖。只处理内核通知的变化，
+               新建子目录时自动加入监视，文件再多也不会重新扫描整个目录树
+    轮询       其他系统或 inotify 不可用时使用。每轮只 stat 各个目录，
+               目录的修改时间变了才重新列出该目录；每 10 轮再 stat 一次已知文件，发现原地修改
+
+文件最后一次变化后要稳定 --debounce 秒 (大小和修改时间都不变) 才会转换，避免读到写了一半的文件。
+转换在大小固定的进程池中进行；结果先写到输出目录里的临时文件，再用 os.replace 原子地改名，
+读取方不会看到不完整的输出。启动时输出比输入新的文件会被跳过。
+
+工作进程异常退出 (内存不足被杀、段错误) 时整个进程池失效，当时正在转换的文件都会失败。
+这时重新创建进程池，把这些文件逐个单独重新转换：单独转换时仍然导致进程退出的文件才记为失败。
+被杀死的进程来不及删除的临时输出文件也在这时清理。
+"""
+import argparse
+import collections
+import ctypes
+import ctypes.util
+import os
+import select
+import struct
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from chat_cleaner.convert import convert_file, output_name, remove_partial_outputs  # 工作进程只需要导入这个轻量模块
+
+INPUT_SUFFIXES = ('.json', '.jsonl', '.txt')
+# 常见的"正在写入"临时文件，忽略
+IGNORED_SUFFIXES = ('.tmp', '.part', '.crdownload', '.partial', '.swp')
+
+
+# --- 变化检测 ---
+def _signature(path):
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return (st.st_size, st.st_mtime_ns)
+
+
+class PollingWatcher(object):
+    """
+    轮询方式的变化检测。
+
+    Args:
+        root (str): 监视的目录。
+        recursive (bool): 是否包括子目录。
+        exclude (callable): exclude(目录路径) 为 True 的目录不监视 (例如输出目录)。
+        interval (float): 轮询间隔 (秒)。
+        full_every (int): 每隔多少轮 stat 一次所有已知文件。
+    """
+
+    name = 'poll'
+
+    def __init__(self, root, recursive, exclude, interval=2.0, full_every=10):
+        self.root = root
+        self.recursive = recursive
+        self.exclude = exclude
+        self.interval = interval
+        self.full_every = full_every
+        self.dirs = {}   # 目录 -> 修改时间
+        self.files = {}  # 目录 -> {文件: 签名}
+        self._rounds = 0
+        self._next = time.monotonic() + interval
+
+    def _scan_dir(self, directory, changed):
+        try:
+            self.dirs[directory] = os.stat(directory).st_mtime_ns
+            entries = list(os.scandir(directory))
+        except OSError:
+            self.dirs.pop(directory, None)
+            self.files.pop(directory, None)
+            return
+        known = self.files.get(directory, {})
+        files = self.files[directory] = {}
+        for entry in entries:
+            if entry.is_dir(follow_symlinks=False):
+                if self.recursive and entry.path not in self.dirs and not self.exclude(entry.path):
+                    self._scan_dir(entry.path, changed)
+                continue
+            signature = _signature(entry.path)
+            if signature is None:
+                continue
+            files[entry.path] = signature
+            if known.get(entry.path) != signature:
+                changed.append(entry.path)
+
+    def scan(self):
+        """启动时的完整扫描，返回所有文件。"""
+        changed = []
+        self._scan_dir(self.root, changed)
+        return changed
+
+    def poll(self, timeout):
+        now = time.monotonic()
+        if now < self._next:
+            time.sleep(min(timeout, self._next - now))
+            return []
+        self._next = now + self.interval
+        self._rounds += 1
+        changed = []
+        for directory, mtime in list(self.dirs.items()):
+            try:
+                current = os.stat(directory).st_mtime_ns
+            except OSError:
+                self.dirs.pop(directory, None)
+                self.files.pop(directory, None)
+                continue
+            if current != mtime:
+                self._scan_dir(directory, changed)
+        if self._rounds % self.full_every == 0:
+            # 目录修改时间只反映增删改名，原地改写文件需要 stat 文件本身
+            for files in list(self.files.values()):
+                for path, signature in list(files.items()):
+                    current = _signature(path)
+                    if current is None:
+                        del files[path]
+                    elif current != signature:
+                        files[path] = current
+                        changed.append(path)
+        return changed
+
+    def close(self):
+        pass
+
+
+# inotify 常量 (见 <sys/inotify.h>)
+IN_MODIFY = 0x00000002
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE_SELF = 0x00000400
+IN_MOVE_SELF = 0x00000800
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ONLYDIR = 0x01000000
+IN_ISDIR = 0x40000000
+IN_CLOEXEC = 0o2000000
+_WATCH_MASK = (IN_MODIFY | IN_CLOSE_WRITE | IN_MOVED_TO | IN_MOVED_FROM | IN_CREATE
+               | IN_DELETE_SELF | IN_MOVE_SELF | IN_ONLYDIR)
+_EVENT = struct.Struct('iIII')
+
+
+class InotifyWatcher(object):
+    """Linux inotify 变化检测，通过 ctypes 调用 libc，参数同 PollingWatcher。"""
+
+    name = 'inotify'
+
+    def __init__(self, root, recursive, exclude):
+        libc_name = ctypes.util.find_library('c')
+        self.libc = ctypes.CDLL(libc_name, use_errno=True)
+        if not hasattr(self.libc, 'inotify_init1'):
+            raise OSError("libc 不支持 inotify")
+        self.fd = self.libc.inotify_init1(IN_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 失败")
+        self.root = root
+        self.recursive = recursive
+        self.exclude = exclude
+        self.watches = {}  # watch 描述符 -> 目录
+
+    def _add_watch(self, directory):
+        wd = self.libc.inotify_add_watch(self.fd, os.fsencode(directory), _WATCH_MASK)
+        if wd < 0:
+            errno = ctypes.get_errno()
+            raise OSError(errno, f"无法监视 {directory}: {os.strerror(errno)} "
+                                 "(目录过多时可调大 /proc/sys/fs/inotify/max_user_watches)")
+        self.watches[wd] = directory
+
+    def _watch_tree(self, directory, files):
+        """监视 directory (及子目录)，并把其中已有的文件加入 files。先加监视再列目录，不会漏掉文件。"""
+        try:
+            self._add_watch(directory)
+            entries = list(os.scandir(directory))
+        except FileNotFoundError:
+            return
+        for entry in entries:
+            if entry.is_dir(follow_symlinks=False):
+                if self.recursive and not self.exclude(entry.path):
+                    self._watch_tree(entry.path, files)
+            else:
+                files.append(entry.path)
+
+    def scan(self):
+        files = []
+        self._watch_tree(self.root, files)
+        return files
+
+    def poll(self, timeout):
+        readable, _, _ = select.select([self.fd], [], [], timeout)
+        if not readable:
+            return []
+        data = os.read(self.fd, 256 * 1024)
+        changed = []
+        offset = 0
+        while offset < len(data):
+            wd, mask, _cookie, length = _EVENT.unpack_from(data, offset)
+            name = data[offset + _EVENT.size:offset + _EVENT.size + length].rstrip(b'\0')
+            offset += _EVENT.size + length
+            if mask & IN_Q_OVERFLOW:
+                # 事件队列溢出，丢失的变化只能靠一次完整扫描找回 (已转换过的文件会被签名跳过)
+                print("[watch] inotify 事件队列溢出，重新扫描一次")
+                for directory in list(self.watches.values()):
+                    self._rescan_dir(directory, changed)
+                continue
+            directory = self.watches.get(wd)
+            if directory is None:
+                continue
+            if mask & IN_IGNORED:
+                del self.watches[wd]
+                continue
+            if not name:
+                continue
+            path = os.path.join(directory, os.fsdecode(name))
+            if mask & IN_ISDIR:
+                if mask & (IN_CREATE | IN_MOVED_TO) and self.recursive and not self.exclude(path):
+                    self._watch_tree(path, changed)
+            elif mask & (IN_CLOSE_WRITE | IN_MOVED_TO | IN_MODIFY | IN_CREATE):
+                changed.append(path)
+        return changed
+
+    def _rescan_dir(self, directory, changed):
+        try:
+            changed.extend(entry.path for entry in os.scandir(directory) if entry.is_file())
+        except OSError:
+            pass
+
+    def close(self):
+        os.close(self.fd)
+
+
+def make_watcher(kind, root, recursive, exclude, interval):
+    """kind 为 auto 时优先 inotify，不可用则回退到轮询。"""
+    if kind in ('auto', 'inotify') and sys.platform.startswith('linux'):
+        try:
+            return InotifyWatcher(root, recursive, exclude)
+        except (OSError, AttributeError) as e:
+            if kind == 'inotify':
+                raise
+            print(f"[watch] inotify 不可用 ({e})，改用轮询")
+    elif kind == 'inotify':
+        raise OSError("inotify 只在 Linux 上可用")
+    return PollingWatcher(root, recursive, exclude, interval)
+
+
+# --- 守护进程 ---
+def _within(path, directory):
+    """path 是否就是 directory 或在它里面 (两者都是绝对路径)。"""
+    return path == directory or path.startswith(directory.rstrip(os.sep) + os.sep)
+
+
+class WatchDaemon(object):
+    """
+    把变化检测、防抖与进程池串起来。
+
+    Args:
+        input_dir (str): 监视的目录。
+        output_dir (str): 输出目录 (保持与输入相同的子目录结构)。
+        workers (int): 转换进程数。
+        debounce (float): 文件稳定多少秒后才转换。
+        show_timestamp (bool): JSON 输出是否包含时间戳行。
+        remove_txt_timestamp (bool): txt 输入是否移除行首的时间戳数字。
+        recursive (bool): 是否包括子目录。
+        watcher (str): auto / inotify / poll。
+        poll_interval (float): 轮询间隔。
+
+    Raises:
+        ValueError: 输出目录就是监视的目录或它的上级目录 (所有文件都会被当作输出而忽略)。
+    """
+
+    def __init__(self, input_dir, output_dir, workers=2, debounce=2.0, show_timestamp=True,
+                 remove_txt_timestamp=True, recursive=False, watcher='auto', poll_interval=2.0):
+        self.input_dir = os.path.abspath(input_dir)
+        self.output_dir = os.path.abspath(output_dir)
+        if _within(os.path.realpath(self.input_dir), os.path.realpath(self.output_dir)):
+            raise ValueError(f"输出目录 {self.output_dir} 不能是监视的目录或它的上级目录，"
+                             f"否则所有文件都会被当作输出而不会转换；请指定其他目录或使用默认的 输入目录/formatted")
+        self.workers = workers
+        self.debounce = debounce
+        self.options = (show_timestamp, remove_txt_timestamp)
+        self.watcher = make_watcher(watcher, self.input_dir, recursive, self._is_output, poll_interval)
+        self.pending = {}    # 路径 -> (签名, 最后一次变化的时间)
+        self.ready = collections.deque()
+        self.in_flight = {}  # future -> (路径, 签名)
+        self.pools = {}  # future -> 提交到的进程池
+        self.suspects = collections.deque()  # 进程池失效时正在转换的 (路径, 签名)，逐个单独重新转换
+        self.isolated = set()  # 单独转换中的 suspects 的 future
+        self.executor = None
+        self.done = {}       # 路径 -> 已转换版本的签名
+        self.converted = 0
+        self.failed = 0
+
+    def _is_output(self, path):
+        return _within(path, self.output_dir)
+
+    def _wanted(self, path):
+        name = os.path.basename(path)
+        lower = name.lower()
+        return (not name.startswith('.') and lower.endswith(INPUT_SUFFIXES)
+                and not lower.endswith(IGNORED_SUFFIXES) and not self._is_output(path))
+
+    def destination(self, path):
+        relative = os.path.relpath(os.path.dirname(path), self.input_dir)
+        return os.path.normpath(os.path.join(self.output_dir, relative, output_name(path)))
+
+    def notice(self, path, now):
+        if not self._wanted(path):
+            return
+        signature = _signature(path)
+        if signature is None:
+            self.pending.pop(path, None)
+            return
+        previous = self.pending.get(path)
+        if previous is None or previous[0] != signature:
+            self.pending[path] = (signature, now)
+
+    def _promote(self, now):
+        """把稳定了 debounce 秒的文件移入待转换队列。"""
+        busy = {path for path, _ in self.in_flight.values()}
+        for path, (signature, changed_at) in list(self.pending.items()):
+            if now - changed_at < self.debounce or path in busy:
+                continue
+            current = _signature(path)
+            if current is None:
+                del self.pending[path]
+            elif current != signature:
+                self.pending[path] = (current, now)  # 还在写入，重新计时
+            else:
+                del self.pending[path]
+                if self.done.get(path) != signature:
+                    self.ready.append((path, signature))
+
+    def _dispatch(self):
+        if self.suspects:
+            # 进程池失效后：等其他转换结束，再一个一个地单独重新转换，找出导致进程退出的文件
+            if not self.in_flight:
+                self.isolated.add(self._submit(*self.suspects.popleft()))
+            return
+        while self.ready and len(self.in_flight) < self.workers * 2:
+            self._submit(*self.ready.popleft())
+
+    def _submit(self, path, signature):
+        args = (convert_file, path, self.destination(path)) + self.options
+        try:
+            future = self.executor.submit(*args)
+        except BrokenProcessPool:
+            # 有工作进程异常退出，这个进程池不能再用；它的 future 都以 BrokenProcessPool 结束，由 _collect 处理
+            self._replace_pool(self.executor)
+            future = self.executor.submit(*args)
+        self.in_flight[future] = (path, signature)
+        self.pools[future] = self.executor
+        return future
+
+    def _replace_pool(self, pool):
+        """等失效的进程池的工作进程全部退出；它仍是当前进程池时换一个新的。"""
+        pool.shutdown(wait=True)
+        if pool is self.executor:
+            print("[watch] 转换进程异常退出，重新创建进程池", flush=True)
+            self.executor = ProcessPoolExecutor(max_workers=self.workers)
+
+    def _collect(self):
+        for future in [f for f in self.in_flight if f.done()]:
+            path, signature = self.in_flight.pop(future)
+            pool = self.pools.pop(future)
+            relative = os.path.relpath(path, self.input_dir)
+            isolated = future in self.isolated
+            self.isolated.discard(future)
+            try:
+                result = future.result()
+            except BrokenProcessPool as e:
+                # 其他工作进程也被强制结束，等它们都退出后再删除写了一半的临时文件
+                self._replace_pool(pool)
+                remove_partial_outputs(self.destination(path))
+                if not isolated:
+                    # 不一定是这个文件导致的，稍后单独重新转换
+                    self.suspects.append((path, signature))
+                    print(f"[watch] 转换进程异常退出，稍后单独重新转换 {relative}", flush=True)
+                    continue
+                self.failed += 1
+                self.done[path] = signature
+                print(f"[watch] 转换失败 {relative}: 转换进程异常退出 (可能内存不足): {e}", flush=True)
+                continue
+            except Exception as e:
+                self.failed += 1
+                self.done[path] = signature  # 同一版本不再重试，文件再次变化时才重新转换
+                print(f"[watch] 转换失败 {relative}: {type(e).__name__}: {e}", flush=True)
+                continue
+            self.converted += 1
+            self.done[path] = signature
+            print(f"[watch] 已转换 {relative} -> {os.path.relpath(self.destination(path), self.input_dir)} "
+                  f"({result['messages']} 条, {result['seconds'] * 1000:.0f} ms)", flush=True)
+            if result['issues']:
+                print(f"[watch] {relative} {result['issues']}", flush=True)
+
+    def _skip_up_to_date(self, path):
+        """启动时：输出比输入新则视为已转换。"""
+        signature = _signature(path)
+        output = _signature(self.destination(path))
+        if signature is not None and output is not None and output[1] >= signature[1]:
+            self.done[path] = signature
+            return True
+        return False
+
+    def run(self, stop_after=None):
+        """
+        运行直到 Ctrl+C。
+
+        Args:
+            stop_after (float): 调试用，运行指定秒数后返回。
+        """
+        os.makedirs(self.output_dir, exist_ok=True)
+        started = time.monotonic()
+        now = time.monotonic()
+        existing = self.watcher.scan()
+        queued = 0
+        for path in existing:
+            if self._wanted(path) and not self._skip_up_to_date(path):
+                self.notice(path, now - self.debounce)  # 启动前就存在的文件不需要再等待
+                queued += 1
+        print(f"[watch] 监视 {self.input_dir} ({self.watcher.name})，输出到 {self.output_dir}，"
+              f"{self.workers} 个进程；已有文件 {queued} 个待转换", flush=True)
+        self.executor = ProcessPoolExecutor(max_workers=self.workers)
+        try:
+            while stop_after is None or time.monotonic() - started < stop_after:
+                # 有转换在进行时频繁回来收结果、补充任务；空闲时等待变化通知
+                busy = self.in_flight or self.ready or self.suspects
+                timeout = 0.02 if busy else (0.2 if self.pending else 1.0)
+                for path in self.watcher.poll(timeout):
+                    self.notice(path, time.monotonic())
+                self._promote(time.monotonic())
+                self._collect()
+                self._dispatch()
+            while self.in_flight:
+                time.sleep(0.05)
+                self._collect()
+        except KeyboardInterrupt:
+            print("[watch] 停止")
+        finally:
+            self.executor.shutdown()
+            self.watcher.close()
+        return self.converted, self.failed
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m chat_cleaner.watch', description='监视文件夹并自动转换聊天记录导出文件')
+    parser.add_argument('input_dir', help='监视的目录')
+    parser.add_argument('--output', help='输出目录 (默认为 输入目录/formatted)')
+    parser.add_argument('--workers', type=int, default=max(1, min(4, os.cpu_count() or 1)), help='转换进程数')
+    parser.add_argument('--debounce', type=float, default=2.0, help='文件稳定多少秒后再转换 (默认 2)')
+    parser.add_argument('--recursive', action='store_true', help='同时监视子目录')
+    parser.add_argument('--watcher', default='auto', choices=('auto', 'inotify', 'poll'))
+    parser.add_argument('--poll-interval', type=float, default=2.0, help='轮询间隔 (秒)，仅轮询模式')
+    parser.add_argument('--no-timestamp', action='store_true', help='JSON 输出中不包含时间戳行')
+    parser.add_argument('--keep-txt-timestamp', action='store_true', help='txt 输入保留行首的时间戳数字')
+    args = parser.parse_args(argv)
+    output_dir = args.output or os.path.join(args.input_dir, 'formatted')
+    try:
+        daemon = WatchDaemon(args.input_dir, output_dir, workers=args.workers, debounce=args.debounce,
+                             show_timestamp=not args.no_timestamp, remove_txt_timestamp=not args.keep_txt_timestamp,
+                             recursive=args.recursive, watcher=args.watcher, poll_interval=args.poll_interval)
+    except ValueError as e:
+        parser.error(str(e))
+    daemon.run()
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,13 @@
+# -*- coding: utf-8 -*-
+"""
+测试的公共设置。在仓库根目录运行: python -m pytest tests
+
+仓库没有打包安装，这里把根目录 (chat_cleaner) 和 benchmarks (synthetic、check_import_time) 加入 sys.path。
+"""
+import os
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+for path in (ROOT, os.path.join(ROOT, 'benchmarks')):
+    if path not in sys.path:
+        sys.path.insert(0, path)
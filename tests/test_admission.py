@@ -0,0 +1,60 @@
+# -*- coding: utf-8 -*-
+"""按内存预算的准入控制。"""
+from flask import Flask
+
+from chat_cleaner import admission
+from chat_cleaner.admission import MemoryBudget, default_budget, install_admission
+
+
+def test_default_budget_is_shared_by_workers(monkeypatch):
+    monkeypatch.delenv(admission.WORKERS_ENV, raising=False)
+    single = default_budget()
+    assert default_budget(4) == single // 4
+    monkeypatch.setenv(admission.WORKERS_ENV, '2')
+    assert default_budget() == single // 2
+    assert default_budget(0) == single
+
+
+def test_budget_queue_and_timeout():
+    budget = MemoryBudget(100)
+    first = budget.acquire(80, timeout=0)
+    assert first == 80
+    assert budget.acquire(30, timeout=0.01) is None
+    budget.release(first)
+    assert budget.acquire(500, timeout=0) == 100  # 超过整个预算时按整个预算计算
+
+
+def test_rejected_upload_gets_503_with_retry_after():
+    app = Flask(__name__)
+    memory = install_admission(app, budget=1024 * 1024, factor=4.0, wait=0)
+
+    @app.route('/upload', methods=['POST'])
+    def upload():
+        return 'ok'
+
+    client = app.test_client()
+    held = memory.acquire(memory.limit, timeout=0)  # 另一个大上传正在处理
+    response = client.post('/upload', data=b'x' * 100)
+    assert response.status_code == 503
+    assert response.headers['Retry-After'] == '1'
+    memory.release(held)
+    with client.post('/upload', data=b'x' * 100) as response:
+        assert response.status_code == 200
+    assert memory.in_use == 0
+
+
+def test_oversized_upload_is_413_without_reserving_budget():
+    app = Flask(__name__)
+    app.config['MAX_CONTENT_LENGTH'] = 1000
+    memory = install_admission(app, budget=1024 * 1024, factor=4.0, wait=0)
+
+    @app.route('/upload', methods=['POST'])
+    def upload():
+        return 'ok'
+
+    client = app.test_client()
+    held = memory.acquire(memory.limit - 10, timeout=0)  # 预算几乎用完：超大的请求如果先申请预算会得到 503
+    response = client.post('/upload', data=b'x' * 2000)
+    assert response.status_code == 413
+    assert memory.in_use == held
+    memory.release(held)
@@ -0,0 +1,59 @@
+# -*- coding: utf-8 -*-
+"""NumPy 活跃度统计：时间戳解析、会话划分与按目标时区的直方图。"""
+import threading
+
+import numpy as np
+import pytest
+
+from chat_cleaner.core.analytics import analyze_activity, local_times, message_times
+from chat_cleaner.core.timezones import TargetTimezone
+from chat_cleaner.records import ChatMessage
+
+MESSAGES = [
+    {"sender": "张三", "content": "早", "timestamp": "2024-03-09T23:50:00Z"},
+    {"sender": "李四", "content": "早", "timestamp": "2024-03-10T00:05:00+08:00"},
+    {"sender": "张三", "content": "没有时间"},
+    {"sender": "李四", "content": "坏时间", "timestamp": "昨天"},
+    {"sender": "张三", "content": "晚上好", "timestamp": "2024-03-10T12:00:00Z"},
+]
+
+
+def test_message_times_handles_offsets_and_bad_values():
+    times = message_times(MESSAGES)
+    assert str(times[0]) == '2024-03-09T23:50:00.000'
+    assert str(times[1]) == '2024-03-09T16:05:00.000'
+    assert np.isnat(times[2]) and np.isnat(times[3])
+    records = [ChatMessage.from_dict(message) for message in MESSAGES]
+    assert (message_times(records).astype(np.int64) == times.astype(np.int64)).all()
+
+
+def test_sessions_and_histograms():
+    report = analyze_activity(MESSAGES, session_gap=60)
+    # 乱序 (时间倒退) 不算新会话，缺失时间戳的消息归入前一个会话
+    assert report.session_starts.tolist() == [0, 4]
+    assert report.session_sizes.tolist() == [4, 1]
+    assert report.session_breaks.tolist() == [4]
+    assert report.hourly.sum() == report.valid_count == 3
+    assert report.to_dict()['sessions'] == 2
+
+
+def test_local_times_follow_dst_intervals():
+    times = np.array(['2024-03-10T06:30:00', '2024-03-10T07:30:00', '2024-11-03T05:30:00',
+                      '2024-11-03T06:30:00', 'NaT'], dtype='datetime64[ms]')
+    local = local_times(times, TargetTimezone('America/New_York'))
+    assert [str(t) for t in local.astype('datetime64[s]')] == [
+        '2024-03-10T01:30:00', '2024-03-10T03:30:00', '2024-11-03T01:30:00', '2024-11-03T01:30:00', 'NaT']
+
+
+@pytest.mark.parametrize('tz', ['America/New_York', 'Asia/Shanghai', '+08:00'])
+def test_timestamps_at_end_of_datetime_range_terminate(tz):
+    messages = [{"timestamp": "2024-01-01T00:00:00Z"}, {"timestamp": "9999-12-31T23:30:00Z"}]
+    reports = []
+    # 以前区间在 datetime 范围的末尾停止前进，local_times 死循环；放在线程里，出错时测试失败而不是挂住
+    worker = threading.Thread(target=lambda: reports.extend(
+        analyze_activity(ms, target_timezone=TargetTimezone(tz)) for ms in (messages, messages[1:])), daemon=True)
+    worker.start()
+    worker.join(60)
+    assert len(reports) == 2
+    assert reports[0].valid_count == 2
+    assert reports[1].to_dict()['last'].startswith(('9999-12-31', '10000-01-01'))
@@ -0,0 +1,67 @@
+# -*- coding: utf-8 -*-
+"""WSGIBridge：请求头校验与长时间等待的路由使用单独的线程池。"""
+import asyncio
+import threading
+
+from flask import Flask, Response, stream_with_context
+
+from chat_cleaner.asgi import WSGIBridge
+
+
+def _app():
+    app = Flask(__name__)
+    app.config['LONG_POLL_PATHS'] = [r'^/wait$']
+
+    @app.route('/cpu', methods=['GET', 'POST'])
+    def cpu():
+        return threading.current_thread().name
+
+    @app.route('/wait')
+    def wait():
+        def generate():
+            for _ in range(3):
+                yield threading.current_thread().name + '\n'
+        return Response(stream_with_context(generate()))
+
+    return app
+
+
+def _call(bridge, path, method='GET', headers=(), body=b''):
+    """在事件循环中执行一次请求，返回 (状态码, 响应体)。"""
+    scope = {'type': 'http', 'method': method, 'path': path, 'query_string': b'', 'headers': list(headers),
+             'http_version': '1.1', 'scheme': 'http', 'server': ('testserver', 80), 'client': ('127.0.0.1', 1)}
+    messages = [{'type': 'http.request', 'body': body, 'more_body': False}]
+    sent = []
+
+    async def receive():
+        return messages.pop(0)
+
+    async def send(message):
+        sent.append(message)
+
+    asyncio.run(bridge(scope, receive, send))
+    status = sent[0]['status']
+    return status, b''.join(message.get('body', b'') for message in sent[1:])
+
+
+def test_malformed_content_length_is_400():
+    bridge = WSGIBridge(_app(), threads=1)
+    status, _ = _call(bridge, '/cpu', 'POST', headers=[(b'content-length', b'abc')], body=b'x')
+    assert status == 400
+    status, _ = _call(bridge, '/cpu', 'POST', headers=[(b'content-length', b'-1')], body=b'x')
+    assert status == 400
+
+
+def test_oversized_content_length_is_413():
+    bridge = WSGIBridge(_app(), threads=1, max_content_length=10)
+    status, _ = _call(bridge, '/cpu', 'POST', headers=[(b'content-length', b'11')], body=b'x' * 11)
+    assert status == 413
+
+
+def test_long_poll_paths_use_their_own_threads():
+    bridge = WSGIBridge(_app(), threads=1)
+    status, body = _call(bridge, '/cpu')
+    assert status == 200 and body.decode().startswith('chat-cleaner_')
+    status, body = _call(bridge, '/wait')
+    assert status == 200
+    assert all(name.startswith('chat-cleaner-poll') for name in body.decode().split())
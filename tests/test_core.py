@@ -0,0 +1,51 @@
+# -*- coding: utf-8 -*-
+"""共用格式化引擎在 1.0 与 1.1 / Turbo 规则下的输出。"""
+import pytest
+
+from chat_cleaner.apps import load_module
+from chat_cleaner.core import format_chat_log
+
+
+class BrokenMessage(dict):
+    """读取 content 时出错的消息。"""
+
+    def get(self, key, default=None):
+        if key == 'content':
+            raise RuntimeError('broken')
+        return super().get(key, default)
+
+
+MESSAGES = [
+    {"id": "1", "sender": "张三", "content": "[图片] 路径: C:/a.png", "timestamp": "2024-05-01T08:00:00Z"},
+    {"id": "2", "sender": "李四", "content": "没有时间"},
+    {"id": "3", "sender": "王五", "content": "坏时间", "timestamp": "2024-05-01T08:00:00 北京时间"},
+    BrokenMessage(id="4", sender="赵六", timestamp="2024-05-01T08:01:00Z"),
+    BrokenMessage(sender="无名", timestamp="2024-05-01T08:02:00Z"),
+]
+
+
+def test_turbo_rules():
+    assert format_chat_log(MESSAGES).split('\n\n') == [
+        "2024-05-01T08:00:00\n张三：[图片]",
+        "[时间戳缺失]\n李四：没有时间",
+        "2024-05-01T08:00:00\n王五：坏时间",
+        "[错误：处理消息 4 失败]",
+        "[错误：处理消息 未知ID 失败]",
+    ]
+
+
+def test_1_0_rules_keep_original_output():
+    legacy = load_module('1.0')
+    assert legacy.format_chat_log(MESSAGES).split('\n\n') == [
+        "2024-05-01T08:00:00\n张三：[图片]",
+        "2024-05-01T08:00:00 北京时间\n王五：坏时间",
+        "[错误：无法处理消息 4]",
+        "[错误：无法处理消息 ]",
+    ]
+
+
+@pytest.mark.parametrize('show_timestamp', [True, False])
+def test_stream_matches_log(show_timestamp):
+    from chat_cleaner.core import format_chat_stream
+    messages = MESSAGES[:3] * 5
+    assert ''.join(format_chat_stream(messages, show_timestamp)) == format_chat_log(messages, show_timestamp)
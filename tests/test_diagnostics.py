@@ -0,0 +1,58 @@
+# -*- coding: utf-8 -*-
+"""格式化问题汇总：按类别计数、示例数量上限、跨进程合并与每个请求一行的输出。"""
+from chat_cleaner.core import format_chat_log
+from chat_cleaner.diagnostics import FormatDiagnostics
+
+
+class BrokenMessage(dict):
+    """读取 content 时出错的消息。"""
+
+    def get(self, key, default=None):
+        if key == 'content':
+            raise RuntimeError('broken')
+        return super().get(key, default)
+
+
+def _messages(count):
+    messages = []
+    for i in range(count):
+        messages.append({"id": f"m{i}", "sender": "张三", "content": "没有时间"})
+        messages.append({"id": f"t{i}", "sender": "李四", "content": "坏时间", "timestamp": f"2024-05-01T08:00:00 第{i}"})
+        messages.append(BrokenMessage(id=f"b{i}", sender="王五"))
+    return messages
+
+
+def test_counts_by_category_with_limited_examples():
+    diagnostics = FormatDiagnostics(max_examples=2)
+    format_chat_log(_messages(10), diagnostics=diagnostics)
+    assert diagnostics.counts == {'timestamp_missing': 10, 'timestamp_truncated': 10, 'message_error': 10}
+    assert diagnostics.total() == 30
+    assert [e['id'] for e in diagnostics.examples['timestamp_truncated']] == ['t0', 't1']
+    assert diagnostics.examples['timestamp_truncated'][0]['detail'] == '2024-05-01T08:00:00 第0'
+    errors = diagnostics.examples['message_error']
+    assert errors[0]['detail'] == 'RuntimeError: broken' and 'Traceback' in errors[0]['traceback']
+    assert len(errors) == 2
+
+
+def test_clean_input_records_nothing():
+    diagnostics = FormatDiagnostics()
+    format_chat_log([{"id": "1", "sender": "张三", "content": "你好", "timestamp": "2024-05-01T08:00:00Z"}],
+                    diagnostics=diagnostics)
+    assert not diagnostics
+    assert diagnostics.summary() == "格式化问题 0 条"
+
+
+def test_merge_keeps_example_limit():
+    first, second = FormatDiagnostics(max_examples=3), FormatDiagnostics(max_examples=3)
+    format_chat_log(_messages(2), diagnostics=first)
+    format_chat_log(_messages(2), diagnostics=second)
+    first.merge(second.as_dict())
+    assert first.counts == {'timestamp_missing': 4, 'timestamp_truncated': 4, 'message_error': 4}
+    assert [e['id'] for e in first.examples['timestamp_missing']] == ['m0', 'm1', 'm0']
+
+
+def test_one_summary_line_per_call(capsys):
+    format_chat_log(_messages(50))
+    lines = capsys.readouterr().out.splitlines()
+    assert len(lines) == 1
+    assert lines[0].startswith('格式化问题 150 条 (缺少时间戳 50, 时间戳无法解析，已截断 50, 消息处理失败 50)，示例: ')
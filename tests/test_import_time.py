@@ -0,0 +1,19 @@
+# -*- coding: utf-8 -*-
+"""转换入口的导入耗时预算 (python -X importtime)，与 benchmarks/check_import_time.py 使用同样的目标和预算。"""
+import pytest
+
+import check_import_time
+
+
+@pytest.fixture(scope='module')
+def baseline():
+    return set(check_import_time.import_times('pass'))
+
+
+@pytest.mark.parametrize('name', sorted(check_import_time.TARGETS))
+def test_import_time_within_budget(name, baseline):
+    elapsed, modules = check_import_time.measure(check_import_time.TARGETS[name], baseline, runs=5)
+    forbidden = sorted(m for m in modules if m.split('.')[0] in check_import_time.FORBIDDEN)
+    assert not forbidden, f"{name} 不应导入: {', '.join(forbidden)}"
+    slowest = sorted(modules.items(), key=lambda item: -item[1])[:5]
+    assert elapsed <= check_import_time.DEFAULT_BUDGET_MS, f"{name} 导入耗时 {elapsed:.1f} ms，最慢: {slowest}"
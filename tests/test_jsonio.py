@@ -0,0 +1,165 @@
+# -*- coding: utf-8 -*-
+"""jsonio 的解码后端选择与一致性、iter_messages 增量解码与 load_messages_jsonl。"""
+import gc
+import io
+import json
+
+import pytest
+
+from chat_cleaner import jsonio
+
+
+class CountingStream(io.BytesIO):
+    """记录读取了多少字节的流。"""
+
+    def __init__(self, data):
+        super().__init__(data)
+        self.consumed = 0
+
+    def read(self, size=-1):
+        data = super().read(size)
+        self.consumed += len(data)
+        return data
+
+
+def _messages(count):
+    return [{"id": str(i), "sender": f"用户{i % 7}", "content": "消息" * (i % 13) + "é\\u4e2d",
+             "timestamp": "2024-05-01T08:00:00+08:00"} for i in range(count)]
+
+
+def _as_dicts(items):
+    return [{key: item.get(key) for key in ('id', 'sender', 'content', 'timestamp')} for item in items]
+
+
+@pytest.mark.parametrize('read_size', [1, 7, 64, 4096, 1024 * 1024])
+def test_iter_messages_matches_load_at_any_read_size(read_size):
+    raw = json.dumps(_messages(300), ensure_ascii=False, indent=1).encode('utf-8')
+    expected = _as_dicts(jsonio.load_messages(raw.decode('utf-8')))
+    assert _as_dicts(jsonio.iter_messages(io.BytesIO(raw), read_size=read_size)) == expected
+
+
+@pytest.mark.parametrize('read_size', range(1, 12))
+def test_iter_messages_scalars_split_across_reads(read_size):
+    values = [1.5e10, -3, True, None, "é中A", {"a": [1, 2]}, -1.25e-3, 0]
+    raw = json.dumps(values).encode('utf-8')
+    assert list(jsonio.iter_messages(io.BytesIO(raw), read_size=read_size)) == values
+
+
+def test_iter_messages_bom_and_empty_array():
+    assert list(jsonio.iter_messages(io.BytesIO(b'\xef\xbb\xbf [ ] '))) == []
+
+
+def test_iter_messages_rejects_non_array():
+    with pytest.raises(ValueError):
+        list(jsonio.iter_messages(io.BytesIO(b'{"a": 1}')))
+
+
+def test_iter_messages_early_error_does_not_read_rest_of_stream():
+    raw = b'[{"sender": "a"},\n x' + b' ' * (8 * 1024 * 1024) + b']'
+    stream = CountingStream(raw)
+    with pytest.raises(json.JSONDecodeError) as info:
+        list(jsonio.iter_messages(stream, read_size=64 * 1024))
+    assert stream.consumed <= 2 * 64 * 1024
+    assert (info.value.lineno, info.value.colno, info.value.pos) == (2, 2, 19)
+
+
+def test_iter_messages_error_position_matches_json_loads():
+    raw = json.dumps(_messages(2000), indent=1).encode('utf-8')[:-1] + b',{"a": 1 "b": 2}]'
+    with pytest.raises(json.JSONDecodeError) as expected:
+        json.loads(raw)
+    with pytest.raises(json.JSONDecodeError) as info:
+        list(jsonio.iter_messages(io.BytesIO(raw), read_size=4096))
+    assert (info.value.lineno, info.value.colno, info.value.pos) == \
+        (expected.value.lineno, expected.value.colno, expected.value.pos)
+
+
+def test_iter_messages_unterminated_array():
+    with pytest.raises(json.JSONDecodeError):
+        list(jsonio.iter_messages(io.BytesIO(b'[{"a": 1}, {"b": "x'), read_size=4))
+
+
+def test_load_messages_jsonl_reports_line_numbers():
+    data = b'{"sender": "a"}\n\n{"sender": "b"}\n{bad}\n'
+    with pytest.raises(json.JSONDecodeError) as info:
+        jsonio.load_messages_jsonl(data, first_line=10)
+    assert '第 13 行' in str(info.value)
+    assert [m.get('sender') for m in jsonio.load_messages_jsonl(data[:33])] == ['a', 'b']
+
+
+@pytest.mark.parametrize('raw', [b'[-5]0]', b'[]x', b'[1, 2]\n\n]', b'[{"sender": "a"}] ' + b' ' * 100000 + b'{}'])
+def test_iter_messages_rejects_data_after_array(raw):
+    with pytest.raises(json.JSONDecodeError) as expected:
+        json.loads(raw)
+    with pytest.raises(json.JSONDecodeError) as info:
+        list(jsonio.iter_messages(io.BytesIO(raw), read_size=3))
+    assert info.value.msg == expected.value.msg == 'Extra data'
+    assert (info.value.lineno, info.value.colno, info.value.pos) == \
+        (expected.value.lineno, expected.value.colno, expected.value.pos)
+
+
+def test_iter_messages_allows_trailing_whitespace():
+    assert list(jsonio.iter_messages(io.BytesIO(b'[1, 2] \r\n\t '), read_size=2)) == [1, 2]
+
+
+BACKENDS = jsonio.available_backends()
+# 各后端容忍度不同的输入：快速后端拒绝时由标准库重新解码，结果必须与只用标准库相同
+TOLERATED = ['[NaN, Infinity, -Infinity]', '[18446744073709551615, -9223372036854775808]', '{"a": 1, "a": 2}',
+             '"\\ud800"', '[1.0e400]', '  {"sender": "a"}  ']
+REJECTED = ['[1, 2', '{"a": 1 "b": 2}', '[1,]', '"\\x"', '', '[1] [2]', '\ufeff[1]']
+
+
+@pytest.mark.parametrize('backend', BACKENDS, ids=repr)
+@pytest.mark.parametrize('text', TOLERATED)
+def test_backends_accept_what_stdlib_accepts(backend, text):
+    expected = json.loads(text)
+    for data in (text, text.encode('utf-8')):
+        assert repr(backend.loads(data)) == repr(expected)
+    if isinstance(expected, list):
+        assert repr(backend.load_messages(text)) == repr(expected)
+
+
+@pytest.mark.parametrize('backend', BACKENDS, ids=repr)
+def test_integers_beyond_64_bits(backend):
+    big = 123456789012345678901234567890
+    assert backend.load_messages(f'[{big}]') == [big]
+    # orjson 的 loads() 把它们解码为 float (见模块说明)，其他后端与标准库一样解码为 int
+    assert backend.loads(f'[{big}]') == [float(big) if backend.name == 'orjson' else big]
+
+
+@pytest.mark.parametrize('backend', BACKENDS, ids=repr)
+@pytest.mark.parametrize('text', REJECTED)
+def test_backends_raise_stdlib_errors(backend, text):
+    with pytest.raises(json.JSONDecodeError) as expected:
+        json.loads(text)
+    for decode in (backend.loads, backend.load_messages):
+        with pytest.raises(json.JSONDecodeError) as info:
+            decode(text)
+        assert (info.value.msg, info.value.pos) == (expected.value.msg, expected.value.pos)
+
+
+@pytest.mark.parametrize('backend', BACKENDS, ids=repr)
+def test_gc_is_restored_after_errors(backend):
+    assert gc.isenabled()
+    with pytest.raises(json.JSONDecodeError):
+        backend.loads('[1, 2')
+    assert gc.isenabled()
+
+
+def test_select_backend_by_name_and_environment(monkeypatch):
+    monkeypatch.delenv(jsonio.BACKEND_ENV, raising=False)
+    assert jsonio.select_backend().name == BACKENDS[0].name
+    assert jsonio.select_backend('JSON').name == 'json'
+    monkeypatch.setenv(jsonio.BACKEND_ENV, 'json')
+    assert jsonio.select_backend().name == 'json'
+    if len(BACKENDS) > 1:
+        assert jsonio.select_backend(BACKENDS[0].name).name == BACKENDS[0].name
+
+
+def test_missing_backend_falls_back_to_stdlib(monkeypatch, capsys):
+    def missing():
+        raise ImportError('not installed')
+
+    monkeypatch.setattr(jsonio, '_FACTORIES', (('msgspec', missing),) + jsonio._FACTORIES[1:])
+    assert 'msgspec' not in [backend.name for backend in jsonio.available_backends()]
+    assert jsonio.select_backend('msgspec').name == 'json'
+    assert "'msgspec' 未安装" in capsys.readouterr().out
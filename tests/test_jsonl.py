@@ -0,0 +1,65 @@
+# -*- coding: utf-8 -*-
+"""JSONL 按字节区间多进程格式化：区间切分、与整体格式化一致、行号与清理规则统计。"""
+import io
+import json
+
+import pytest
+
+from chat_cleaner.core import format_chat_log
+from chat_cleaner.core.scrub import Scrubber
+from chat_cleaner.diagnostics import FormatDiagnostics
+from chat_cleaner.jsonl import format_jsonl_file, split_ranges
+
+MESSAGES = [{"id": str(i), "sender": f"用户{i % 4}", "content": f"第 {i} 条 密码123" if i % 9 == 0 else f"第 {i} 条",
+             **({"timestamp": "2024-05-01T08:00:00Z"} if i % 5 else {})} for i in range(500)]
+
+
+def _write(tmp_path, lines, newline='\n'):
+    path = tmp_path / 'a.jsonl'
+    path.write_bytes(newline.join(lines).encode('utf-8'))
+    return str(path)
+
+
+@pytest.mark.parametrize('chunk_size', [1, 7, 100, 10 ** 6])
+def test_ranges_cover_buffer_and_end_after_newlines(chunk_size):
+    buf = b'\n'.join(json.dumps(m).encode() for m in MESSAGES[:50]) + b'\n{"last": 1}'
+    ranges = split_ranges(buf, chunk_size)
+    assert ranges[0][0] == 0 and ranges[-1][1] == len(buf)
+    assert all(end == start for (_, end), (start, _) in zip(ranges, ranges[1:]))
+    assert all(buf[end - 1:end] == b'\n' for _, end in ranges[:-1])
+
+
+@pytest.mark.parametrize('workers, chunk_size', [(1, None), (1, 997), (3, 997), (3, 64)])
+@pytest.mark.parametrize('newline', ['\n', '\r\n'])
+def test_matches_single_pass_formatting(tmp_path, workers, chunk_size, newline):
+    lines = [json.dumps(m, ensure_ascii=False) for m in MESSAGES]
+    lines[10:10] = ['', '   ']  # 空行会被跳过
+    path = _write(tmp_path, lines, newline)
+    out = io.BytesIO()
+    diagnostics = FormatDiagnostics()
+    assert format_jsonl_file(path, out, workers=workers, chunk_size=chunk_size, diagnostics=diagnostics) == 500
+    assert out.getvalue().decode('utf-8') == format_chat_log(MESSAGES)
+    assert diagnostics.counts == {'timestamp_missing': 100}
+
+
+def test_bad_line_reports_line_in_whole_file(tmp_path):
+    lines = [json.dumps(m) for m in MESSAGES]
+    lines[321] = '{"sender": "坏行"'
+    path = _write(tmp_path, lines)
+    with pytest.raises(json.JSONDecodeError, match='第 322 行'):
+        format_jsonl_file(path, io.BytesIO(), workers=3, chunk_size=512)
+
+
+def test_scrubber_hits_are_added_up_from_workers(tmp_path):
+    path = _write(tmp_path, [json.dumps(m, ensure_ascii=False) for m in MESSAGES])
+    scrubber = Scrubber([{"name": "password", "pattern": r"密码\d+", "replace": "[已隐藏]"}])
+    out = io.BytesIO()
+    format_jsonl_file(path, out, workers=3, chunk_size=1024, scrubber=scrubber)
+    assert scrubber.hits == [len(range(0, 500, 9))]
+    assert '密码' not in out.getvalue().decode('utf-8')
+
+
+def test_empty_file(tmp_path):
+    out = io.BytesIO()
+    assert format_jsonl_file(_write(tmp_path, []), out, workers=3) == 0
+    assert out.getvalue() == b''
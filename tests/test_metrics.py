@@ -0,0 +1,98 @@
+# -*- coding: utf-8 -*-
+"""/metrics：按线程分片的计数、线程结束后的合并与 Prometheus 文本输出。"""
+import io
+import threading
+
+from flask import Flask
+
+from chat_cleaner.metrics import DURATION_BUCKETS, Registry, install_metrics, record_messages, registry
+
+
+def _record(target):
+    target.inc('chat_cleaner_requests_total', (('route', '/'),))
+    target.observe('chat_cleaner_request_duration_seconds', DURATION_BUCKETS, (), 0.2)
+
+
+def test_finished_threads_are_folded_into_one_shard():
+    target = Registry()
+    for _ in range(300):
+        thread = threading.Thread(target=_record, args=(target,))
+        thread.start()
+        thread.join()
+    _record(target)
+    assert len(target._shards) == 1  # 只剩当前线程
+    values, histograms = target.collect()
+    assert values[('chat_cleaner_requests_total', (('route', '/'),))] == 301
+    counts = histograms[('chat_cleaner_request_duration_seconds', ())]
+    assert sum(counts[:-1]) == 301 and abs(counts[-1] - 0.2 * 301) < 1e-6
+
+
+def test_collect_while_threads_finish_counts_each_thread_once():
+    target = Registry()
+    done = threading.Event()
+    totals = []
+
+    def scrape():
+        while not done.is_set():
+            totals.append(target.collect()[0].get(('chat_cleaner_requests_total', (('route', '/'),)), 0))
+
+    scraper = threading.Thread(target=scrape)
+    scraper.start()
+    for _ in range(200):
+        thread = threading.Thread(target=_record, args=(target,))
+        thread.start()
+        thread.join()
+    done.set()
+    scraper.join()
+    assert totals == sorted(totals)  # 计数只增不减：没有漏算刚结束的线程
+    assert target.collect()[0][('chat_cleaner_requests_total', (('route', '/'),))] == 200
+
+
+def test_metrics_endpoint():
+    app = Flask(__name__)
+    install_metrics(app)
+
+    @app.route('/format', methods=['POST'])
+    def format_route():
+        record_messages(3)
+        return 'ok'
+
+    client = app.test_client()
+    before = registry.collect()[0].get(('chat_cleaner_messages_formatted_total', ()), 0)
+    with client.post('/format', data=b'x' * 10) as response:  # 计数在响应关闭 (发送完毕) 时记录
+        assert response.status_code == 200
+    text = client.get('/metrics').get_data(as_text=True)
+    assert '# TYPE chat_cleaner_requests_total counter' in text
+    assert 'chat_cleaner_requests_total{method="POST",route="/format",status="200"}' in text
+    assert f'chat_cleaner_messages_formatted_total {before + 3}' in text
+    assert 'chat_cleaner_request_duration_seconds_bucket{route="/format",le="+Inf"}' in text
+
+
+def _error_counts():
+    values = registry.collect()[0]
+    return {(name, labels[0][1]): value for (name, labels), value in values.items()
+            if name in ('chat_cleaner_parse_errors_total', 'chat_cleaner_unexpected_errors_total')}
+
+
+def test_turbo_counts_server_errors_separately_from_parse_errors(monkeypatch):
+    from chat_cleaner.apps import load_module
+    turbo = load_module('turbo')
+    client = turbo.app.test_client()
+
+    def post(payload):
+        return client.post('/format', data={'jsonFile': (io.BytesIO(payload), 'a.json')},
+                           content_type='multipart/form-data').status_code
+
+    def broken(*args, **kwargs):
+        raise RuntimeError('服务端的问题')
+
+    before = _error_counts()
+    assert post(b'[{"sender": "a"') == 400
+    monkeypatch.setattr(turbo, 'format_chat_log', broken)
+    assert post(b'[{"sender": "a"}]') == 500
+    monkeypatch.setitem(turbo.app.config, 'MAX_CONTENT_LENGTH', 100)
+    assert post(b' ' * 1000) == 413
+    after = _error_counts()
+    changed = {key: after[key] - before.get(key, 0) for key in after if after[key] != before.get(key, 0)}
+    assert changed == {('chat_cleaner_parse_errors_total', 'JSONDecodeError'): 1,
+                       ('chat_cleaner_unexpected_errors_total', 'RuntimeError'): 1}
@@ -0,0 +1,73 @@
+# -*- coding: utf-8 -*-
+"""/preview：只解析文件开头，按抽样片段估算总消息数。"""
+import io
+import json
+
+import pytest
+from werkzeug.datastructures import MultiDict
+
+from chat_cleaner.preview import estimate_total, sample_head
+
+
+def _export(count):
+    return json.dumps([{"id": str(i), "sender": f"用户{i % 7}", "content": "消息" * (i % 13 + 1),
+                        "timestamp": "2024-05-01T08:00:00+08:00"} for i in range(count)],
+                      ensure_ascii=False).encode('utf-8')
+
+
+def _samples(data, head_size, size=4096):
+    return [data[len(data) * i // 5:len(data) * i // 5 + size] for i in range(1, 5)] if len(data) > head_size else []
+
+
+def test_head_cut_inside_a_message():
+    data = _export(1000)
+    head = data[:data.index(b'{"id": "30"') + 20]
+    messages, count, complete = sample_head(head, 5)
+    assert [m.get('id') for m in messages] == ['0', '1', '2', '3', '4']
+    assert count == 30 and not complete
+
+
+def test_head_cut_inside_a_multibyte_character():
+    data = _export(1000)
+    cut = data.index('消息'.encode('utf-8'), data.index(b'{"id": "12"')) + 1
+    assert sample_head(data[:cut], 20)[1:] == (12, False)
+
+
+def test_whole_file_is_exact():
+    data = _export(50)
+    messages, count, complete = sample_head(data, 10)
+    assert (len(messages), count, complete) == (10, 50, True)
+    assert estimate_total(count, data, [], len(data), complete) == (50, True)
+
+
+@pytest.mark.parametrize('head', [b'{"sender": "a"}', b'[{"sender": ', b'not json'])
+def test_unusable_head_is_rejected(head):
+    with pytest.raises(ValueError):
+        sample_head(head, 5)
+
+
+@pytest.mark.parametrize('count', [2000, 20000])
+def test_estimate_is_close(count):
+    data = _export(count)
+    head = data[:64 * 1024]
+    _, in_head, complete = sample_head(head, 20)
+    estimated, exact = estimate_total(in_head, head, _samples(data, len(head)), len(data), complete)
+    assert not exact
+    assert abs(estimated - count) / count < 0.05
+
+
+def test_preview_route():
+    from chat_cleaner.apps import load_module
+    client = load_module('turbo').app.test_client()
+    data = _export(5000)
+    head = data[:32 * 1024]
+    form = MultiDict([('jsonFile', (io.BytesIO(head), 'a.json')), ('totalSize', str(len(data))),
+                      ('limit', '3'), ('showTimestamp', 'false')])
+    for sample in _samples(data, len(head)):
+        form.add('sample', (io.BytesIO(sample), 'sample'))
+    response = client.post('/preview', data=form, content_type='multipart/form-data')
+    assert response.status_code == 200
+    result = response.get_json()
+    assert result['messages'] == 3 and not result['exact']
+    assert result['preview'].split('\n\n') == ['用户0：消息', '用户1：消息消息', '用户2：消息消息消息']
+    assert abs(result['estimatedTotal'] - 5000) < 250
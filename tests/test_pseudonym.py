@@ -0,0 +1,52 @@
+# -*- coding: utf-8 -*-
+"""发送者代号的分配与 @提及的改写。"""
+from chat_cleaner.core import format_chat_log
+from chat_cleaner.core.pseudonym import Pseudonymizer
+
+
+def test_aliases_are_assigned_in_order_and_stable():
+    pseudonymizer = Pseudonymizer()
+    assert [pseudonymizer.sender(name) for name in ['张三', '李四', '张三']] == ['用户1', '用户2', '用户1']
+
+
+def test_loaded_mapping_with_gaps_does_not_collide():
+    pseudonymizer = Pseudonymizer({'A': '用户3'})
+    aliases = [pseudonymizer.sender(name) for name in 'BCD']
+    assert aliases == ['用户4', '用户5', '用户6']
+    assert len(set(pseudonymizer.mapping.values())) == len(pseudonymizer.mapping)
+
+
+def test_loaded_mapping_with_other_prefix_skips_used_aliases():
+    pseudonymizer = Pseudonymizer({'A': 'member1', 'B': '用户1'})
+    assert pseudonymizer.sender('C') == '用户2'
+    pseudonymizer = Pseudonymizer({'A': '用户2', 'B': 'X1'}, prefix='X')
+    assert [pseudonymizer.sender(name) for name in 'CD'] == ['X2', 'X3']
+
+
+def test_save_and_load_round_trip(tmp_path):
+    path = tmp_path / 'map.json'
+    first = Pseudonymizer()
+    first.add_senders(['张三', None, '李四'])
+    first.save(str(path))
+    second = Pseudonymizer.load(str(path))
+    assert second.mapping == {'张三': '用户1', '李四': '用户2'}
+    assert second.sender('王五') == '用户3'
+    assert Pseudonymizer.load(str(tmp_path / 'missing.json')).mapping == {}
+
+
+def test_mentions_need_a_right_boundary():
+    pseudonymizer = Pseudonymizer()
+    pseudonymizer.add_senders(['张三', 'Tom.', '张三丰x'])
+    rewrite = pseudonymizer.rewrite_mentions
+    assert rewrite('@张三丰 你好') == '@张三丰 你好'
+    assert rewrite('@张三，你好 @张三') == '@用户1，你好 @用户1'
+    assert rewrite('@Tom.你好') == '@用户2你好'
+    assert rewrite('@张三 @张三丰x') == '@用户1 @用户3'
+    assert Pseudonymizer(mentions=False).rewrite_mentions('@张三') == '@张三'
+
+
+def test_format_chat_log_registers_senders_before_mentions():
+    messages = [{"sender": "张三", "content": "@李四 在吗", "timestamp": "2024-05-01T08:00:00"},
+                {"sender": "李四", "content": "在", "timestamp": "2024-05-01T08:01:00"}]
+    text = format_chat_log(messages, show_timestamp=False, pseudonymizer=Pseudonymizer())
+    assert text == "用户1：@用户2 在吗\n\n用户2：在"
@@ -0,0 +1,53 @@
+# -*- coding: utf-8 -*-
+"""紧凑消息记录：只转换顶层消息，各解码后端的结果一致。"""
+import io
+import json
+
+import pytest
+
+from chat_cleaner import jsonio
+from chat_cleaner.core import format_chat_log
+from chat_cleaner.records import ChatMessage, decode_messages
+
+FIELDS = ('id', 'sender', 'content', 'timestamp')
+
+DOCUMENT = json.dumps([
+    {"id": "1", "sender": "张三", "content": [{"type": "text", "content": "z"}], "timestamp": "2024-05-01T08:00:00Z",
+     "elements": [{"type": "text", "data": {"content": "被丢弃的字段"}}]},
+    {"id": "2", "sender": {"name": "李四", "timestamp": 1}, "content": {"quote": {"content": "引用"}}},
+    {"extra": [{"sender": "不是消息"}]},
+    {"id": "3", "sender": "王五", "content": "普通消息", "timestamp": "2024-05-01T08:01:00Z"},
+], ensure_ascii=False)
+
+
+def _fields(items):
+    return [{key: item.get(key, '<缺失>') for key in FIELDS} for item in items]
+
+
+def test_only_top_level_messages_are_compacted():
+    messages = decode_messages(DOCUMENT)
+    assert [type(message) for message in messages] == [ChatMessage, ChatMessage, dict, ChatMessage]
+    assert messages[0].content == [{"type": "text", "content": "z"}]
+    assert messages[1].sender == {"name": "李四", "timestamp": 1}
+    assert messages[2] == {"extra": [{"sender": "不是消息"}]}
+    assert _fields(messages) == _fields(json.loads(DOCUMENT))
+
+
+def test_single_object_is_compacted():
+    message = decode_messages('{"sender": "a", "content": [{"content": "b"}], "other": 1}')
+    assert message == ChatMessage.from_dict({"sender": "a", "content": [{"content": "b"}]})
+
+
+@pytest.mark.parametrize('backend', jsonio.available_backends(), ids=repr)
+@pytest.mark.parametrize('show_timestamp', [True, False])
+def test_backends_match_stdlib(backend, show_timestamp):
+    expected = json.loads(DOCUMENT)
+    messages = backend.load_messages(DOCUMENT.encode('utf-8'))
+    assert _fields(messages) == _fields(expected)
+    assert format_chat_log(messages, show_timestamp) == format_chat_log(expected, show_timestamp)
+
+
+def test_iter_messages_matches_load_messages():
+    streamed = list(jsonio.iter_messages(io.BytesIO(DOCUMENT.encode('utf-8')), read_size=7))
+    assert _fields(streamed) == _fields(json.loads(DOCUMENT))
+    assert type(streamed[2]) is dict
@@ -0,0 +1,65 @@
+# -*- coding: utf-8 -*-
+"""连续重复消息的折叠：规范化规则、签名预筛选与流式 / 非流式输出一致。"""
+import pytest
+
+from chat_cleaner.core import format_chat_log, format_chat_stream
+from chat_cleaner.core.repeats import RepeatCollapser, _signature, normalize
+
+
+@pytest.mark.parametrize('a, b', [('+1', '＋1！'), ('+1', ' +1 '), ('哈哈哈', '哈哈哈哈哈'), ('OK', 'ok.'), ('？？？', ' ？？？')])
+def test_near_duplicates_normalize_equal(a, b):
+    assert normalize(a) == normalize(b)
+    assert _signature(a) == _signature(b)  # 规范化相同的内容签名也相同，预筛选不会漏掉
+
+
+@pytest.mark.parametrize('a, b', [('+1', '+2'), ('好的', '好'), ('？？？', '！！！'), ('哈哈', '呵呵')])
+def test_different_content_is_kept(a, b):
+    collapser = RepeatCollapser()
+    assert collapser.add(a) is False
+    assert collapser.add(b) is False
+
+
+def test_exact_mode_only_folds_identical_content():
+    collapser = RepeatCollapser(fuzzy=False)
+    assert [collapser.add(c) for c in ['+1', '+1', '＋1', '＋1']] == [False, True, False, True]
+    assert (collapser.collapsed, collapser.runs) == (2, 2)
+
+
+def _messages(contents):
+    return [{"sender": f"用户{i % 3}", "content": content, "timestamp": f"2024-05-01T08:{i:02d}:00Z"}
+            for i, content in enumerate(contents)]
+
+
+MESSAGES = _messages(['开始', '+1', '+1', '＋1！', '中间', '哈哈', '哈哈哈哈', '结束'])
+
+
+def test_runs_are_marked_with_counts():
+    collapser = RepeatCollapser()
+    blocks = format_chat_log(MESSAGES, show_timestamp=False, repeats=collapser).split('\n\n')
+    assert blocks == ['用户0：开始', '用户1：+1 ×3', '用户1：中间', '用户2：哈哈 ×2', '用户1：结束']
+    assert (collapser.collapsed, collapser.runs) == (3, 2)
+
+
+@pytest.mark.parametrize('show_timestamp', [True, False])
+def test_stream_matches_log(show_timestamp):
+    messages = MESSAGES * 3
+    expected = format_chat_log(messages, show_timestamp, repeats=RepeatCollapser())
+    assert ''.join(format_chat_stream(messages, show_timestamp, repeats=RepeatCollapser())) == expected
+
+
+def test_session_break_ends_run():
+    messages = _messages(['+1', '+1', '+1'])
+    text = format_chat_log(messages, show_timestamp=False, repeats=RepeatCollapser(), session_breaks=[2])
+    assert text.split('\n\n') == ['用户0：+1 ×2', '--- 新会话 ---', '用户2：+1']
+
+
+def test_failed_message_is_not_folded():
+    class Broken(dict):
+        def get(self, key, default=None):
+            if key == 'content':
+                raise RuntimeError('broken')
+            return super().get(key, default)
+
+    messages = _messages(['+1', '+1']) + [Broken(id='x', sender='a')] + _messages(['+1'])
+    blocks = format_chat_log(messages, show_timestamp=False, repeats=RepeatCollapser()).split('\n\n')
+    assert blocks[0] == '用户0：+1 ×2' and blocks[1] == '[错误：处理消息 x 失败]' and blocks[2] == '用户0：+1'
@@ -0,0 +1,97 @@
+# -*- coding: utf-8 -*-
+"""results.file_response 的 Range、ETag 与条件请求 (经 install_results 注册的 /results/<文件名>)。"""
+import os
+
+import pytest
+from flask import Flask
+
+from chat_cleaner.results import install_results
+
+BODY = ''.join(f"{i:05d} 消息内容\n" for i in range(2000)).encode('utf-8')
+
+
+@pytest.fixture
+def client(tmp_path):
+    (tmp_path / '导出_formatted.txt').write_bytes(BODY)
+    (tmp_path / '.partial.tmp').write_bytes(b'x')
+    os.mkdir(tmp_path / 'sub')
+    app = Flask(__name__)
+    install_results(app, str(tmp_path))
+    return app.test_client()
+
+
+URL = '/results/导出_formatted.txt'
+
+
+def test_full_download_headers(client):
+    response = client.get(URL)
+    assert response.status_code == 200
+    assert response.data == BODY
+    assert response.headers['Content-Length'] == str(len(BODY))
+    assert response.headers['Accept-Ranges'] == 'bytes'
+    assert response.headers['Content-Type'] == 'text/plain; charset=utf-8'
+    assert "filename*=UTF-8''" in response.headers['Content-Disposition']
+    assert response.headers['ETag'].startswith('"')
+
+
+@pytest.mark.parametrize('header, start, end', [
+    ('bytes=0-99', 0, 100),
+    ('bytes=100-', 100, len(BODY)),
+    ('bytes=-50', len(BODY) - 50, len(BODY)),
+    (f'bytes=10-{len(BODY) * 2}', 10, len(BODY)),
+])
+def test_single_range(client, header, start, end):
+    response = client.get(URL, headers={'Range': header})
+    assert response.status_code == 206
+    assert response.data == BODY[start:end]
+    assert response.headers['Content-Range'] == f'bytes {start}-{end - 1}/{len(BODY)}'
+    assert response.headers['Content-Length'] == str(end - start)
+
+
+def test_unsatisfiable_range(client):
+    response = client.get(URL, headers={'Range': f'bytes={len(BODY) + 10}-'})
+    assert response.status_code == 416
+    assert response.headers['Content-Range'] == f'bytes */{len(BODY)}'
+
+
+def test_multiple_ranges_return_whole_file(client):
+    response = client.get(URL, headers={'Range': 'bytes=0-1,5-6'})
+    assert response.status_code == 200
+    assert response.data == BODY
+
+
+def test_conditional_requests(client):
+    first = client.get(URL)
+    etag, modified = first.headers['ETag'], first.headers['Last-Modified']
+    assert client.get(URL, headers={'If-None-Match': etag}).status_code == 304
+    assert client.get(URL, headers={'If-None-Match': f'W/{etag}'}).status_code == 304
+    assert client.get(URL, headers={'If-None-Match': '"other"'}).status_code == 200
+    assert client.get(URL, headers={'If-Modified-Since': modified}).status_code == 304
+
+
+def test_if_range(client):
+    etag = client.get(URL).headers['ETag']
+    matching = client.get(URL, headers={'Range': 'bytes=0-9', 'If-Range': etag})
+    assert matching.status_code == 206 and matching.data == BODY[:10]
+    changed = client.get(URL, headers={'Range': 'bytes=0-9', 'If-Range': '"stale"'})
+    assert changed.status_code == 200 and changed.data == BODY
+
+
+def test_etag_changes_when_file_is_replaced(client, tmp_path):
+    etag = client.get(URL).headers['ETag']
+    replacement = tmp_path / 'new.txt'
+    replacement.write_bytes(BODY + b'more')
+    os.replace(replacement, tmp_path / '导出_formatted.txt')
+    assert client.get(URL, headers={'If-None-Match': etag}).status_code == 200
+
+
+def test_head_has_headers_but_no_body(client):
+    response = client.head(URL, headers={'Range': 'bytes=0-9'})
+    assert response.status_code == 206
+    assert response.headers['Content-Length'] == '10'
+    assert response.data == b''
+
+
+@pytest.mark.parametrize('name', ['.partial.tmp', 'sub', 'missing.txt'])
+def test_hidden_missing_and_directories_are_404(client, name):
+    assert client.get(f'/results/{name}').status_code == 404
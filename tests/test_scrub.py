@@ -0,0 +1,51 @@
+# -*- coding: utf-8 -*-
+"""清理规则的校验与组合正则的替换结果。"""
+import pytest
+
+from chat_cleaner.core.scrub import QQ_RULES, Scrubber, build_scrubber
+
+
+@pytest.mark.parametrize('rules', [
+    ["not a dict"],
+    [{"name": "a", "literal": "x"}, {"name": "a", "literal": "y"}],
+    [{"literal": "x", "pattern": "y"}],
+    [{"replace": "x"}],
+    [{"literal": ""}],
+    [{"pattern": "x", "flags": "i"}],
+    [{"pattern": "("}],
+    [{"pattern": "a*"}],
+    [{"pattern": r"(\w)\1"}],
+    [{"pattern": r"(a)?(?(1)b|c)"}],
+    [{"name": "a", "pattern": "(?P<g>x)"}, {"name": "b", "pattern": "(?P<g>y)"}],
+], ids=['not-dict', 'duplicate-name', 'both-kinds', 'neither-kind', 'empty-literal', 'unknown-key',
+        'bad-regex', 'matches-empty', 'numbered-backref', 'numbered-conditional', 'duplicate-group-name'])
+def test_invalid_rules_raise_value_error(rules):
+    with pytest.raises(ValueError):
+        Scrubber(rules)
+
+
+def test_named_backreference_survives_combining():
+    scrubber = Scrubber([{"name": "double", "pattern": r"(?P<c>\w)(?P=c)", "replace": "#"},
+                         {"name": "ab", "literal": "ab", "replace": "!"}])
+    assert scrubber.scrub('aab xyy ab') == '#b x# !'
+    assert scrubber.hit_counts() == {'double': 2, 'ab': 1}
+
+
+def test_escaped_backslash_and_class_are_not_backreferences():
+    scrubber = Scrubber([{"name": "slash", "pattern": r"\\1"}, {"name": "octal", "pattern": r"[\1]x"}])
+    assert scrubber.scrub('a\\1b \x01x') == 'ab '
+
+
+def test_regex_rules_take_precedence_and_longest_literal_wins():
+    scrubber = Scrubber([{"name": "url", "pattern": r"https?://\S+", "replace": "[链接]"},
+                         {"name": "short", "literal": "表情", "replace": "1"},
+                         {"name": "long", "literal": "表情包", "replace": "2"}])
+    assert scrubber.scrub('看 https://表情包.cn 表情包 表情') == '看 [链接] 2 1'
+
+
+def test_ignorecase_rules_and_default_rules():
+    scrubber = build_scrubber([{"name": "hi", "literal": "HELLO", "replace": "hi", "ignorecase": True}])
+    assert scrubber.scrub('hello [图片] 路径: C:/a.png') == 'hi [图片]'
+    assert scrubber.names == [rule['name'] for rule in QQ_RULES] + ['hi']
+    scrubber.reset_counts()
+    assert set(scrubber.hit_counts().values()) == {0}
@@ -0,0 +1,34 @@
+# -*- coding: utf-8 -*-
+"""预压缩首页的编码协商与 ETag。"""
+import gzip
+
+import pytest
+from flask import Flask
+
+from chat_cleaner.static_page import StaticPage
+
+HTML = '<html><body>' + '聊天记录清理' * 200 + '</body></html>'
+
+
+@pytest.fixture
+def client():
+    app = Flask(__name__)
+    app.add_url_rule('/', 'index', StaticPage(HTML).response)
+    return app.test_client()
+
+
+def test_gzip_variant(client):
+    response = client.get('/', headers={'Accept-Encoding': 'gzip'})
+    assert response.headers['Content-Encoding'] == 'gzip'
+    assert gzip.decompress(response.data).decode('utf-8') == HTML
+    assert response.headers['Vary'] == 'Accept-Encoding'
+
+
+def test_etag_only_matches_selected_encoding(client):
+    gzip_etag = client.get('/', headers={'Accept-Encoding': 'gzip'}).headers['ETag']
+    identity_etag = client.get('/', headers={'Accept-Encoding': 'identity'}).headers['ETag']
+    assert gzip_etag != identity_etag
+    assert client.get('/', headers={'Accept-Encoding': 'gzip', 'If-None-Match': gzip_etag}).status_code == 304
+    assert client.get('/', headers={'Accept-Encoding': 'gzip', 'If-None-Match': f'W/{gzip_etag}'}).status_code == 304
+    response = client.get('/', headers={'Accept-Encoding': 'identity', 'If-None-Match': gzip_etag})
+    assert response.status_code == 200 and response.data.decode('utf-8') == HTML
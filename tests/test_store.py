@@ -0,0 +1,97 @@
+# -*- coding: utf-8 -*-
+"""结果存储的过期、容量上限、权限与默认关闭。"""
+import os
+import stat
+
+import pytest
+from flask import Flask
+
+from chat_cleaner import store
+from chat_cleaner.store import ResultStore, install_store
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    """可以手动拨动的 time.time()。"""
+    now = [1_700_000_000.0]
+    monkeypatch.setattr(store.time, 'time', lambda: now[0])
+    return now
+
+
+def test_get_expires_after_ttl(tmp_path, clock):
+    results = ResultStore(str(tmp_path / 'store'), ttl=60)
+    entry = results.put(b'formatted', 'a.txt')
+    assert results.get(entry['id'])['filename'] == 'a.txt'
+    clock[0] += 59
+    assert results.get(entry['id']) is not None
+    clock[0] += 2
+    assert results.get(entry['id']) is None
+    assert os.path.exists(results.path(entry['id']))
+    assert results.sweep() == (1, len(b'formatted'))
+    assert not os.path.exists(results.path(entry['id']))
+    assert results.usage() == (0, 0)
+
+
+def test_quota_evicts_least_recently_accessed(tmp_path, clock):
+    results = ResultStore(str(tmp_path / 'store'), ttl=3600, quota=250)
+    first = results.put(b'a' * 100, 'first.txt')
+    clock[0] += 1
+    second = results.put(b'b' * 100, 'second.txt')
+    clock[0] += 1
+    results.get(first['id'])  # first 最近被访问过
+    clock[0] += 1
+    third = results.put(b'c' * 100, 'third.txt')
+    assert results.get(second['id']) is None
+    assert results.get(first['id']) is not None and results.get(third['id']) is not None
+    assert results.put(b'x' * 300, 'too-big.txt') is None
+
+
+def test_files_are_private(tmp_path):
+    results = ResultStore(str(tmp_path / 'store'))
+    entry = results.put(b'secret', 'a.txt')
+    assert stat.S_IMODE(os.stat(results.directory).st_mode) == 0o700
+    assert stat.S_IMODE(os.stat(results.path(entry['id'])).st_mode) == 0o600
+    assert stat.S_IMODE(os.stat(results.index_path).st_mode) == 0o600
+    assert len(entry['id']) >= 22
+
+
+def test_lookup_requires_dedup(tmp_path):
+    private = ResultStore(str(tmp_path / 'private'))
+    private.put(b'x', 'a.txt', key='k')
+    assert private.lookup('k') is None
+    shared = ResultStore(str(tmp_path / 'shared'), dedup=True)
+    entry = shared.put(b'x', 'a.txt', key='k')
+    assert shared.lookup('k')['id'] == entry['id']
+
+
+def test_aborted_writer_leaves_nothing(tmp_path):
+    results = ResultStore(str(tmp_path / 'store'))
+    writer = results.writer('a.txt')
+    writer.write(b'partial')
+    writer.abort()
+    assert [name for name in os.listdir(results.directory) if not name.startswith('index.sqlite3')] == []
+    assert results.get(writer.id) is None
+
+
+def test_install_store_is_opt_in(tmp_path, monkeypatch):
+    for name in (store.DIR_ENV, store.TTL_ENV, store.DEDUP_ENV):
+        monkeypatch.delenv(name, raising=False)
+    assert install_store(Flask('off')) is None
+    monkeypatch.setenv(store.DIR_ENV, str(tmp_path / 'store'))
+    monkeypatch.setenv(store.TTL_ENV, '0')
+    assert install_store(Flask('disabled')) is None
+    monkeypatch.setenv(store.TTL_ENV, '120')
+    app = Flask('on')
+    results = install_store(app)
+    assert results.ttl == 120 and not results.dedup
+    entry = results.put('结果'.encode('utf-8'), '导出_formatted.txt')
+    client = app.test_client()
+    response = client.get(f"/r/{entry['id']}")
+    assert response.status_code == 200 and response.data == '结果'.encode('utf-8')
+    assert response.headers['X-Result-Link'] == f"/r/{entry['id']}"
+    assert client.get('/r/doesnotexist').status_code == 404
+
+
+def test_result_key_depends_on_options():
+    assert store.result_key(b'x', show_timestamp=True) == store.result_key(b'x', show_timestamp=True)
+    assert store.result_key(b'x', show_timestamp=True) != store.result_key(b'x', show_timestamp=False)
@@ -0,0 +1,75 @@
+# -*- coding: utf-8 -*-
+"""目标时区：时区名解析、按偏移不变区间缓存的换算与 datetime 范围两端。"""
+import random
+from datetime import datetime, timedelta, timezone
+from zoneinfo import ZoneInfo
+
+import pytest
+
+from chat_cleaner.core import format_chat_log
+from chat_cleaner.core.timezones import TargetTimezone, parse_timezone
+
+
+@pytest.mark.parametrize('spec, offset', [
+    ('UTC', 0), ('z', 0), ('+08:00', 8 * 60), ('-0530', -(5 * 60 + 30)), ('UTC+8', 8 * 60), ('GMT-3', -3 * 60),
+])
+def test_fixed_offsets(spec, offset):
+    assert parse_timezone(spec).utcoffset(None) == timedelta(minutes=offset)
+
+
+@pytest.mark.parametrize('spec', ['+24:00', 'Mars/Olympus', '../etc/passwd', ''])
+def test_unknown_timezones_are_rejected(spec):
+    with pytest.raises(ValueError):
+        parse_timezone(spec)
+
+
+def test_interval_edges_are_the_dst_transitions():
+    target = TargetTimezone('America/New_York')
+    switch = datetime(2024, 3, 10, 7, tzinfo=timezone.utc).timestamp()
+    start, end, offset = target.interval(switch - 1)
+    assert end == switch and offset == timedelta(hours=-5)
+    assert start == datetime(2023, 11, 5, 6, tzinfo=timezone.utc).timestamp()
+    assert target.interval(switch)[2] == timedelta(hours=-4)
+
+
+@pytest.mark.parametrize('name', ['America/New_York', 'Europe/London', 'Australia/Lord_Howe', 'Asia/Shanghai'])
+def test_convert_matches_astimezone(name):
+    target = TargetTimezone(name)
+    zone = ZoneInfo(name)
+    sources = [timezone.utc, timezone(timedelta(hours=8)), timezone(timedelta(hours=-3, minutes=-30))]
+    rng = random.Random(name)
+    base = datetime(2020, 1, 1, tzinfo=timezone.utc).timestamp()
+    times = sorted(base + rng.randrange(5 * 365 * 86400) for _ in range(3000))
+    for ts in times:
+        dt = datetime.fromtimestamp(ts, rng.choice(sources))
+        assert target.convert(dt) == dt.astimezone(zone).replace(tzinfo=None), dt
+    assert target.lookups < 60  # 按时间排序的记录只在跨过切换点时查找
+
+
+def test_naive_timestamps_are_unchanged():
+    dt = datetime(2024, 5, 1, 8)
+    assert TargetTimezone('Asia/Tokyo').convert(dt) is dt
+
+
+def _outcome(function):
+    try:
+        return function()
+    except OverflowError:
+        return OverflowError
+
+
+@pytest.mark.parametrize('ts', ['0001-01-01T00:30:00Z', '9999-12-31T23:30:00Z'])
+@pytest.mark.parametrize('name', ['America/New_York', 'Asia/Shanghai', '+08:00'])
+def test_ends_of_datetime_range_behave_like_astimezone(ts, name):
+    # 换算结果超出 datetime 范围时与 astimezone 一样抛出 OverflowError，不会死循环或得到错误的时间
+    dt = datetime.fromisoformat(ts.replace('Z', '+00:00'))
+    expected = _outcome(lambda: dt.astimezone(parse_timezone(name)).replace(tzinfo=None))
+    assert _outcome(lambda: TargetTimezone(name).convert(dt)) == expected
+
+
+def test_formatter_outputs_target_time():
+    messages = [{"sender": "张三", "content": "早", "timestamp": "2024-03-10T06:30:00Z"},
+                {"sender": "李四", "content": "早", "timestamp": "2024-03-10T07:30:00Z"},
+                {"sender": "王五", "content": "没有时区", "timestamp": "2024-03-10T07:30:00"}]
+    assert format_chat_log(messages, target_timezone=TargetTimezone('America/New_York')).split('\n\n') == [
+        "2024-03-10T01:30:00\n张三：早", "2024-03-10T03:30:00\n李四：早", "2024-03-10T07:30:00\n王五：没有时区"]
@@ -0,0 +1,96 @@
+# -*- coding: utf-8 -*-
+"""分阶段计时：每个版本的处理路由都写出 Server-Timing 响应头；tracemalloc 的各阶段内存统计。"""
+import io
+import json
+import tracemalloc
+
+import pytest
+from flask import Flask
+
+from chat_cleaner.apps import load_module
+from chat_cleaner.timing import current_timer, install_timing
+
+CHAT = json.dumps([{"sender": "张三", "content": "你好", "timestamp": "2024-05-01T08:00:00Z"}],
+                  ensure_ascii=False).encode('utf-8')
+GEMINI = json.dumps({"chunkedPrompt": {"chunks": [{"role": "user", "text": "**你好**"}]}}).encode('utf-8')
+
+# 版本名 -> (路由, 上传字段, 文件名, 内容)
+UPLOADS = {
+    '0.9': ('/process', 'inputFile', 'a.txt', '2024-05-01 08:00:00 张三\n你好\n'.encode('utf-8')),
+    '1.0': ('/format', 'jsonFile', 'a.json', CHAT),
+    '1.1': ('/format', 'jsonFile', 'a.json', CHAT),
+    'turbo': ('/format', 'jsonFile', 'a.json', CHAT),
+    'gemini': ('/', 'file', 'a.txt', GEMINI),
+}
+
+
+def _stages(header):
+    return [part.split(';', 1)[0] for part in header.split(', ')]
+
+
+@pytest.mark.parametrize('name', sorted(UPLOADS))
+def test_every_app_reports_stage_timing(name):
+    route, field, filename, payload = UPLOADS[name]
+    client = load_module(name).app.test_client()
+    with client.post(route, data={field: (io.BytesIO(payload), filename)},
+                     content_type='multipart/form-data') as response:
+        assert response.status_code == 200
+        stages = _stages(response.headers['Server-Timing'])
+    assert {'read', 'format', 'total'} <= set(stages)
+    assert stages[-1] == 'total'
+
+
+MB = 1024 * 1024
+
+
+def _memory_app(trace_memory):
+    app = Flask(__name__)
+    install_timing(app, trace_memory=trace_memory)
+
+    @app.route('/work')
+    def work():
+        timer = current_timer()
+        with timer.stage('keep'):
+            kept = bytearray(2 * MB)
+        with timer.stage('temporary'):
+            temporary = bytearray(4 * MB)
+            del temporary
+        return str(len(kept))
+
+    return app
+
+
+@pytest.fixture
+def tracing():
+    started = not tracemalloc.is_tracing()
+    yield
+    if started:
+        tracemalloc.stop()  # 不让后面的测试一直带着 tracemalloc 运行
+
+
+def _memory_header(header):
+    fields = {}
+    for part in header.split(', '):
+        name, *values = part.split(';')
+        fields[name] = {key: int(value) for key, value in (item.split('=') for item in values)}
+    return fields
+
+
+def test_memory_per_stage(tracing, capsys):
+    client = _memory_app(True).test_client()
+    with client.get('/work') as response:
+        memory = _memory_header(response.headers['X-Memory-Usage'])
+    assert abs(memory['keep']['delta'] - 2 * MB) < MB // 4
+    assert memory['temporary']['peak'] >= 4 * MB and abs(memory['temporary']['delta']) < MB // 4
+    assert memory['request']['peak'] >= 6 * MB  # 请求内的峰值包括 keep 阶段留下的内存
+    logged = [line for line in capsys.readouterr().out.splitlines() if line.startswith('[memory] ')]
+    assert len(logged) == 1
+    line = json.loads(logged[0][len('[memory] '):])
+    assert line['route'] == '/work' and set(line['stages']) == {'keep', 'temporary'}
+
+
+def test_no_memory_header_without_tracing():
+    assert not tracemalloc.is_tracing()
+    with _memory_app(False).test_client().get('/work') as response:
+        assert 'X-Memory-Usage' not in response.headers
+        assert _stages(response.headers['Server-Timing']) == ['keep', 'temporary', 'total']
@@ -0,0 +1,138 @@
+# -*- coding: utf-8 -*-
+"""分块上传的结果流：中途出错的标记与未读取的响应的清理。"""
+import json
+import os
+import threading
+import zlib
+
+import pytest
+from flask import Flask
+
+from chat_cleaner.core import format_chat_stream
+from chat_cleaner.store import ResultStore
+from chat_cleaner.uploads import STREAM_ERROR_MARKER, install_uploads
+
+CHUNK = 64 * 1024
+
+
+def _export(count):
+    return json.dumps([{"id": str(i), "sender": f"用户{i % 5}", "content": f"第 {i} 条消息",
+                        "timestamp": "2024-05-01T08:00:00+08:00"} for i in range(count)],
+                      ensure_ascii=False).encode('utf-8')
+
+
+@pytest.fixture
+def app(tmp_path):
+    app = Flask(__name__)
+    app.store = ResultStore(str(tmp_path / 'store'))
+    install_uploads(app, format_chat_stream, directory=str(tmp_path / 'uploads'), store=app.store)
+    return app
+
+
+def _upload(client, payload):
+    info = client.post('/uploads', json={'filename': 'a.json', 'size': len(payload), 'chunkSize': CHUNK}).get_json()
+    size = info['chunkSize']
+    for index in range(info['chunks']):
+        chunk = payload[index * size:(index + 1) * size]
+        response = client.put(f"/uploads/{info['id']}/{index}", data=chunk,
+                              headers={'X-Chunk-CRC32': format(zlib.crc32(chunk), 'x')})
+        assert response.status_code == 200
+    return info
+
+
+def _temporary_results(app):
+    return [name for name in os.listdir(app.store.directory) if name.endswith('.tmp')]
+
+
+def test_complete_stream_is_saved(app):
+    client = app.test_client()
+    info = _upload(client, _export(3000))
+    response = client.get(f"/uploads/{info['id']}/result")
+    assert response.status_code == 200
+    assert STREAM_ERROR_MARKER.encode('utf-8') not in response.data
+    link = response.headers['X-Result-Link']
+    assert client.application.store.get(link.rsplit('/', 1)[1])['size'] == len(response.data)
+
+
+def test_error_after_first_message_ends_with_marker(app):
+    payload = _export(3000)
+    middle = payload.index(b'{"id": "2000"')
+    payload = payload[:middle] + b'!!' + payload[middle + 2:]
+    client = app.test_client()
+    info = _upload(client, payload)
+    response = client.get(f"/uploads/{info['id']}/result")
+    assert response.status_code == 200
+    last_line = response.data.decode('utf-8').rstrip('\n').rsplit('\n', 1)[-1]
+    assert last_line.startswith(STREAM_ERROR_MARKER) and last_line.endswith(']')
+    assert _temporary_results(app) == []
+    assert app.store.usage() == (0, 0)
+
+
+def test_error_before_first_message_is_400(app):
+    client = app.test_client()
+    info = _upload(client, b'{"not": "an array"}')
+    assert client.get(f"/uploads/{info['id']}/result").status_code == 400
+
+
+def test_unread_response_releases_writer(app):
+    client = app.test_client()
+    info = _upload(client, _export(100))
+    with app.test_request_context(f"/uploads/{info['id']}/result"):
+        response = app.full_dispatch_request()
+        assert len(_temporary_results(app)) == 1
+        response.close()
+    assert _temporary_results(app) == []
+
+
+def test_spool_is_private(tmp_path):
+    directory = tmp_path / 'shared'
+    directory.mkdir(mode=0o755)
+    os.chmod(directory, 0o755)
+    app = Flask(__name__)
+    install_uploads(app, format_chat_stream, directory=str(directory))
+    assert os.stat(directory).st_mode & 0o777 == 0o700
+    info = app.test_client().post('/uploads', json={'filename': 'a.json', 'size': 10}).get_json()
+    for suffix in ('.json', '.part', '.chunks'):
+        assert os.stat(directory / (info['id'] + suffix)).st_mode & 0o777 == 0o600
+
+
+def test_spool_owned_by_someone_else_is_refused(tmp_path, monkeypatch):
+    monkeypatch.setattr(os, 'getuid', lambda: os.stat(tmp_path).st_uid + 1)
+    with pytest.raises(PermissionError):
+        install_uploads(Flask(__name__), format_chat_stream, directory=str(tmp_path / 'uploads'))
+
+
+@pytest.mark.parametrize('chunk_size', ['abc', [1], {'a': 1}])
+def test_invalid_chunk_size_is_400(app, chunk_size):
+    response = app.test_client().post('/uploads', json={'filename': 'a.json', 'size': 10, 'chunkSize': chunk_size})
+    assert response.status_code == 400
+    assert 'chunkSize' in response.get_json()['error']
+
+
+def _delete_later(client, upload_id):
+    timer = threading.Timer(0.3, lambda: client.delete(f"/uploads/{upload_id}"))
+    timer.start()
+    return timer
+
+
+def test_upload_deleted_while_streaming_ends_with_marker(app):
+    client = app.test_client()
+    payload = _export(20000)
+    info = client.post('/uploads', json={'filename': 'a.json', 'size': len(payload), 'chunkSize': CHUNK}).get_json()
+    assert info['chunks'] > 1
+    client.put(f"/uploads/{info['id']}/0", data=payload[:CHUNK])
+    timer = _delete_later(app.test_client(), info['id'])
+    response = client.get(f"/uploads/{info['id']}/result")
+    timer.join()
+    assert response.status_code == 200
+    assert response.data.decode('utf-8').rstrip('\n').rsplit('\n', 1)[-1].startswith(STREAM_ERROR_MARKER)
+    assert _temporary_results(app) == []
+
+
+def test_upload_deleted_before_first_message_is_404(app):
+    client = app.test_client()
+    info = client.post('/uploads', json={'filename': 'a.json', 'size': 100}).get_json()
+    timer = _delete_later(app.test_client(), info['id'])
+    response = client.get(f"/uploads/{info['id']}/result")
+    timer.join()
+    assert response.status_code == 404
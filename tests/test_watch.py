@@ -0,0 +1,73 @@
+# -*- coding: utf-8 -*-
+"""监视进程的输出目录检查与工作进程异常退出后的恢复。"""
+import os
+import time
+
+import pytest
+
+from chat_cleaner import watch
+from chat_cleaner.convert import _write_atomic, convert_file
+from chat_cleaner.watch import WatchDaemon
+
+
+def _crashing_convert(src, dst, *args):
+    """名字里带 crash 的文件让工作进程直接退出，模拟内存不足被杀。"""
+    if 'crash' in os.path.basename(src):
+        os._exit(1)
+    return convert_file(src, dst, *args)
+
+
+def _crash_while_writing_convert(src, dst, *args):
+    """第一次转换 slow 时停在写临时文件的中途；crash 等到这时才退出，slow 的进程随进程池一起被杀死。"""
+    marker = os.path.join(os.path.dirname(src), 'writing')
+    if 'slow' in os.path.basename(src) and not os.path.exists(marker):
+        _write_atomic(dst, lambda f: (f.write(b'x'), f.flush(), open(marker, 'w').close(), time.sleep(60)))
+    if 'crash' in os.path.basename(src):
+        while not os.path.exists(marker):
+            time.sleep(0.01)
+        os._exit(1)
+    return convert_file(src, dst, *args)
+
+
+@pytest.mark.parametrize('output', ['.', '..', './'])
+def test_output_containing_input_is_rejected(tmp_path, output):
+    input_dir = tmp_path / 'in'
+    input_dir.mkdir()
+    with pytest.raises(ValueError):
+        WatchDaemon(str(input_dir), os.path.join(str(input_dir), output), watcher='poll')
+
+
+def test_output_inside_input_is_allowed(tmp_path):
+    input_dir = tmp_path / 'in'
+    input_dir.mkdir()
+    daemon = WatchDaemon(str(input_dir), str(input_dir / 'formatted'), watcher='poll')
+    try:
+        assert daemon._is_output(str(input_dir / 'formatted' / 'a_formatted.txt'))
+        assert not daemon._is_output(str(input_dir / 'formatted-old' / 'a.json'))
+        assert daemon.destination(str(input_dir / 'a.json')) == str(input_dir / 'formatted' / 'a_formatted.txt')
+    finally:
+        daemon.watcher.close()
+
+
+def test_worker_crash_recreates_pool_and_retries_other_files(tmp_path, monkeypatch):
+    monkeypatch.setattr(watch, 'convert_file', _crashing_convert)
+    input_dir = tmp_path / 'in'
+    input_dir.mkdir()
+    for name in ('a', 'crash', 'b', 'c'):
+        (input_dir / f'{name}.json').write_text('[{"sender": "张三", "content": "你好"}]', encoding='utf-8')
+    daemon = WatchDaemon(str(input_dir), str(tmp_path / 'out'), workers=2, debounce=0, watcher='poll')
+    converted, failed = daemon.run(stop_after=4)
+    assert (converted, failed) == (3, 1)
+    assert sorted(os.listdir(tmp_path / 'out')) == ['a_formatted.txt', 'b_formatted.txt', 'c_formatted.txt']
+
+
+def test_partial_output_of_killed_worker_is_removed(tmp_path, monkeypatch):
+    monkeypatch.setattr(watch, 'convert_file', _crash_while_writing_convert)
+    input_dir = tmp_path / 'in'
+    input_dir.mkdir()
+    for name in ('slow', 'crash'):
+        (input_dir / f'{name}.json').write_text('[{"sender": "张三", "content": "你好"}]', encoding='utf-8')
+    daemon = WatchDaemon(str(input_dir), str(tmp_path / 'out'), workers=2, debounce=0, watcher='poll')
+    converted, failed = daemon.run(stop_after=3)
+    assert (converted, failed) == (1, 1)
+    assert os.listdir(tmp_path / 'out') == ['slow_formatted.txt']